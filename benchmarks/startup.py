@@ -0,0 +1,105 @@
+"""
+Startup-time benchmark of the `pyvem` CLI.
+
+Runs `pyvem env-path` in a throwaway venv project (with a throwaway HOME so
+the real pyvem data dir is left alone), measures its wall-clock time and checks
+that neither the container stack nor other modules only some commands need
+were imported.
+
+Usage:
+    python benchmarks/startup.py [--runs N]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+# modules pulled in only by `pyvem container ...`
+CONTAINER_STACK = {"docker", "podman", "pexpect", "tqdm"}
+# modules pulled in only by `list`, `freeze`, reconciling and async commands
+LAZY_MODULES = CONTAINER_STACK | {"asyncio", "packaging"}
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def _pyvem_cmd(*args: str) -> list[str]:
+    return [sys.executable, *args, "-m", "pyvem.cli.main", "env-path"]
+
+
+def _env(home: Path) -> dict[str, str]:
+    env = dict(os.environ)
+    env["HOME"] = str(home)
+    env["PYTHONPATH"] = os.pathsep.join(
+        filter(None, [str(REPO_ROOT), env.get("PYTHONPATH")])
+    )
+    return env
+
+
+def imported_top_level_modules(project: Path, env: dict[str, str]) -> set[str]:
+    result = subprocess.run(
+        _pyvem_cmd("-X", "importtime"),
+        cwd=project,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+
+        module = line.rsplit("|", 1)[-1].strip()
+        modules.add(module.split(".")[0])
+
+    return modules
+
+
+def measure(project: Path, env: dict[str, str], runs: int) -> list[float]:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            _pyvem_cmd(), cwd=project, env=env, capture_output=True, check=True
+        )
+        timings.append(time.perf_counter() - start)
+
+    return timings
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20, help="Number of runs")
+    args = parser.parse_args()
+
+    with TemporaryDirectory() as tmp:
+        home = Path(tmp) / "home"
+        project = Path(tmp) / "project"
+        home.mkdir()
+        project.mkdir()
+        (project / "setup.py").write_text("")
+        env = _env(home)
+
+        leaked = LAZY_MODULES & imported_top_level_modules(project, env)
+        timings = measure(project, env, args.runs)
+
+    print(f"pyvem env-path, {args.runs} runs:")
+    print(f"  min:    {min(timings) * 1000:.1f} ms")
+    print(f"  median: {statistics.median(timings) * 1000:.1f} ms")
+    print(f"  max:    {max(timings) * 1000:.1f} ms")
+
+    if leaked:
+        print(f"FAIL: imported at startup: {', '.join(sorted(leaked))}")
+        return 1
+
+    print("OK: neither the container stack nor lazy modules were imported")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""
+Creation-time benchmark of venv environments.
+
+Compares `venv.create(..., with_pip=True)`, which pyvem used to run for every
+new environment, with cloning the environment from a template (with and without
+pip). Templates are built before timing starts, in a throwaway pyvem dir.
+
+Usage:
+    python benchmarks/venv_creation.py [--runs N]
+"""
+
+import argparse
+import statistics
+import sys
+import time
+import venv
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Callable
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from pyvem.templates import VenvTemplates  # noqa: E402
+
+
+def measure(create: Callable[[Path], None], workdir: Path, runs: int) -> list[float]:
+    timings = []
+    for run in range(runs):
+        target = workdir / f"env-{run}"
+        start = time.perf_counter()
+        create(target)
+        timings.append(time.perf_counter() - start)
+
+    return timings
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="Number of runs")
+    args = parser.parse_args()
+
+    results = {}
+    with TemporaryDirectory() as tmp:
+        pyvem_dir = Path(tmp) / "pyvem"
+        with_pip = VenvTemplates(pyvem_dir)
+        without_pip = VenvTemplates(pyvem_dir, with_pip=False)
+        with_pip.get()
+        without_pip.get()
+
+        methods = {
+            "venv.create(with_pip=True)": lambda target: venv.create(
+                str(target), with_pip=True
+            ),
+            "template clone": with_pip.clone,
+            "template clone, no pip": without_pip.clone,
+        }
+        for index, (name, create) in enumerate(methods.items()):
+            workdir = Path(tmp) / str(index)
+            workdir.mkdir()
+            results[name] = measure(create, workdir, args.runs)
+
+    print(f"venv creation, {args.runs} runs:")
+    baseline = statistics.median(results["venv.create(with_pip=True)"])
+    for name, timings in results.items():
+        median = statistics.median(timings)
+        print(
+            f"  {name:<28} median {median * 1000:8.1f} ms"
+            f"  min {min(timings) * 1000:8.1f} ms  ({baseline / median:.1f}x)"
+        )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -17,6 +17,7 @@ Requires:       python3-tqdm
 Requires:       python3-podman
 Requires:       python3-docker
 Requires:       python3-pexpect
+Requires:       python3-packaging
 Requires:       python3-pip
 
 
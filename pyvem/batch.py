@@ -0,0 +1,247 @@
+"""
+Run one action over many projects at once, each project in its own process.
+"""
+
+import glob
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Optional, TextIO
+
+from pyvem.config import Config
+from pyvem.constants import FAILURE, SUCCESS, BatchActionEnum
+from pyvem.exceptions import PyVemException
+from pyvem.inventory import freeze_lines
+from pyvem.registry import ProjectRegistry
+from pyvem.spells import format_table
+from pyvem.ve_tools.base import VirtualEnvironment
+from pyvem.ve_tools.detect import get_venv_instance
+
+
+@dataclass
+class BatchResult:
+    project_path: Path
+    retval: int
+    duration: float
+    venv_type: Optional[str] = None
+
+
+class _PrefixedWriter:
+    """
+    Text stream prepending prefix to each line, written whole so lines of
+    projects running in parallel don't get mixed.
+    """
+
+    def __init__(self, prefix: str, stream: TextIO) -> None:
+        self.prefix = prefix
+        self.stream = stream
+        self._partial_line = ""
+
+    def write(self, text: str) -> int:
+        lines = (self._partial_line + text).split("\n")
+        self._partial_line = lines.pop()
+        if lines:
+            self.stream.write("".join(f"{self.prefix}{line}\n" for line in lines))
+            self.stream.flush()
+
+        return len(text)
+
+    def flush(self) -> None:
+        self.stream.flush()
+
+    def finish(self) -> None:
+        """
+        Write out the last line even if it isn't terminated by newline.
+        """
+        if self._partial_line:
+            self.stream.write(f"{self.prefix}{self._partial_line}\n")
+            self._partial_line = ""
+
+        self.stream.flush()
+
+    def isatty(self) -> bool:
+        return False
+
+
+def _run_action(
+    venv: VirtualEnvironment,
+    action: BatchActionEnum,
+    dev: bool,
+    command: list[str],
+) -> int:
+    if action == BatchActionEnum.install:
+        return venv.install(dev)
+
+    if action == BatchActionEnum.update:
+        return venv.update_deps(dev)
+
+    if action == BatchActionEnum.delete:
+        return venv.delete()
+
+    if action == BatchActionEnum.info:
+        print(venv.info())
+        return SUCCESS
+
+    if action == BatchActionEnum.freeze:
+        for line in freeze_lines(venv.installed_distributions()):
+            print(line)
+
+        return SUCCESS
+
+    return venv.run(command)
+
+
+def project_labels(projects: list[Path]) -> dict[Path, str]:
+    """
+    Unique short names of the projects for prefixing their output, paths
+    relative to the deepest directory containing all of them.
+    """
+    if not projects:
+        return {}
+
+    root = Path(os.path.commonpath([project.parent for project in projects]))
+    return {project: str(project.relative_to(root)) for project in projects}
+
+
+def run_project(
+    project_path: Path,
+    action: BatchActionEnum,
+    dev: bool,
+    command: list[str],
+    label: Optional[str] = None,
+) -> BatchResult:
+    """
+    Run the action on one project, meant to run in a worker process since it
+    redirects stdout and stderr of the process to prefixed writers.
+
+    Args:
+        label: Prefix of the output lines, defaults to the project path.
+    """
+    prefix = f"[{label or project_path}] "
+    stdout = _PrefixedWriter(prefix, sys.__stdout__)
+    stderr = _PrefixedWriter(prefix, sys.__stderr__)
+    sys.stdout, sys.stderr = stdout, stderr  # type: ignore[assignment]
+    start = time.monotonic()
+    venv_type = None
+    try:
+        venv = get_venv_instance(project_path)
+        venv_type = venv.venv_type.value
+        retval = _run_action(venv, action, dev, command)
+    except PyVemException as exc:
+        print(str(exc), file=sys.stderr)
+        retval = FAILURE
+    except Exception:
+        traceback.print_exc()
+        retval = FAILURE
+    finally:
+        stdout.finish()
+        stderr.finish()
+
+    return BatchResult(
+        project_path=project_path,
+        retval=retval,
+        duration=time.monotonic() - start,
+        venv_type=venv_type,
+    )
+
+
+def resolve_projects(
+    patterns: Iterable[str], all_registered: bool, config: Optional[Config] = None
+) -> list[Path]:
+    """
+    Turn paths and glob patterns of projects into unique absolute paths of
+    existing directories, optionally together with all the registered projects.
+    """
+    projects: dict[Path, None] = {}
+    for pattern in patterns:
+        matches = glob.glob(pattern) if glob.has_magic(pattern) else [pattern]
+        for match in sorted(matches):
+            path = Path(match).resolve()
+            if path.is_dir():
+                projects[path] = None
+
+    if all_registered:
+        config = config or Config.get_config()
+        registry = ProjectRegistry(config.path_to_pyvem_dir)
+        for record in registry.all():
+            if record.project_path.is_dir():
+                projects[record.project_path] = None
+
+        # connection must not be inherited by the worker processes
+        registry.close()
+
+    return list(projects)
+
+
+def run_batch(
+    projects: list[Path],
+    action: BatchActionEnum,
+    jobs: Optional[int] = None,
+    dev: bool = False,
+    command: Optional[list[str]] = None,
+    fail_fast: bool = False,
+) -> list[BatchResult]:
+    """
+    Run the action on each project in a pool of worker processes.
+
+    Args:
+        projects: Absolute paths to the projects.
+        action: What to do with each project.
+        jobs: Maximum number of projects processed at once, defaults to the
+            number of CPUs.
+        dev: Install also development dependencies.
+        command: Command for the run action.
+        fail_fast: Don't start any other project once one fails. Projects
+            already running are finished.
+
+    Returns:
+        Results of the projects which were run, in the order they finished.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    labels = project_labels(projects)
+    pending = list(reversed(projects))
+    results = []
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        # projects are submitted only when a worker is free, so with fail_fast
+        # nothing new is started after a failure
+        running: set[Future[BatchResult]] = set()
+        while pending or running:
+            while pending and len(running) < jobs:
+                project = pending.pop()
+                running.add(
+                    executor.submit(
+                        run_project,
+                        project,
+                        action,
+                        dev,
+                        command or [],
+                        labels[project],
+                    )
+                )
+
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                results.append(result)
+                if fail_fast and result.retval != SUCCESS:
+                    pending.clear()
+
+    return results
+
+
+def format_summary(results: list[BatchResult]) -> str:
+    header = ("PROJECT", "BACKEND", "RETVAL", "DURATION")
+    rows = [
+        (
+            str(result.project_path),
+            result.venv_type or "NA",
+            str(result.retval),
+            f"{result.duration:.1f}s",
+        )
+        for result in sorted(results, key=lambda result: str(result.project_path))
+    ]
+    return format_table(header, rows)
@@ -0,0 +1,79 @@
+import shlex
+from typing import Optional
+
+import click
+
+from pyvem.batch import format_summary, resolve_projects, run_batch
+from pyvem.constants import FAILURE, NO_BATCH_PROJECTS, SUCCESS, BatchActionEnum
+
+
+@click.command("batch")
+@click.argument("action", type=click.Choice(BatchActionEnum.list()))
+@click.argument("projects", type=str, nargs=-1)
+@click.option(
+    "-a",
+    "--all",
+    "all_registered",
+    is_flag=True,
+    default=False,
+    help="Include all projects known to pyvem",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=None,
+    help="How many projects are processed at once  [default: number of CPUs]",
+)
+@click.option(
+    "-d", "--dev", is_flag=True, default=False, help="Install dev dependencies"
+)
+@click.option(
+    "-c",
+    "--command",
+    type=str,
+    default=None,
+    help="Command for the run action, e.g. 'pytest -q'",
+)
+@click.option(
+    "--fail-fast",
+    is_flag=True,
+    default=False,
+    help="Don't start other projects once one of them fails",
+)
+def batch(
+    action: str,
+    projects: tuple[str, ...],
+    all_registered: bool,
+    jobs: Optional[int],
+    dev: bool,
+    command: Optional[str],
+    fail_fast: bool,
+) -> None:
+    """
+    Runs the action on many projects in parallel.
+
+    PROJECTS are paths or glob patterns of project directories.
+    """
+    if action == BatchActionEnum.run and not command:
+        raise click.UsageError("The run action needs --command")
+
+    project_paths = resolve_projects(projects, all_registered)
+    if not project_paths:
+        raise click.UsageError(NO_BATCH_PROJECTS)
+
+    results = run_batch(
+        project_paths,
+        BatchActionEnum(action),
+        jobs=jobs,
+        dev=dev,
+        command=shlex.split(command) if command else None,
+        fail_fast=fail_fast,
+    )
+    print()
+    print(format_summary(results))
+
+    failed = len(results) != len(project_paths) or any(
+        result.retval != SUCCESS for result in results
+    )
+    exit(FAILURE if failed else SUCCESS)
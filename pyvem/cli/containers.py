@@ -1,5 +1,8 @@
 import os.path
+import shlex
 from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
 from os import getcwd
 from pathlib import Path
 from typing import Optional, Type
@@ -8,32 +11,69 @@ import click
 from click import Context, pass_context
 
 from pyvem.config import Config
-from pyvem.constants import NOT_IMPLEMENTED
-from pyvem.containers.base import get_container_client
-from pyvem.containers.handler import IMAGE_STATE, ContainerHandler
+from pyvem.constants import FAILURE, NOT_IMPLEMENTED, SUCCESS
+from pyvem.containers.base import LinuxDistro
+from pyvem.containers.build_cache import BuildCache
+from pyvem.containers.builds import build_images, build_targets, format_report
+from pyvem.containers.client import get_container_client
+from pyvem.containers.gc import collect_garbage
+from pyvem.containers.pkg_cache import PackageCache
 from pyvem.containers.rpm import RPM
-from pyvem.spells import find_first_occurrence_of_file, parse_repository_name
+from pyvem.containers.squash import layer_count
+from pyvem.exceptions import PyVemContainerException
+from pyvem.spells import find_first_occurrences, format_table
+
+# option defaults are callables so they are resolved only when the command runs
+# (or its help is shown) and never when this module is imported
+
+
+def _cwd_basename() -> str:
+    return os.path.basename(getcwd())
+
+
+def _default_rpm_image() -> str:
+    return Config.get_config().images.rpm
+
 
 repository_name_arg = click.argument(
     "repository_name",
     type=str,
     required=False,
-    default=os.path.basename(getcwd()),
+    default=_cwd_basename,
 )
 
 
-def get_container_type() -> Type[RPM]:
-    result = find_first_occurrence_of_file(Path(getcwd()), "*.spec")
-    if result is None:
-        pass
-        # in case of more container instances
-        # raise ClickException(NO_KNOWN_VENV)
+# the first one is used for projects without any recipe
+CONTAINER_TYPES: tuple[Type[LinuxDistro], ...] = (RPM,)
+
+
+@lru_cache(maxsize=None)
+def _find_recipe() -> tuple[Type[LinuxDistro], Optional[Path]]:
+    """
+    Look for recipes of all container types in one walk of the project tree,
+    the type of the shallowest recipe found is picked.
+    """
+    found = find_first_occurrences(
+        Path(getcwd()), [c_type.RECIPE_PATTERN for c_type in CONTAINER_TYPES]
+    )
+    candidates = [
+        (len(found[c_type.RECIPE_PATTERN].parts), c_type)
+        for c_type in CONTAINER_TYPES
+        if c_type.RECIPE_PATTERN in found
+    ]
+    if not candidates:
+        return CONTAINER_TYPES[0], None
+
+    _, c_type = min(candidates, key=lambda candidate: candidate[0])
+    return c_type, found[c_type.RECIPE_PATTERN]
+
 
-    return RPM
+def get_container_type() -> Type[LinuxDistro]:
+    return _find_recipe()[0]
 
 
 def get_recipe_path_as_text() -> Optional[str]:
-    path = get_container_type().get_recipe_path()
+    path = _find_recipe()[1]
     if path is not None:
         return str(path)
     return None
@@ -41,7 +81,7 @@ def get_recipe_path_as_text() -> Optional[str]:
 
 @dataclass
 class _Obj:
-    c_object: Type[RPM]
+    c_object: Type[LinuxDistro]
     config: Config
 
 
@@ -88,7 +128,7 @@ def container(ctx: Context, podman: bool) -> None:
     "--recipe",
     type=click.Path(exists=True),
     required=False,
-    default=get_recipe_path_as_text(),
+    default=get_recipe_path_as_text,
     show_default=True,
     help="Recipe file to obtain dependencies (*.spec, *.pkg, ...)",
 )
@@ -97,9 +137,18 @@ def container(ctx: Context, podman: bool) -> None:
     "--image-name",
     type=str,
     required=False,
-    default=Config.get_config().images.rpm,
-    show_default=True,
-    help="Specific image to pull. e.g. fedora:latest",
+    default=lambda: [_default_rpm_image()],
+    show_default="from config",
+    multiple=True,
+    help="Specific image to pull, e.g. fedora:latest. Repeat to build more images"
+    " at once, each to its own tag of the repository, named after the image or"
+    " given as IMAGE=TAG",
+)
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    default=False,
+    help="Don't reuse images built before from the same steps",
 )
 @repository_name_arg
 @pass_context
@@ -107,21 +156,32 @@ def install(
     ctx: Context,
     dependency: Optional[list[str]],
     package: Optional[str],
-    recipe: str,
-    image_name: str,
+    recipe: Optional[str],
+    image_name: tuple[str, ...],
+    no_cache: bool,
     repository_name: str,
 ) -> None:
     """Install new image with dependencies"""
-    container_client = get_container_client(ctx.obj.config.use_podman_engine)
-    container_handler = ContainerHandler(repository_name, container_client, IMAGE_STATE)
-    image_name, tag_name = parse_repository_name(image_name)
-    repo_container_handler = container_handler.get_handler_for(image_name, tag_name)
-    repo_name, _ = parse_repository_name(repository_name)
-    repo_container_handler.tag(repo_name)
-
-    ctx.obj.c_object(repository_name=repository_name, config=ctx.obj.config).install(
-        dependency, package, Path(recipe)
+    if no_cache:
+        ctx.obj.config.container_build_cache = False
+
+    try:
+        targets = build_targets(repository_name, list(image_name))
+    except PyVemContainerException as exc:
+        raise click.UsageError(str(exc)) from exc
+
+    results = build_images(
+        ctx.obj.c_object,
+        ctx.obj.config,
+        targets,
+        dependency,
+        package,
+        Path(recipe) if recipe else None,
     )
+    print()
+    print(format_report(results))
+    failed = any(result.retval != SUCCESS for result in results)
+    exit(FAILURE if failed else SUCCESS)
 
 
 @container.command("update")
@@ -148,22 +208,37 @@ def update(ctx: Context, packages: Optional[list[str]], repository_name: str) ->
     required=False,
     default=None,
 )
+@pass_context
 def keep_running(ctx: Context, repository_name: str, container_name: str):
     """
     Start container with infinitely running command and return its ID to stdout.
     You won't be able to see output from the container tho
     """
-    pass
+    c_object = ctx.obj.c_object(repository_name=repository_name, config=ctx.obj.config)
+    c_object.keep_running(container_name)
+
+
+c_user = click.option(
+    "-u",
+    "--user",
+    default="root",
+    show_default=True,
+    help="Enter the container as specific user (root, ...)",
+)
 
 
 @container.command("run")
+@c_user
 @repository_name_arg
 @click.argument("command", type=str)
-def run(ctx: Context, repository_name: str):
+@pass_context
+def run(ctx: Context, user: str, repository_name: str, command: str):
     """
-    Start container associated with given repository name and run command in it.
+    Run command in a container associated with given repository name, containers
+    are kept running in a pool and reused by following commands.
     """
-    pass
+    c_object = ctx.obj.c_object(repository_name=repository_name, config=ctx.obj.config)
+    ctx.exit(c_object.run_pooled(shlex.split(command), user=user))
 
 
 @container.command("stop")
@@ -180,7 +255,7 @@ def run(ctx: Context, repository_name: str):
     "container_name",
     type=str,
     required=False,
-    default=os.path.basename(getcwd()),
+    default=_cwd_basename,
 )
 def stop(ctx: Context, id_: str, container_name: str):
     """Stops running container or containers associated with repository name"""
@@ -189,25 +264,20 @@ def stop(ctx: Context, id_: str, container_name: str):
 
 @container.command("delete")
 @repository_name_arg
+@pass_context
 def remove(ctx: Context, repository_name: str):
     """Remove the image in repository matching the given name."""
-    pass
+    ctx.obj.c_object(repository_name=repository_name, config=ctx.obj.config).remove()
 
 
 @container.command("info")
 @repository_name_arg
+@pass_context
 def info(ctx: Context, repository_name: str):
     """Prints the running containers based on given"""
-    raise NotImplementedError(NOT_IMPLEMENTED)
-
-
-c_user = click.option(
-    "-u",
-    "--user",
-    default="root",
-    show_default=True,
-    help="Enter the container as specific user (root, ...)",
-)
+    print(
+        ctx.obj.c_object(repository_name=repository_name, config=ctx.obj.config).info()
+    )
 
 
 @container.command("enter")
@@ -226,20 +296,167 @@ def enter(ctx: Context, user: str, container_name: str):
     default=False,
     help="Don't commit effect of command to an image",
 )
-@click.argument(
-    "container_name",
-    type=str,
-    required=False,
-    default=os.path.basename(getcwd()),
-)
+@repository_name_arg
 @click.argument("command", type=str)
-def execute(ctx: Context, user: str, container_name: str, command: str):
-    """Execute command inside running container"""
-    pass
+@pass_context
+def execute(
+    ctx: Context, user: str, no_commit: bool, repository_name: str, command: str
+):
+    """
+    Execute command in a container of the repository taken from the pool, see
+    run, and commit its effect to the image of the repository.
+    """
+    c_object = ctx.obj.c_object(repository_name=repository_name, config=ctx.obj.config)
+    ctx.exit(c_object.run_pooled(shlex.split(command), user=user, commit=not no_commit))
 
 
 @container.command("images")
 @repository_name_arg
+@pass_context
 def images(ctx: Context, repository_name: str):
     """List all image names associated with project according to repository name"""
-    pass
+    c_object = ctx.obj.c_object(repository_name=repository_name, config=ctx.obj.config)
+    for name in c_object.repositories():
+        print(name)
+
+
+@container.command("prune-cache")
+@pass_context
+def prune_cache(ctx: Context) -> None:
+    """Remove package manager cache shared by containers"""
+    package_cache = PackageCache(ctx.obj.config.path_to_pyvem_dir)
+    freed = package_cache.prune()
+    print(f"Removed {freed / 1024 / 1024:.1f} MiB of cached packages")
+
+
+@container.command("cache-stats")
+@pass_context
+def cache_stats(ctx: Context) -> None:
+    """Show how often build steps were reused from build cache"""
+    stats = BuildCache(ctx.obj.config.path_to_pyvem_dir).stats()
+    print(
+        format_table(
+            ("ENTRIES", "HITS", "MISSES", "HIT RATE"),
+            [
+                (
+                    str(stats.entries),
+                    str(stats.hits),
+                    str(stats.misses),
+                    f"{stats.hit_rate:.0%}",
+                )
+            ],
+        )
+    )
+
+
+@container.command("history")
+@repository_name_arg
+@pass_context
+def history(ctx: Context, repository_name: str) -> None:
+    """Show snapshots of the image, the current one is marked with *"""
+    c_object = ctx.obj.c_object(repository_name=repository_name, config=ctx.obj.config)
+    current = c_object.history.current(c_object.client)
+    rows = [
+        (
+            f"{'*' if snapshot.image_id == current else ''}{snapshot.number}",
+            snapshot.tag,
+            datetime.fromtimestamp(snapshot.created).strftime("%Y-%m-%d %H:%M:%S"),
+            f"{snapshot.size / 1024 / 1024:.1f} MiB",
+            snapshot.command,
+        )
+        for snapshot in reversed(c_object.history.snapshots())
+    ]
+    print(format_table(("N", "TAG", "CREATED", "SIZE", "COMMAND"), rows))
+
+
+@container.command("rollback")
+@click.argument("number", type=int)
+@repository_name_arg
+@pass_context
+def rollback(ctx: Context, number: int, repository_name: str) -> None:
+    """Point the image back to the snapshot NUMBER, see history"""
+    c_object = ctx.obj.c_object(repository_name=repository_name, config=ctx.obj.config)
+    snapshot = c_object.history.rollback(c_object.client, number)
+    print(f"{repository_name} is now snapshot {snapshot.number}: {snapshot.command}")
+
+
+@container.command("prune-snapshots")
+@click.option(
+    "-k",
+    "--keep",
+    type=int,
+    default=None,
+    help="Number of the newest snapshots to keep, defaults to config",
+)
+@repository_name_arg
+@pass_context
+def prune_snapshots(ctx: Context, keep: Optional[int], repository_name: str) -> None:
+    """Remove old snapshots of the image"""
+    c_object = ctx.obj.c_object(repository_name=repository_name, config=ctx.obj.config)
+    pruned = c_object.history.prune(c_object.client, keep=keep)
+    print(f"Pruned {len(pruned)} snapshots")
+
+
+@container.command("gc")
+@click.option(
+    "--running",
+    is_flag=True,
+    default=False,
+    help="Remove also running build containers, they may belong to builds in"
+    " progress",
+)
+@pass_context
+def gc(ctx: Context, running: bool) -> None:
+    """Remove build containers and dangling images pyvem left behind"""
+    report = collect_garbage(
+        get_container_client(ctx.obj.config.use_podman_engine),
+        ctx.obj.config.path_to_pyvem_dir,
+        running=running,
+    )
+    print(
+        f"Removed {report.containers} containers, {report.images} images and"
+        f" {report.cache_entries} build cache entries,"
+        f" reclaimed {report.space_reclaimed / 1024 / 1024:.1f} MiB"
+    )
+
+
+@container.command("squash")
+@repository_name_arg
+@pass_context
+def squash(ctx: Context, repository_name: str) -> None:
+    """Flatten layers of the image into one"""
+    c_object = ctx.obj.c_object(repository_name=repository_name, config=ctx.obj.config)
+    layers = layer_count(c_object.container_handler.image)
+    image = c_object.container_handler.squash()
+    print(
+        f"Squashed {repository_name} from {layers} layers to {layer_count(image)},"
+        " the layered image is kept as snapshot for rollback"
+    )
+
+
+@container.command("pool")
+@click.option(
+    "--drain",
+    is_flag=True,
+    default=False,
+    help="Remove idle containers of the pool",
+)
+@repository_name_arg
+@pass_context
+def pool(ctx: Context, drain: bool, repository_name: str) -> None:
+    """Show containers kept running for the run command"""
+    c_object = ctx.obj.c_object(repository_name=repository_name, config=ctx.obj.config)
+    if drain:
+        print(f"Removed {c_object.pool.drain()} containers")
+        return
+
+    rows = [
+        (
+            pooled.id[:12],
+            datetime.fromtimestamp(pooled.last_used).strftime("%Y-%m-%d %H:%M:%S"),
+            str(pooled.uses),
+            f"pid {pooled.leased_by}" if pooled.leased_by else "idle",
+        )
+        for pooled in c_object.pool.containers()
+    ]
+    print(format_table(("CONTAINER", "LAST USED", "USES", "STATE"), rows))
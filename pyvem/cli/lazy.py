@@ -0,0 +1,43 @@
+"""
+Click group which imports its subcommands only when they are invoked.
+"""
+
+from importlib import import_module
+from typing import Any, Optional
+
+import click
+
+
+class LazyGroup(click.Group):
+    """
+    Group whose subcommands are given as `"module.path:attribute"` import strings.
+
+    The module of a subcommand is imported the first time click asks for it,
+    so running one subcommand never pays for the dependencies of the others.
+    """
+
+    def __init__(
+        self, *args: Any, lazy_subcommands: Optional[dict[str, str]] = None, **kwargs
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self.lazy_subcommands = lazy_subcommands or {}
+
+    def list_commands(self, ctx: click.Context) -> list[str]:
+        return sorted(set(super().list_commands(ctx)) | set(self.lazy_subcommands))
+
+    def get_command(self, ctx: click.Context, cmd_name: str) -> Optional[click.Command]:
+        if cmd_name in self.lazy_subcommands:
+            return self._load(cmd_name)
+
+        return super().get_command(ctx, cmd_name)
+
+    def _load(self, cmd_name: str) -> click.Command:
+        module_name, attribute = self.lazy_subcommands[cmd_name].split(":")
+        command = getattr(import_module(module_name), attribute)
+        if not isinstance(command, click.Command):
+            raise ValueError(
+                f"Lazy subcommand {cmd_name} ({module_name}:{attribute})"
+                " is not a click command"
+            )
+
+        return command
@@ -2,32 +2,35 @@ import logging
 
 import click
 
-from pyvem.cli.containers import container
-from pyvem.cli.ve_tools import delete, env_path, info, install, run, update_deps, use
+from pyvem.cli.lazy import LazyGroup
 from pyvem.constants import SUCCESS
 
 logging.basicConfig()
 logger = logging.getLogger()
 
 
-@click.group()
+@click.group(
+    cls=LazyGroup,
+    lazy_subcommands={
+        "batch": "pyvem.cli.batch:batch",
+        "container": "pyvem.cli.containers:container",
+        "delete": "pyvem.cli.ve_tools:delete",
+        "info": "pyvem.cli.ve_tools:info",
+        "use": "pyvem.cli.ve_tools:use",
+        "install": "pyvem.cli.ve_tools:install",
+        "env-path": "pyvem.cli.ve_tools:env_path",
+        "list": "pyvem.cli.ve_tools:list_distributions",
+        "freeze": "pyvem.cli.ve_tools:freeze",
+        "update": "pyvem.cli.ve_tools:update_deps",
+        "run": "pyvem.cli.ve_tools:run",
+    },
+)
 @click.option("--debug", is_flag=True, default=False, help="Show debugging logs")
 def entry_point(debug: bool):
     if debug:
         logger.setLevel(logging.DEBUG)
 
 
-entry_point.add_command(container)
-
-entry_point.add_command(delete)
-entry_point.add_command(info)
-entry_point.add_command(use)
-entry_point.add_command(install)
-entry_point.add_command(env_path)
-entry_point.add_command(update_deps)
-entry_point.add_command(run)
-
-
 if __name__ == "__main__":
     entry_point()
     exit(SUCCESS)
@@ -1,32 +1,15 @@
-from os import getcwd, listdir
+import json
+from os import getcwd
+from pathlib import Path
 
 import click
 
-from pyvem.constants import NO_KNOWN_VENV
-from pyvem.exceptions import PyVemException
-from pyvem.ve_tools.pipenv import Pipenv
-from pyvem.ve_tools.poetry import Poetry
-from pyvem.ve_tools.venv import Venv
+from pyvem.ve_tools.base import VirtualEnvironment
+from pyvem.ve_tools.detect import get_venv_instance
 
 
-def get_venv_instance() -> Poetry | Pipenv | Venv:
-    dir_content = listdir(getcwd())
-    if "Pipfile" in dir_content:
-        return Pipenv()
-
-    if (
-        "pyproject.toml" in dir_content
-        and "[tool.poetry]" in open("pyproject.toml").read()
-    ):
-        return Poetry()
-
-    if "setup.py" in dir_content or "pyproject.toml" in dir_content:
-        return Venv()
-
-    raise PyVemException(NO_KNOWN_VENV)
-
-
-ins = get_venv_instance
+def ins() -> VirtualEnvironment:
+    return get_venv_instance(Path(getcwd()))
 
 
 @click.command("delete")
@@ -62,17 +45,81 @@ def env_path() -> None:
     print(ins().env_path())
 
 
+@click.command("list")
+@click.option(
+    "--json", "as_json", is_flag=True, default=False, help="Print as JSON list"
+)
+def list_distributions(as_json: bool) -> None:
+    """Lists packages installed in virtual environment."""
+    distributions = ins().installed_distributions()
+    if as_json:
+        print(json.dumps([dist.to_dict() for dist in distributions], indent=2))
+        return
+
+    rows = [("Package", "Version", "Location")]
+    rows += [(dist.name, dist.version, dist.direct_url or "") for dist in distributions]
+    name_width = max(len(row[0]) for row in rows)
+    version_width = max(len(row[1]) for row in rows)
+    for name, version, location in rows:
+        print(f"{name:<{name_width}} {version:<{version_width}} {location}".rstrip())
+
+
+@click.command("freeze")
+@click.option(
+    "-a",
+    "--all",
+    "include_all",
+    is_flag=True,
+    default=False,
+    help="Include also pip, setuptools and wheel",
+)
+def freeze(include_all: bool) -> None:
+    """Prints packages installed in virtual environment as pinned requirements."""
+    from pyvem.inventory import freeze_lines
+
+    for line in freeze_lines(ins().installed_distributions(), include_all):
+        print(line)
+
+
 @click.command("update")
 @click.option(
     "-d", "--dev", is_flag=True, default=False, help="Install dev dependencies"
 )
-def update_deps(dev: bool) -> None:
-    """Updates dependencies in virtual environment"""
-    exit(ins().update_deps(dev))
+@click.option(
+    "-U",
+    "--upgrade",
+    is_flag=True,
+    default=False,
+    help="Upgrade dependencies to the newest versions they allow, never skipped",
+)
+def update_deps(dev: bool, upgrade: bool) -> None:
+    """
+    Updates dependencies in virtual environment, skipped while nothing changed
+    since the last sync unless --upgrade is given
+    """
+    exit(ins().update_deps(dev, upgrade))
 
 
-@click.command("run")
-@click.argument("command", type=str)
-def run(command: str) -> None:
+@click.command(
+    "run",
+    context_settings={"ignore_unknown_options": True, "allow_interspersed_args": False},
+)
+@click.option(
+    "-e",
+    "--exec",
+    "exec_",
+    is_flag=True,
+    default=False,
+    help=(
+        "Replace pyvem with the command running directly in the environment,"
+        " without a shell or the tool's own `run`"
+    ),
+)
+@click.argument("command", nargs=-1, required=True, type=click.UNPROCESSED)
+def run(exec_: bool, command: tuple[str, ...]) -> None:
     """Runs a specified command inside the corresponding virtual environment."""
-    exit(ins().run(command.split()))
+    args = list(command)
+    if exec_:
+        ins().exec_in_env(args)
+
+    exit(ins().run(args))
@@ -2,20 +2,34 @@
 Wrapper for executing shell commands.
 """
 
+import codecs
 import logging
+import selectors
 import sys
+from collections import deque
+from contextlib import contextmanager
 from dataclasses import dataclass
-from io import TextIOWrapper
-from os import getcwd
+from os import getcwd, read
 from pathlib import Path
 from subprocess import PIPE, Popen
-from typing import Optional, TextIO
+from typing import TYPE_CHECKING, Callable, Iterator, Optional, TextIO
 
-from pyvem.constants import FAILURE, SUCCESS
+from pyvem.constants import (
+    MAX_CAPTURED_OUTPUT,
+    SUCCESS,
+)
 from pyvem.exceptions import PyVemException
 
+if TYPE_CHECKING:
+    # imported by the async methods only, it's slow to import
+    import asyncio
+
 logger = logging.getLogger(__name__)
 
+LineCallback = Callable[[str], None]
+
+_READ_SIZE = 64 * 1024
+
 
 @dataclass
 class CmdResult:
@@ -39,27 +53,155 @@ class CmdResult:
         return result
 
 
-class Cmd:
-    def __init__(self, cwd: Path = Path(getcwd())) -> None:
-        self.cwd = cwd
+class OutputBuffer:
+    """
+    Keeps at most the last `max_size` characters of captured output in memory.
+    """
 
-    @staticmethod
-    def _tee_process_output(process: Popen, tee_to_stdout: bool, stdout: bool) -> str:
-        output = process.stdout if stdout else process.stderr
-        if output is None:
+    def __init__(self, max_size: int = MAX_CAPTURED_OUTPUT) -> None:
+        self.max_size = max_size
+        self.truncated = False
+        self._chunks: deque[str] = deque()
+        self._size = 0
+
+    def append(self, chunk: str) -> None:
+        if self.max_size <= 0:
+            # nothing is kept at all
+            self.truncated = self.truncated or bool(chunk)
+            return
+
+        self._chunks.append(chunk)
+        self._size += len(chunk)
+        while self._chunks and self._size - len(self._chunks[0]) >= self.max_size:
+            self._size -= len(self._chunks.popleft())
+            self.truncated = True
+
+    def getvalue(self) -> str:
+        if self.max_size <= 0:
             return ""
 
-        print_output = sys.stdout if stdout else sys.stderr
+        value = "".join(self._chunks)
+        if len(value) > self.max_size:
+            self.truncated = True
+            return value[-self.max_size :]
+
+        return value
+
+
+class OutputStream:
+    """
+    One pipe of the process being drained, decodes it incrementally so neither
+    multi-byte characters nor lines split between reads are broken.
+    """
+
+    def __init__(
+        self,
+        tee_to: Optional[TextIO],
+        callbacks: list[LineCallback],
+        spill: Optional[TextIO],
+        max_size: int,
+    ) -> None:
+        self.tee_to = tee_to
+        self.callbacks = callbacks
+        self.spill = spill
+        self.buffer = OutputBuffer(max_size)
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._partial_line = ""
+
+    def feed(self, data: bytes) -> None:
+        """
+        Process the next chunk read from the pipe, empty chunk means EOF.
+        """
+        text = self._decoder.decode(data, final=not data)
+        if text:
+            self.buffer.append(text)
+            if self.spill is not None:
+                self.spill.write(text)
+
+            if self.tee_to is not None:
+                self.tee_to.write(text)
+                self.tee_to.flush()
+
+            if self.callbacks:
+                lines = (self._partial_line + text).split("\n")
+                self._partial_line = lines.pop()
+                for line in lines:
+                    self._call_back(line)
+
+        if not data:
+            self._flush_partial_line()
+
+    def _flush_partial_line(self) -> None:
+        if self._partial_line:
+            self._call_back(self._partial_line)
+            self._partial_line = ""
 
+    def _call_back(self, line: str) -> None:
+        for callback in self.callbacks:
+            callback(line)
+
+
+@contextmanager
+def _output_streams(
+    tee_to_stdout: bool,
+    stdout_callback: Optional[LineCallback],
+    stderr_callback: Optional[LineCallback],
+    log_file: Optional[Path],
+    max_captured_output: int,
+) -> Iterator[tuple[OutputStream, OutputStream]]:
+    spill = None
+    if log_file is not None:
+        log_file.parent.mkdir(parents=True, exist_ok=True)
+        spill = open(log_file, "a", encoding="utf-8")
+
+    try:
+        yield (
+            OutputStream(
+                sys.stdout if tee_to_stdout else None,
+                [stdout_callback] if stdout_callback else [],
+                spill,
+                max_captured_output,
+            ),
+            OutputStream(
+                sys.stderr if tee_to_stdout else None,
+                [stderr_callback] if stderr_callback else [],
+                spill,
+                max_captured_output,
+            ),
+        )
+    finally:
+        if spill is not None:
+            spill.close()
+
+
+class Cmd:
+    def __init__(self, cwd: Optional[Path] = None) -> None:
+        self.cwd = cwd if cwd is not None else Path(getcwd())
+
+    @staticmethod
+    def _drain_process_output(
+        process: Popen, stdout: OutputStream, stderr: OutputStream
+    ) -> None:
+        """
+        Read stdout and stderr of the process at once, as the data come, so the
+        process never blocks on a full pipe and the output is interleaved live.
+        """
         # TODO: how to capture colors?
-        captured_output = ""
-        for out_line in TextIOWrapper(output, encoding="utf-8"):  # type: ignore
-            captured_output += out_line
+        with selectors.DefaultSelector() as selector:
+            selector.register(process.stdout, selectors.EVENT_READ, stdout)
+            selector.register(process.stderr, selectors.EVENT_READ, stderr)
+            while selector.get_map():
+                for key, _ in selector.select():
+                    data = read(key.fd, _READ_SIZE)
+                    key.data.feed(data)
+                    if not data:
+                        selector.unregister(key.fileobj)
 
-            if tee_to_stdout:
-                print(out_line, file=print_output, end="", flush=True)
+    def _get_context(self, context: Optional[Path]) -> Path:
+        if context is not None:
+            return context
 
-        return captured_output
+        return self.cwd
 
     def _prepare_process(
         self,
@@ -68,11 +210,7 @@ class Cmd:
         use_venv: bool,
         **popen_kwargs,
     ) -> Popen:
-        if context is not None:
-            cmd_context = context
-        else:
-            cmd_context = self.cwd
-
+        cmd_context = self._get_context(context)
         logger.debug(
             f"Running command: $ {' '.join(arguments)}; in context {cmd_context}"
         )
@@ -92,6 +230,27 @@ class Cmd:
             **popen_kwargs,
         )
 
+    @staticmethod
+    def _get_result(
+        arguments: list[str],
+        retval: int,
+        stdout: OutputStream,
+        stderr: OutputStream,
+        raise_on_failure: bool,
+    ) -> CmdResult:
+        stdout_text = stdout.buffer.getvalue().strip()
+        stderr_text = stderr.buffer.getvalue().strip()
+        if raise_on_failure and retval != SUCCESS:
+            raise PyVemException(
+                f"Command `$ {' '.join(arguments)}` failed due to reason: {stderr_text}"
+            )
+
+        logger.debug(
+            f"Cmd results:\nstdout: {stdout_text};\nstderr: {stderr_text};"
+            f"\nretval: {retval}"
+        )
+        return CmdResult(stdout=stdout_text, stderr=stderr_text, retval=retval)
+
     def run_cmd(
         self,
         arguments: list[str],
@@ -101,28 +260,142 @@ class Cmd:
         # FIXME: tee output behaves weird with fish shell -> passing it
         # directly to stdout
         use_venv: bool = False,
+        stdout_callback: Optional[LineCallback] = None,
+        stderr_callback: Optional[LineCallback] = None,
+        log_file: Optional[Path] = None,
+        max_captured_output: int = MAX_CAPTURED_OUTPUT,
         **popen_kwargs,
     ) -> CmdResult:
-        process = self._prepare_process(arguments, context, use_venv, **popen_kwargs)
-        stdout, stderr = "", ""
-        if not use_venv:
-            stdout = self._tee_process_output(process, tee_to_stdout, True).strip()
-            stderr = self._tee_process_output(process, tee_to_stdout, False).strip()
-
-        process.communicate()
-        retval = process.poll()
-        if retval is None:
-            retval = FAILURE
+        """
+        Run the command and capture its output.
 
-        if raise_on_failure and retval != SUCCESS:
-            raise PyVemException(
-                f"Command `$ {' '.join(arguments)}` failed due to reason: {stderr}"
-            )
+        Args:
+            arguments: Command to run.
+            context: Working directory of the command, defaults to `self.cwd`.
+            tee_to_stdout: Print the output of the command while it runs.
+            raise_on_failure: Raise `PyVemException` if the command fails.
+            use_venv: Connect the command directly to the terminal of pyvem,
+                nothing is captured.
+            stdout_callback: Called with each line of stdout without newline.
+            stderr_callback: Called with each line of stderr without newline.
+            log_file: Append the whole output of the command to this file.
+            max_captured_output: Only this many last characters of each stream
+                are kept in the result, the rest can be found in `log_file`.
 
+        Returns:
+            Return code and captured output of the command.
+        """
+        process = self._prepare_process(arguments, context, use_venv, **popen_kwargs)
         if use_venv:
+            retval = process.wait()
+            if raise_on_failure and retval != SUCCESS:
+                raise PyVemException(f"Command `$ {' '.join(arguments)}` failed")
+
             return CmdResult(retval=retval)
 
+        with _output_streams(
+            tee_to_stdout,
+            stdout_callback,
+            stderr_callback,
+            log_file,
+            max_captured_output,
+        ) as (stdout, stderr):
+            self._drain_process_output(process, stdout, stderr)
+
+        return self._get_result(
+            arguments, process.wait(), stdout, stderr, raise_on_failure
+        )
+
+    @staticmethod
+    async def _drain_async_process_output(
+        process: "asyncio.subprocess.Process",
+        stdout: OutputStream,
+        stderr: OutputStream,
+    ) -> None:
+        import asyncio
+
+        async def drain(
+            pipe: Optional["asyncio.StreamReader"], stream: OutputStream
+        ) -> None:
+            assert pipe is not None
+            while True:
+                data = await pipe.read(_READ_SIZE)
+                stream.feed(data)
+                if not data:
+                    return
+
+        await asyncio.gather(
+            drain(process.stdout, stdout), drain(process.stderr, stderr)
+        )
+
+    @classmethod
+    async def _drain_and_wait(
+        cls,
+        process: "asyncio.subprocess.Process",
+        stdout: OutputStream,
+        stderr: OutputStream,
+    ) -> int:
+        # the process can outlive its pipes, the timeout covers waiting for it too
+        await cls._drain_async_process_output(process, stdout, stderr)
+        return await process.wait()
+
+    async def run_cmd_async(
+        self,
+        arguments: list[str],
+        context: Optional[Path] = None,
+        tee_to_stdout: bool = True,
+        raise_on_failure: bool = False,
+        stdout_callback: Optional[LineCallback] = None,
+        stderr_callback: Optional[LineCallback] = None,
+        log_file: Optional[Path] = None,
+        max_captured_output: int = MAX_CAPTURED_OUTPUT,
+        timeout: Optional[float] = None,
+        **subprocess_kwargs,
+    ) -> CmdResult:
+        """
+        Asyncio counterpart of `run_cmd`, see its arguments.
+
+        The process is killed when the task is cancelled or when it doesn't end
+        within `timeout` seconds, the latter raises `PyVemException`.
+        """
+        import asyncio
+
+        cmd_context = self._get_context(context)
         logger.debug(
-            f"Cmd results:\nstdout: {stdout};\nstderr: {stderr};\nretval: {retval}"
+            f"Running command: $ {' '.join(arguments)}; in context {cmd_context}"
+        )
+        process = await asyncio.create_subprocess_exec(
+            *arguments,
+            stdout=PIPE,
+            stderr=PIPE,
+            cwd=cmd_context,
+            **subprocess_kwargs,
         )
-        return CmdResult(stdout=stdout, stderr=stderr, retval=retval)
+
+        with _output_streams(
+            tee_to_stdout,
+            stdout_callback,
+            stderr_callback,
+            log_file,
+            max_captured_output,
+        ) as (stdout, stderr):
+            try:
+                retval = await asyncio.wait_for(
+                    self._drain_and_wait(process, stdout, stderr), timeout
+                )
+            except asyncio.TimeoutError as exc:
+                await self._kill(process)
+                raise PyVemException(
+                    f"Command `$ {' '.join(arguments)}` timed out after {timeout}s"
+                ) from exc
+            except asyncio.CancelledError:
+                await self._kill(process)
+                raise
+
+        return self._get_result(arguments, retval, stdout, stderr, raise_on_failure)
+
+    @staticmethod
+    async def _kill(process: "asyncio.subprocess.Process") -> None:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
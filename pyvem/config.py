@@ -3,9 +3,15 @@ from pathlib import Path
 from typing import Optional
 
 from pydantic import BaseModel, Field, FilePath
-from yaml import safe_load
 
-from pyvem.constants import CONFIG_FILE_LOCATIONS, DEFAULT_PATH_TO_PYVEM_DIR
+from pyvem.constants import (
+    CONFIG_FILE_LOCATIONS,
+    DEFAULT_PATH_TO_PYVEM_DIR,
+    POOL_IDLE_TIMEOUT,
+    POOL_MAX_USES,
+    POOL_SIZE,
+    SNAPSHOTS_KEEP,
+)
 
 
 class Images(BaseModel):
@@ -14,7 +20,38 @@ class Images(BaseModel):
 
 class Config(BaseModel):
     path_to_pyvem_dir: FilePath = DEFAULT_PATH_TO_PYVEM_DIR
-    use_podman_engine: bool = False
+    # None picks podman if its socket is live, docker otherwise
+    use_podman_engine: Optional[bool] = None
+    # mount package manager cache from pyvem dir to containers, shared by all
+    # of them so repository metadata aren't downloaded for each container again
+    container_package_cache: bool = False
+    # reuse images committed by the same command on the same parent image
+    # instead of running the command again
+    container_build_cache: bool = True
+    # snapshots of repository images kept for rollback, older ones are pruned
+    container_snapshots_keep: int = SNAPSHOTS_KEEP
+    # also prune snapshots older than this many days, None keeps them by count
+    container_snapshots_max_age_days: Optional[int] = None
+    # running containers kept per repository for `pyvem container run`
+    container_pool_size: int = POOL_SIZE
+    # commands a pooled container serves before it's replaced by a fresh one
+    container_pool_max_uses: int = POOL_MAX_USES
+    # seconds after which idle pooled containers are removed
+    container_pool_idle_timeout: int = POOL_IDLE_TIMEOUT
+    # install packages of venv environments from the shared package store
+    use_package_store: bool = False
+    # hardlink files of the package store to environments where reflinks are
+    # not supported instead of copying them, the stored files are read-only
+    package_store_hardlinks: bool = False
+    # create venv environments without pip, packages are installed by pip of
+    # the interpreter running pyvem
+    venv_without_pip: bool = False
+    # install only requirements of requirements.txt the venv environment doesn't
+    # satisfy instead of handing the whole file to pip, `update` still upgrades
+    # them all with pip
+    reconcile_venv_deps: bool = False
+    # when reconciling, uninstall distributions no requirement needs
+    prune_extraneous_deps: bool = False
     images: Images = Images()
 
     # config for pydantic
@@ -35,6 +72,8 @@ class Config(BaseModel):
         if cfg_file_path is None:
             return cls()
 
+        from yaml import safe_load
+
         with open(cfg_file_path) as vem_cfg:
             config_dict = safe_load(vem_cfg)
 
@@ -21,12 +21,95 @@ INFO_TEMPLATE = (
 )
 
 REQUIREMENTS_FILE = "requirements.txt"
+# files deciding which tool manages the project, see pyvem.ve_tools.detect
+MANIFEST_FILES = ("Pipfile", "pyproject.toml", "setup.py")
+REGISTRY_FILE = "projects.db"
+# never uninstalled as extraneous distributions of venv environments
+PROTECTED_DISTRIBUTIONS = frozenset({"pip", "setuptools", "wheel"})
+# shared package store of venv environments inside pyvem dir, see pyvem.store
+STORE_DIR = "store"
+# venv environments new ones are cloned from, see pyvem.templates
+TEMPLATES_DIR = "templates"
+# cached inventories of installed distributions, see pyvem.inventory
+INVENTORY_DIR = "inventory"
+
+# directories never entered while searching project tree for recipes/manifests
+IGNORED_DIRS = frozenset(
+    {
+        ".git",
+        ".hg",
+        ".svn",
+        ".tox",
+        ".nox",
+        ".venv",
+        "venv",
+        ".eggs",
+        "__pycache__",
+        ".mypy_cache",
+        ".pytest_cache",
+        ".ruff_cache",
+        "node_modules",
+        "build",
+        "dist",
+        "_build",
+        "target",
+    }
+)
 
 SUCCESS = 0
 FAILURE = 1
+# exit code of shells for commands which were not found
+COMMAND_NOT_FOUND = 127
+
+# characters of stdout/stderr of a command kept in memory, the rest is dropped
+MAX_CAPTURED_OUTPUT = 1024 * 1024
 
 PODMAN_URI = "unix:///run/user/{uid}/podman/podman.sock"
+PODMAN_ROOT_URI = "unix:///run/podman/podman.sock"
 DOCKER_URI = "unix://var/run/docker.sock"
+# keep-alive connections a container engine client holds
+CONTAINER_POOL_SIZE = 10
+# keeps container of ContainerHandler.session running while commands are executed
+SESSION_COMMAND = ["sleep", "infinity"]
+# seconds a command executed in a container gets to exit after its timeout
+EXEC_KILL_GRACE = 5
+# resolved dependencies of spec files and packages, see pyvem.containers.deps_cache
+DEPS_CACHE_DIR = "deps_cache"
+DEPS_CACHE_MAX_AGE = 30 * 24 * 60 * 60
+# package manager cache mounted to containers, see pyvem.containers.pkg_cache
+PACKAGE_CACHE_DIR = "pkg_cache"
+# directory in pyvem dir mounted to each cache directory in containers
+PACKAGE_CACHE_MOUNTS = {"dnf": "/var/cache/dnf", "libdnf5": "/var/cache/libdnf5"}
+# labels of images and containers pyvem makes, see pyvem.containers.labels
+LABEL_PROJECT = "io.pyvem.project"
+LABEL_REPOSITORY = "io.pyvem.repository"
+LABEL_VERSION = "io.pyvem.version"
+# set to BUILD_ROLE on containers pyvem creates to run commands, gc removes them
+LABEL_ROLE = "io.pyvem.role"
+BUILD_ROLE = "build"
+POOL_ROLE = "pool"
+# key of the build step which committed the image, see pyvem.containers.build_cache
+LABEL_STEP = "io.pyvem.step"
+BUILD_CACHE_DIR = "build_cache"
+BUILD_CACHE_MAX_AGE = 30 * 24 * 60 * 60
+# snapshot history of repository images, see pyvem.containers.history
+HISTORY_DIR = "history"
+SNAPSHOT_TAG = "{tag}-snapshot-{number}"
+SNAPSHOTS_KEEP = 10
+# output of container commands, see pyvem.containers.logs
+CONTAINER_LOGS_DIR = "logs"
+CONTAINER_LOG_MAX_SIZE = 10 * 1024 * 1024
+CONTAINER_LOG_FLUSH_INTERVAL = 0.1
+# lines of output shown in the message of failed command
+CONTAINER_LOG_TAIL_LINES = 20
+# running containers kept for commands, see pyvem.containers.pool
+POOL_DIR = "pool"
+POOL_SIZE = 2
+# commands can leave anything behind, containers are replaced after a few
+POOL_MAX_USES = 10
+POOL_IDLE_TIMEOUT = 10 * 60
+# where recipe files are copied to in the container
+CONTAINER_RECIPE_DIR = "/tmp/pyvem"
 
 
 # enums
@@ -48,6 +131,19 @@ class VenvEnum(str, Enum):
     venv = "venv"
 
 
+class BatchActionEnum(str, Enum):
+    install = "install"
+    update = "update"
+    delete = "delete"
+    info = "info"
+    freeze = "freeze"
+    run = "run"
+
+    @staticmethod
+    def list() -> list[str]:
+        return list(map(lambda action: action.value, BatchActionEnum))
+
+
 class LinuxEnvEnum(str, Enum):
     rpm = "RPM"
 
@@ -56,9 +152,14 @@ class LinuxEnvEnum(str, Enum):
 
 NO_KNOWN_VENV = "No known python virtual environment found in this project."
 NOT_IMPLEMENTED = "This feature has to be yet implemented."
-MANY_IMAGES = (
-    "There are multiple containers associated with this project,"
-    " you need to pick specific image."
+NO_CONTAINER_ENGINE = (
+    "No running container engine found, none of these sockets accepts"
+    " connections: {sockets}"
+)
+NO_BATCH_PROJECTS = "No projects given, pass their paths, globs or use --all."
+DUPLICATE_BUILD_TAGS = (
+    "Images {images} would be built to the same tag {tag}, pick tags with"
+    " -i IMAGE=TAG."
 )
 NO_DEPS_FOUND = (
     "Unable to get dependencies for this project from data you provided."
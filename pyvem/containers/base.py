@@ -1,61 +1,90 @@
 import os
+import shlex
 from abc import ABC, abstractmethod
 from functools import cached_property
 from os import get_terminal_size
 from pathlib import Path
 from typing import Optional
 
-from docker import DockerClient
+from docker.errors import APIError as DockerAPIError
 from pexpect import spawn
 from podman import PodmanClient
+from podman.errors import APIError as PodmanAPIError
 
-from pyvem.cmd import Cmd
 from pyvem.config import Config
-from pyvem.constants import DOCKER_URI, MANY_IMAGES, PODMAN_URI
-from pyvem.containers.handler import ContainerHandler
+from pyvem.constants import CONTAINER_LOGS_DIR, SESSION_COMMAND, SUCCESS
+from pyvem.containers.build_cache import BuildCache
+from pyvem.containers.client import get_container_client
+from pyvem.containers.execute import exec_in_container
+from pyvem.containers.handler import ContainerHandler, ContainerSession
+from pyvem.containers.history import ImageHistory
+from pyvem.containers.labels import normalize_tag, repository_filter
+from pyvem.containers.pkg_cache import PackageCache
+from pyvem.containers.pool import ContainerPool
 from pyvem.exceptions import PyVemContainerException
 from pyvem.pyvem import PyVem
-from pyvem.spells import nested_get, parse_repository_name
+from pyvem.spells import parse_repository_name
 from pyvem.typedefs import Image
 
 
-def get_container_client(use_podman: bool, cwd: Optional[Path] = None):
-    if not use_podman:
-        return DockerClient(base_url=DOCKER_URI)
-
-    if cwd is None:
-        cmd_cls = Cmd()
-    else:
-        cmd_cls = Cmd(cwd)
-
-    uid = cmd_cls.run_cmd(["id", "-u"], tee_to_stdout=False).stderr_and_stdout
-    return PodmanClient(base_url=PODMAN_URI.format(uid=uid))
-
-
 class LinuxDistro(ABC, PyVem):
+    # shell-style pattern of recipe file names the image is built from
+    RECIPE_PATTERN: str
+
     def __init__(self, repository_name: str, config: Optional[Config] = None) -> None:
         super().__init__(config=config)
 
-        self.client = get_container_client(config.use_podman_engine, self.cwd)
+        self.client = get_container_client(self.config.use_podman_engine)
         self.repository_name, self.tag_name = parse_repository_name(repository_name)
-        self.container_handler = ContainerHandler(repository_name, self.client)
+        package_cache = None
+        if self.config.container_package_cache:
+            package_cache = PackageCache(self.pyvem_dir)
+
+        build_cache = None
+        if self.config.container_build_cache:
+            build_cache = BuildCache(self.pyvem_dir)
+
+        self.container_handler = ContainerHandler(
+            repository_name,
+            self.client,
+            package_cache=package_cache,
+            project_path=self.cwd,
+            build_cache=build_cache,
+            history=self.history,
+            logs_dir=self.pyvem_dir / CONTAINER_LOGS_DIR,
+        )
 
-    @staticmethod
-    @abstractmethod
-    def get_recipe_path() -> Optional[Path]: ...
+    @property
+    def history(self) -> ImageHistory:
+        max_age_days = self.config.container_snapshots_max_age_days
+        return ImageHistory(
+            self.pyvem_dir,
+            self.repository_name,
+            self.tag_name,
+            keep=self.config.container_snapshots_keep,
+            max_age=max_age_days * 24 * 60 * 60 if max_age_days is not None else None,
+        )
 
-    @staticmethod
-    def _is_in_repository(repository_name: str, image: Image) -> bool:
-        return any(repository_name in repo for repo in image.tags)
+    @cached_property
+    def pool(self) -> ContainerPool:
+        return ContainerPool(
+            self.container_handler,
+            self.pyvem_dir,
+            size=self.config.container_pool_size,
+            max_uses=self.config.container_pool_max_uses,
+            idle_timeout=self.config.container_pool_idle_timeout,
+        )
+
+    @classmethod
+    @abstractmethod
+    def get_recipe_path(cls) -> Optional[Path]: ...
 
     @cached_property
     def _repositories(self) -> list[Image]:
-        result = []
-        for image in self.client.images.list(all=True):
-            if self._is_in_repository(self.project_name, image):
-                result.append(image)
-
-        return result
+        """
+        Images of the repository, filtered by their label in the engine.
+        """
+        return self.client.images.list(filters=repository_filter(self.repository_name))
 
     @abstractmethod
     def install(
@@ -63,60 +92,42 @@ class LinuxDistro(ABC, PyVem):
         dependencies: Optional[list[str]],
         package: Optional[str],
         recipe: Optional[Path],
-    ) -> int: ...
+        position: int = 1,
+        print_logs: bool = True,
+    ) -> int:
+        """
+        Install dependencies to the image of the repository.
+
+        Args:
+            dependencies: Extra packages to install.
+            package: Package whose dependencies are installed.
+            recipe: Recipe file to obtain dependencies from.
+            position: Line of the progress bar, builds running at once need
+                different ones.
+            print_logs: Print output of the commands.
+        """
 
     @abstractmethod
     def update(self, packages: Optional[list[str]]) -> int: ...
 
-    def _try_to_filter_one_from_repositories(
-        self, repository_name: str
-    ) -> Optional[Image]:
-        one = []
-        for image in self._repositories:
-            if image.tag() == repository_name:
-                one.append(image)
-
-        if len(one) == 1:
-            return one[0]
-
-        return None
-
     def _get_image(self, safe: bool = True) -> Optional[Image]:
-        if not self._repositories:
-            if safe:
-                raise PyVemContainerException(
-                    "No image repository for this project found"
-                )
-
-            return None
-
-        if len(self._repositories) == 1:
-            return self._repositories[0]
-
-        if self.repository_name is None:
-            one = self._try_to_filter_one_from_repositories(self.project_name)
-            if one is None:
-                raise PyVemContainerException(MANY_IMAGES)
-            return one
-
+        name = f"{self.repository_name}:{self.tag_name}"
         for image in self._repositories:
-            if image.name == self.repository_name:
+            if name in map(normalize_tag, image.tags):
                 return image
 
         if safe:
-            raise PyVemContainerException(
-                f"No container found with name {self.repository_name}"
-            )
+            raise PyVemContainerException(f"No image found with name {name}")
+
         return None
 
     def execute(self, user: str, container_name: str, command: str) -> str:
         container = self.client.containers.get(container_name)
-        result = container.exec_run(cmd=command, user=user)
-        return result.output
+        return exec_in_container(container, command, user=user).stdout
 
     def keep_running(self, container_name: Optional[str] = None) -> None:
         image = self._get_image()
-        kwargs = {"image": image, "detach": True}
+        kwargs = {"image": image, "command": SESSION_COMMAND, "detach": True}
         if container_name is not None:
             kwargs["name"] = container_name
 
@@ -131,8 +142,30 @@ class LinuxDistro(ABC, PyVem):
         container.stop()
 
     def remove(self) -> None:
-        image = self._get_image()
-        self.client.images.remove(image.id)
+        """
+        Remove the image of the repository with its snapshots and history.
+
+        Removed by name, each snapshot tags the image as well and the engine
+        refuses to remove an image with many tags by its id.
+        """
+        name = f"{self.repository_name}:{self.tag_name}"
+        if self._get_image(safe=False) is not None:
+            try:
+                self.client.images.remove(name)
+            except (DockerAPIError, PodmanAPIError) as exc:
+                raise PyVemContainerException(
+                    f"Unable to remove {name}, is it used by a container? {exc}"
+                ) from exc
+        elif not self.history.snapshots():
+            raise PyVemContainerException(f"No image found with name {name}")
+
+        kept = self.history.remove(self.client)
+        if kept:
+            tags = ", ".join(snapshot.tag for snapshot in kept)
+            raise PyVemContainerException(
+                f"Snapshots {tags} of {name} are used by containers, remove them"
+                " and run delete again"
+            )
 
     def delete(self) -> None:
         container = self._get_image(safe=False)
@@ -144,14 +177,35 @@ class LinuxDistro(ABC, PyVem):
     def repositories(self) -> list[str]:
         result = []
         for image in self._repositories:
-            for repo in image.tags:
-                if self.repository_name in repo:
-                    result.append(repo)
-
-        return result
-
-    def run(self, command: list[str]) -> None:
-        self.container_handler.command(command)
+            for tag in map(normalize_tag, image.tags):
+                if parse_repository_name(tag)[0] == self.repository_name:
+                    result.append(tag)
+
+        return sorted(result)
+
+    def run_pooled(
+        self, command: list[str], user: Optional[str] = None, commit: bool = False
+    ) -> int:
+        """
+        Run command in a warm container of the pool.
+
+        Args:
+            command: Command to run.
+            user: User the command runs as.
+            commit: Commit the container to the image if the command succeeds,
+                the pool recycles the container then.
+
+        Returns:
+            Exit code of the command.
+        """
+        handler = self.container_handler
+        with self.pool.lease(refill=not commit) as container:
+            session = ContainerSession(container, user, log_path=handler.log_path)
+            retval, _ = session.command(command, raise_on_fail=False)
+            if commit and retval == SUCCESS:
+                handler.commit(container, shlex.join(command))
+
+        return retval
 
     def enter(self, user: str, container_name: str) -> int:
         if isinstance(self.client, PodmanClient):
@@ -174,18 +228,11 @@ class LinuxDistro(ABC, PyVem):
         return child.exitstatus
 
     def info(self) -> str:
-        containers = []
-        for container in self.client.containers.list():
-            image_name = nested_get(container.attrs, "Config", "Image")
-            image = self.client.images.get(image_name)
-            if self._is_in_repository(self.repository_name, image):
-                containers.append(container)
-
+        # containers inherit labels of the image they run
+        containers = self.client.containers.list(
+            filters=repository_filter(self.repository_name)
+        )
         if not containers:
             return f"No running containers for tag {self.repository_name}"
 
-        result = []
-        for container in containers:
-            result.append(container.id)
-
-        return "\n".join(result)
+        return "\n".join(container.id for container in containers)
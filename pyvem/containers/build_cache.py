@@ -0,0 +1,186 @@
+"""
+Cache of build steps, a step being a command committed to an image.
+
+A step run again on the same parent image with the same command and inputs
+makes the same image, so its result is remembered under a key made of those
+and the image it committed is reused instead of starting a container. The
+repository is part of the key too, committed images carry the label of their
+repository and images of other repositories are never found by it. Keys
+are kept in a JSON index in pyvem dir and in a label of the committed image,
+the label finds the image even when the index doesn't know it.
+"""
+
+import shlex
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from hashlib import sha256
+from pathlib import Path
+from typing import Any, Iterator, Optional, Sequence, Union
+
+from docker.errors import ImageNotFound as DockerImageNotFound
+from podman.errors import ImageNotFound as PodmanImageNotFound
+
+from pyvem.constants import BUILD_CACHE_DIR, BUILD_CACHE_MAX_AGE, LABEL_STEP
+from pyvem.spells import locked_json
+from pyvem.typedefs import ContainerClient, Image
+
+# output of a step kept in the index, shown again when the step is reused
+_MAX_CACHED_OUTPUT = 64 * 1024
+
+
+def step_cache_key(
+    repository: str,
+    parent_id: str,
+    command: Union[list[str], str],
+    inputs: Sequence[Path] = (),
+) -> str:
+    """
+    Args:
+        repository: Repository the step commits to.
+        parent_id: Id of the image the step runs on.
+        command: Command of the step, strings are split like shell does so
+            whitespace doesn't make a difference.
+        inputs: Files the step reads from the host.
+    """
+    args = shlex.split(command) if isinstance(command, str) else list(command)
+    key = sha256(f"{repository}\n{parent_id}\n".encode())
+    key.update("\0".join(args).encode())
+    for path in inputs:
+        key.update(b"\ninput:" + sha256(path.read_bytes()).digest())
+
+    return key.hexdigest()
+
+
+@dataclass
+class BuildStep:
+    key: str
+    # printable command of the step
+    command: str
+    parent_id: str
+
+
+@dataclass
+class BuildCacheEntry:
+    image_id: str
+    parent_id: str
+    command: str
+    output: str = ""
+    created: float = field(default_factory=time.time)
+    last_used: float = field(default_factory=time.time)
+    hits: int = 0
+
+
+@dataclass
+class BuildCacheStats:
+    entries: int
+    hits: int
+    misses: int
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class BuildCache:
+    def __init__(self, pyvem_dir: Path) -> None:
+        self.path = pyvem_dir / BUILD_CACHE_DIR
+        self.index_path = self.path / "index.json"
+
+    @contextmanager
+    def _index(self) -> Iterator[dict[str, Any]]:
+        # pyvem processes and threads building at once share the index
+        with locked_json(self.index_path) as index:
+            index.setdefault("entries", {})
+            index.setdefault("hits", 0)
+            index.setdefault("misses", 0)
+            yield index
+
+    @staticmethod
+    def _get_image(client: ContainerClient, image_id: str) -> Optional[Image]:
+        try:
+            return client.images.get(image_id)
+        except (DockerImageNotFound, PodmanImageNotFound):
+            return None
+
+    @staticmethod
+    def _find_labeled(client: ContainerClient, key: str) -> Optional[Image]:
+        images = client.images.list(filters={"label": [f"{LABEL_STEP}={key}"]})
+        return images[0] if images else None
+
+    def find(self, client: ContainerClient, key: str) -> Optional[tuple[Image, str]]:
+        """
+        Image the step committed and output of the step, None if the step
+        never ran or its image is gone.
+        """
+        with self._index() as index:
+            entry = index["entries"].get(key)
+            image = None
+            if entry is not None:
+                image = self._get_image(client, entry["image_id"])
+
+            if image is None:
+                # images keep the key even if the index was removed
+                image = self._find_labeled(client, key)
+
+            if image is None or image.labels.get(LABEL_STEP) != key:
+                index["entries"].pop(key, None)
+                index["misses"] += 1
+                return None
+
+            if entry is None:
+                entry = asdict(BuildCacheEntry(image.id, "", ""))
+                index["entries"][key] = entry
+
+            entry["image_id"] = image.id
+            entry["last_used"] = time.time()
+            entry["hits"] += 1
+            index["hits"] += 1
+            return image, entry["output"]
+
+    def record(self, step: BuildStep, image_id: str, output: str = "") -> None:
+        entry = BuildCacheEntry(
+            image_id=image_id,
+            parent_id=step.parent_id,
+            command=step.command,
+            output=output[-_MAX_CACHED_OUTPUT:],
+        )
+        with self._index() as index:
+            index["entries"][step.key] = asdict(entry)
+            self._prune(index)
+
+    def drop_missing(self, client: ContainerClient) -> int:
+        """
+        Forget entries of images the engine no longer has.
+
+        Returns:
+            Number of dropped entries.
+        """
+        with self._index() as index:
+            missing = [
+                key
+                for key, entry in index["entries"].items()
+                if self._get_image(client, entry["image_id"]) is None
+            ]
+            for key in missing:
+                del index["entries"][key]
+
+        return len(missing)
+
+    @staticmethod
+    def _prune(index: dict[str, Any], max_age: float = BUILD_CACHE_MAX_AGE) -> None:
+        oldest = time.time() - max_age
+        index["entries"] = {
+            key: entry
+            for key, entry in index["entries"].items()
+            if entry["last_used"] >= oldest
+        }
+
+    def stats(self) -> BuildCacheStats:
+        with self._index() as index:
+            return BuildCacheStats(
+                entries=len(index["entries"]),
+                hits=index["hits"],
+                misses=index["misses"],
+            )
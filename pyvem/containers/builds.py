@@ -0,0 +1,193 @@
+"""
+Images of one project built from several base images at once, each build in
+its own thread with its own container handler and progress bar line.
+
+Builds spend their time waiting for the container engine, so threads are
+enough to run them side by side and they share the engine client.
+"""
+
+import re
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Type
+
+from tqdm import tqdm
+
+from pyvem.config import Config
+from pyvem.constants import DUPLICATE_BUILD_TAGS, FAILURE, SUCCESS
+from pyvem.containers.base import LinuxDistro
+from pyvem.containers.build_cache import BuildCache
+from pyvem.containers.client import get_container_client
+from pyvem.containers.handler import IMAGE_STATE, ContainerHandler
+from pyvem.exceptions import PyVemContainerException, PyVemException
+from pyvem.spells import format_table, parse_repository_name
+
+
+@dataclass
+class BuildTarget:
+    # base image pulled from the registry, e.g. fedora:40
+    image_name: str
+    # repository:tag the image is built to
+    repository_name: str
+
+
+@dataclass
+class BuildResult:
+    target: BuildTarget
+    retval: int
+    duration: float
+    error: Optional[str] = None
+
+
+def _tag_for_image(image_name: str) -> str:
+    # registry.fedoraproject.org/fedora:40 -> fedora-40
+    return re.sub(r"[^A-Za-z0-9_.-]+", "-", image_name.rsplit("/", 1)[-1])
+
+
+def build_targets(repository_name: str, images: list[str]) -> list[BuildTarget]:
+    """
+    Pair base images with tags of the repository they are built to.
+
+    Args:
+        repository_name: Repository of the project, with tag used when only
+            one image is built.
+        images: Base images, each optionally followed by `=TAG`, otherwise
+            the tag is made of the image name.
+    """
+    repository, tag = parse_repository_name(repository_name)
+    targets = []
+    for image in images:
+        image_name, sep, image_tag = image.partition("=")
+        if not sep:
+            image_tag = tag if len(images) == 1 else _tag_for_image(image_name)
+
+        targets.append(BuildTarget(image_name, f"{repository}:{image_tag}"))
+
+    by_repository: dict[str, list[str]] = {}
+    for target in targets:
+        by_repository.setdefault(target.repository_name, []).append(target.image_name)
+
+    for repository_name, image_names in by_repository.items():
+        if len(image_names) > 1:
+            raise PyVemContainerException(
+                DUPLICATE_BUILD_TAGS.format(
+                    images=", ".join(image_names), tag=repository_name
+                )
+            )
+
+    return targets
+
+
+def build_image(
+    c_object: Type[LinuxDistro],
+    config: Config,
+    target: BuildTarget,
+    dependencies: Optional[list[str]],
+    package: Optional[str],
+    recipe: Optional[Path],
+    position: int = 1,
+    print_logs: bool = True,
+) -> BuildResult:
+    """
+    Pull the base image, tag it to the repository and install dependencies
+    to it, errors are reported in the result instead of raised.
+    """
+    start = time.monotonic()
+    error = None
+    try:
+        client = get_container_client(config.use_podman_engine)
+        repository, tag = parse_repository_name(target.repository_name)
+        build_cache = None
+        if config.container_build_cache:
+            build_cache = BuildCache(config.path_to_pyvem_dir)
+
+        ContainerHandler(
+            target.image_name,
+            client,
+            IMAGE_STATE,
+            project_path=Path.cwd(),
+            build_cache=build_cache,
+        ).tag(repository, tag)
+        retval = c_object(
+            repository_name=target.repository_name, config=config
+        ).install(
+            dependencies, package, recipe, position=position, print_logs=print_logs
+        )
+    except (PyVemException, PyVemContainerException) as exc:
+        error = str(exc)
+        retval = FAILURE
+    except Exception:
+        error = traceback.format_exc()
+        retval = FAILURE
+
+    return BuildResult(
+        target=target,
+        retval=retval,
+        duration=time.monotonic() - start,
+        error=error,
+    )
+
+
+def build_images(
+    c_object: Type[LinuxDistro],
+    config: Config,
+    targets: list[BuildTarget],
+    dependencies: Optional[list[str]],
+    package: Optional[str],
+    recipe: Optional[Path],
+) -> list[BuildResult]:
+    """
+    Build all the targets at once, see `build_image`.
+
+    Output of commands is printed only when there is a single build, output
+    of builds running side by side would be interleaved.
+
+    Returns:
+        Results in the order of targets.
+    """
+    if len(targets) == 1:
+        return [
+            build_image(c_object, config, targets[0], dependencies, package, recipe)
+        ]
+
+    # the lock must exist before the threads create their bars
+    tqdm.get_lock()
+    with ThreadPoolExecutor(max_workers=len(targets)) as executor:
+        futures = [
+            executor.submit(
+                build_image,
+                c_object,
+                config,
+                target,
+                dependencies,
+                package,
+                recipe,
+                position=position,
+                print_logs=False,
+            )
+            for position, target in enumerate(targets, start=1)
+        ]
+
+    return [future.result() for future in futures]
+
+
+def format_report(results: list[BuildResult]) -> str:
+    header = ("IMAGE", "REPOSITORY", "RESULT", "DURATION")
+    rows = [
+        (
+            result.target.image_name,
+            result.target.repository_name,
+            "OK" if result.retval == SUCCESS else f"FAILED ({result.retval})",
+            f"{result.duration:.1f}s",
+        )
+        for result in results
+    ]
+    report = format_table(header, rows)
+    for result in results:
+        if result.error:
+            report += f"\n\n{result.target.repository_name}: {result.error.strip()}"
+
+    return report
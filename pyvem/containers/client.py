@@ -0,0 +1,127 @@
+"""
+Container engine clients shared by the whole process.
+
+A client keeps its HTTP connections to the engine alive, so creating a new one
+for every handler means new connections for every API call. Clients are pooled
+per engine and socket instead and closed when the process exits.
+"""
+
+import atexit
+import logging
+import os
+import socket
+import threading
+from typing import Optional
+
+from docker import DockerClient
+from podman import PodmanClient
+
+from pyvem.constants import (
+    CONTAINER_POOL_SIZE,
+    DOCKER_URI,
+    NO_CONTAINER_ENGINE,
+    PODMAN_ROOT_URI,
+    PODMAN_URI,
+)
+from pyvem.exceptions import PyVemContainerException
+from pyvem.typedefs import ContainerClient
+
+logger = logging.getLogger(__name__)
+
+_clients: dict[tuple[bool, str], ContainerClient] = {}
+# engine detected for each `use_podman` value, sockets are probed only once
+_detected: dict[Optional[bool], tuple[bool, str]] = {}
+_clients_lock = threading.Lock()
+
+
+def _socket_path(uri: str) -> str:
+    return "/" + uri.removeprefix("unix://").lstrip("/")
+
+
+def is_socket_live(uri: str, timeout: float = 0.5) -> bool:
+    """
+    Whether something accepts connections on the unix socket of the URI.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        try:
+            sock.connect(_socket_path(uri))
+        except OSError:
+            return False
+
+    return True
+
+
+def _podman_uris() -> list[str]:
+    uris = [PODMAN_URI.format(uid=os.getuid())]
+    if os.getuid() == 0:
+        uris.append(PODMAN_ROOT_URI)
+
+    return uris
+
+
+def detect_engine(use_podman: Optional[bool] = None) -> tuple[bool, str]:
+    """
+    Find socket of a running container engine.
+
+    Args:
+        use_podman: Look only for podman (True) or docker (False), None means
+            podman if its socket is live, docker otherwise.
+
+    Returns:
+        Whether the engine is podman and URI of its socket.
+    """
+    candidates = []
+    if use_podman is not False:
+        candidates += [(True, uri) for uri in _podman_uris()]
+
+    if use_podman is not True:
+        candidates.append((False, DOCKER_URI))
+
+    for candidate in candidates:
+        if is_socket_live(candidate[1]):
+            return candidate
+
+    raise PyVemContainerException(
+        NO_CONTAINER_ENGINE.format(sockets=", ".join(uri for _, uri in candidates))
+    )
+
+
+@atexit.register
+def _close_clients() -> None:
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+
+        _clients.clear()
+        _detected.clear()
+
+
+def get_container_client(use_podman: Optional[bool] = None) -> ContainerClient:
+    """
+    Client of the container engine, the same one for the whole process.
+
+    Args:
+        use_podman: Use podman (True) or docker (False), None picks the engine
+            with live socket, see `detect_engine`.
+
+    Returns:
+        Docker or podman client.
+    """
+    with _clients_lock:
+        if use_podman not in _detected:
+            _detected[use_podman] = detect_engine(use_podman)
+
+        is_podman, uri = _detected[use_podman]
+        client = _clients.get((is_podman, uri))
+        if client is not None:
+            return client
+
+        logger.debug(f"Connecting to {'podman' if is_podman else 'docker'} at {uri}")
+        if is_podman:
+            client = PodmanClient(base_url=uri, max_pool_size=CONTAINER_POOL_SIZE)
+        else:
+            client = DockerClient(base_url=uri, max_pool_size=CONTAINER_POOL_SIZE)
+
+        _clients[(is_podman, uri)] = client
+        return client
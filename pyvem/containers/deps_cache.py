@@ -0,0 +1,80 @@
+"""
+Cache of dependencies dnf resolved for spec files and packages.
+
+Resolving means installing the builddep plugin and running dnf in a container,
+which takes longer than anything else in `pyvem container install`. The result
+depends only on the spec file (or package name), the image it was resolved in
+and the state of the repositories, so it is stored in pyvem dir under a key
+made of those and reused while none of them changes.
+"""
+
+import json
+import os
+import time
+from hashlib import sha256
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import Optional
+
+from pyvem.constants import DEPS_CACHE_DIR, DEPS_CACHE_MAX_AGE
+
+
+def deps_cache_key(
+    image_id: str,
+    repos_state: str,
+    spec: Optional[Path] = None,
+    package: Optional[str] = None,
+) -> str:
+    """
+    Args:
+        image_id: Id (digest) of the image dependencies are resolved in.
+        repos_state: Anything changing when metadata of the repositories do.
+        spec: Spec file the dependencies are resolved for.
+        package: Package the dependencies are resolved for.
+    """
+    key = sha256(f"{image_id}\n{repos_state}\n".encode())
+    if package:
+        key.update(f"package:{package}".encode())
+    elif spec is not None:
+        key.update(b"spec:" + sha256(spec.read_bytes()).digest())
+
+    return key.hexdigest()
+
+
+class DependencyCache:
+    def __init__(self, pyvem_dir: Path) -> None:
+        self.path = pyvem_dir / DEPS_CACHE_DIR
+
+    def get(self, key: str) -> Optional[list[str]]:
+        entry = self.path / f"{key}.json"
+        try:
+            dependencies = json.loads(entry.read_text())["dependencies"]
+            # used entries are kept by prune
+            os.utime(entry)
+        except (OSError, ValueError, KeyError):
+            return None
+
+        return dependencies
+
+    def put(self, key: str, dependencies: list[str]) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        with NamedTemporaryFile(
+            "w", dir=self.path, suffix=".tmp", delete=False
+        ) as tmp_file:
+            json.dump({"dependencies": dependencies}, tmp_file)
+
+        os.replace(tmp_file.name, self.path / f"{key}.json")
+        self.prune()
+
+    def prune(self, max_age: float = DEPS_CACHE_MAX_AGE) -> None:
+        """
+        Remove entries not used for max_age seconds, repositories move on so
+        their keys would never match again.
+        """
+        oldest = time.time() - max_age
+        for entry in self.path.glob("*.json"):
+            try:
+                if entry.stat().st_mtime < oldest:
+                    entry.unlink()
+            except FileNotFoundError:
+                continue
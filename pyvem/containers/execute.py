@@ -0,0 +1,199 @@
+"""
+Commands executed in running containers via the exec API of the engine.
+
+`exec_run` of the clients either waits for the whole output, or streams it but
+never tells the exit code. Here the exec instance is driven through the API
+directly: stdout and stderr are streamed separately as they come and the exit
+code is read from the exec instance once its output ends.
+"""
+
+import json
+import shlex
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Iterator, Optional, TextIO, Union
+
+from podman.api import stream_frames
+from podman.domain.containers import Container as PodmanContainer
+
+from pyvem.cmd import LineCallback, OutputStream
+from pyvem.constants import EXEC_KILL_GRACE, MAX_CAPTURED_OUTPUT
+from pyvem.exceptions import PyVemContainerException
+from pyvem.typedefs import Container
+
+# (stdout, stderr) chunks of the exec output, either may be None
+_Frames = Iterator[tuple[Optional[bytes], Optional[bytes]]]
+# exit code and whether the exec instance still runs
+_Inspect = Callable[[], tuple[Optional[int], bool]]
+
+# exit codes of `timeout` when it had to terminate (124) or kill (137) the command
+_TIMEOUT_EXIT_CODES = (124, 137)
+
+
+@dataclass
+class ExecResult:
+    retval: int
+    stdout: str
+    stderr: str
+
+
+def _start_docker_exec(
+    container: Container, args: list[str], user: Optional[str], workdir: Optional[str]
+) -> tuple[_Frames, _Inspect]:
+    api = container.client.api
+    exec_id = api.exec_create(
+        container.id, args, stdout=True, stderr=True, user=user or "", workdir=workdir
+    )["Id"]
+    frames = api.exec_start(exec_id, stream=True, demux=True)
+
+    def inspect() -> tuple[Optional[int], bool]:
+        state = api.exec_inspect(exec_id)
+        return state.get("ExitCode"), bool(state.get("Running"))
+
+    return frames, inspect
+
+
+def _start_podman_exec(
+    container: Container, args: list[str], user: Optional[str], workdir: Optional[str]
+) -> tuple[_Frames, _Inspect]:
+    client = container.client
+    data: dict[str, Any] = {
+        "AttachStdout": True,
+        "AttachStderr": True,
+        "Cmd": args,
+        "WorkingDir": workdir,
+    }
+    if user:
+        data["User"] = user
+
+    response = client.post(f"/containers/{container.id}/exec", data=json.dumps(data))
+    response.raise_for_status()
+    exec_id = response.json()["Id"]
+    start = client.post(
+        f"/exec/{exec_id}/start",
+        data=json.dumps({"Detach": False, "Tty": False}),
+        stream=True,
+    )
+    start.raise_for_status()
+
+    def inspect() -> tuple[Optional[int], bool]:
+        state = client.get(f"/exec/{exec_id}/json")
+        state.raise_for_status()
+        content = state.json()
+        return content.get("ExitCode"), bool(content.get("Running"))
+
+    return stream_frames(start, demux=True), inspect
+
+
+def _drain(
+    frames: _Frames,
+    stdout: OutputStream,
+    stderr: OutputStream,
+    errors: list[BaseException],
+) -> None:
+    try:
+        for stdout_chunk, stderr_chunk in frames:
+            if stdout_chunk:
+                stdout.feed(stdout_chunk)
+            if stderr_chunk:
+                stderr.feed(stderr_chunk)
+    except BaseException as exc:
+        errors.append(exc)
+    finally:
+        stdout.feed(b"")
+        stderr.feed(b"")
+
+
+def _wait_for_exit_code(inspect: _Inspect, timeout: float = 5.0) -> int:
+    # the output may end a moment before the engine notices the process exited
+    deadline = time.monotonic() + timeout
+    while True:
+        retval, running = inspect()
+        if retval is not None and not running:
+            return retval
+
+        if time.monotonic() > deadline:
+            raise PyVemContainerException("Exit code of the exec never appeared")
+
+        time.sleep(0.05)
+
+
+def exec_in_container(
+    container: Container,
+    command: Union[list[str], str],
+    user: Optional[str] = None,
+    workdir: Optional[str] = None,
+    timeout: Optional[float] = None,
+    stdout_callback: Optional[LineCallback] = None,
+    stderr_callback: Optional[LineCallback] = None,
+    max_captured_output: int = MAX_CAPTURED_OUTPUT,
+    log_file: Optional[TextIO] = None,
+) -> ExecResult:
+    """
+    Execute command in the running container, works with docker and podman.
+
+    Args:
+        container: Running container.
+        command: Command as list of arguments or a string split like shell does.
+        user: User to run the command as.
+        workdir: Working directory of the command.
+        timeout: Seconds after which the command is killed and
+            PyVemContainerException raised.
+        stdout_callback: Called with each line of stdout as it comes.
+        stderr_callback: Called with each line of stderr as it comes.
+        max_captured_output: Characters of each stream kept in the result.
+        log_file: Whole output of the command is written to it.
+
+    Returns:
+        Exit code of the command, its stdout and stderr.
+    """
+    args = shlex.split(command) if isinstance(command, str) else list(command)
+    printable = " ".join(args)
+    if timeout is not None:
+        # the engine can't kill exec instances, so it's done inside the container
+        args = ["timeout", "--kill-after", str(EXEC_KILL_GRACE), str(timeout)] + args
+
+    if isinstance(container, PodmanContainer):
+        frames, inspect = _start_podman_exec(container, args, user, workdir)
+    else:
+        frames, inspect = _start_docker_exec(container, args, user, workdir)
+
+    stdout = OutputStream(
+        None,
+        [stdout_callback] if stdout_callback else [],
+        log_file,
+        max_captured_output,
+    )
+    stderr = OutputStream(
+        None,
+        [stderr_callback] if stderr_callback else [],
+        log_file,
+        max_captured_output,
+    )
+    errors: list[BaseException] = []
+    start = time.monotonic()
+    reader = threading.Thread(
+        target=_drain, args=(frames, stdout, stderr, errors), daemon=True
+    )
+    reader.start()
+    # the reader outlives the timeout only if the engine stops responding
+    reader.join(None if timeout is None else timeout + 2 * EXEC_KILL_GRACE)
+    if reader.is_alive():
+        raise PyVemContainerException(f"Command {printable} stopped responding")
+
+    if errors:
+        raise errors[0]
+
+    retval = _wait_for_exit_code(inspect)
+    timed_out = timeout is not None and time.monotonic() - start >= timeout
+    if timed_out and retval in _TIMEOUT_EXIT_CODES:
+        raise PyVemContainerException(
+            f"Command {printable} timed out after {timeout} s"
+        )
+
+    return ExecResult(
+        retval=retval,
+        stdout=stdout.buffer.getvalue(),
+        stderr=stderr.buffer.getvalue(),
+    )
@@ -0,0 +1,58 @@
+"""
+Removing what pyvem leaves behind in the container engine.
+
+Build containers of commands killed before they could clean up, and images
+untagged by following commits, are found by their labels, so nothing pyvem
+didn't create is ever touched. The engine prunes them itself and tells how
+much space it freed.
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+
+from pyvem.constants import BUILD_ROLE, LABEL_REPOSITORY, LABEL_ROLE, POOL_ROLE
+from pyvem.containers.build_cache import BuildCache
+from pyvem.typedefs import ContainerClient
+
+
+@dataclass
+class GarbageReport:
+    containers: int = 0
+    images: int = 0
+    cache_entries: int = 0
+    space_reclaimed: int = 0
+
+
+def collect_garbage(
+    client: ContainerClient, pyvem_dir: Path, running: bool = False
+) -> GarbageReport:
+    """
+    Remove stopped build and pooled containers, dangling pyvem images and build cache
+    entries of images which are gone.
+
+    Args:
+        client: Docker or podman client.
+        pyvem_dir: Where the build cache is.
+        running: Also remove running build containers, they may belong to
+            builds in progress.
+    """
+    report = GarbageReport()
+    if running:
+        build_containers = {"label": f"{LABEL_ROLE}={BUILD_ROLE}"}
+        for container in client.containers.list(filters=build_containers):
+            container.remove(force=True)
+            report.containers += 1
+
+    # pooled containers are only garbage once stopped, pool drops them itself
+    for role in (BUILD_ROLE, POOL_ROLE):
+        pruned = client.containers.prune(filters={"label": f"{LABEL_ROLE}={role}"})
+        report.containers += len(pruned.get("ContainersDeleted") or [])
+        report.space_reclaimed += pruned.get("SpaceReclaimed") or 0
+
+    # parents of other images are never dangling, layer chains stay intact
+    pruned = client.images.prune(filters={"dangling": True, "label": LABEL_REPOSITORY})
+    report.images += len(pruned.get("ImagesDeleted") or [])
+    report.space_reclaimed += pruned.get("SpaceReclaimed") or 0
+
+    report.cache_entries = BuildCache(pyvem_dir).drop_missing(client)
+    return report
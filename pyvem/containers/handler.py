@@ -1,15 +1,47 @@
+import io
+import shlex
+import tarfile
 from abc import ABC, abstractmethod
+from contextlib import contextmanager, nullcontext
+from copy import copy
+from pathlib import Path
+from typing import ContextManager, Iterator, Optional, Sequence, TextIO, Union
 
 from docker.errors import ImageNotFound as DockerImageNotFound
+from podman import PodmanClient
 from podman.errors import ImageNotFound as PodmanImageNotFound
 from tqdm import tqdm
 
-from pyvem.constants import SUCCESS
+from pyvem.cmd import OutputStream
+from pyvem.constants import (
+    BUILD_ROLE,
+    LABEL_ROLE,
+    LABEL_STEP,
+    MAX_CAPTURED_OUTPUT,
+    SESSION_COMMAND,
+    SUCCESS,
+)
+from pyvem.containers.build_cache import BuildCache, BuildStep, step_cache_key
+from pyvem.containers.execute import exec_in_container
+from pyvem.containers.history import ImageHistory
+from pyvem.containers.labels import label_changes, pyvem_labels
+from pyvem.containers.logs import (
+    CoalescedLines,
+    command_log,
+    failure_message,
+    repository_log_path,
+)
+from pyvem.containers.pkg_cache import PackageCache
+from pyvem.containers.squash import config_changes, import_image
 from pyvem.exceptions import PyVemContainerException
 from pyvem.spells import parse_repository_name
 from pyvem.typedefs import Container, ContainerClient, Image
 
 
+def _printable(command: Union[list[str], str]) -> str:
+    return command if isinstance(command, str) else shlex.join(command)
+
+
 class State(ABC):
     @property
     def handler(self) -> "ContainerHandler":
@@ -23,7 +55,7 @@ class State(ABC):
     def _get_image(self, repository_name: str, tag_name: str) -> Image: ...
 
     @abstractmethod
-    def tag(self, repository: str) -> None: ...
+    def tag(self, repository: str, tag_name: str = "latest") -> None: ...
 
     @abstractmethod
     def command(
@@ -34,27 +66,86 @@ class State(ABC):
         raise_on_fail: bool = True,
     ) -> tuple[int, str]: ...
 
-    @staticmethod
+    def _session_container(
+        self, commit: bool, cache_root: Optional[Path] = None
+    ) -> tuple[Container, bool]:
+        """
+        Container commands of a session run in, a created one has the package
+        cache checkout under cache_root mounted.
+
+        Returns:
+            Container and whether it was created for the session and should be
+            removed at its end.
+        """
+        container = self._create_container(SESSION_COMMAND, cache_root=cache_root)
+        container.start()
+        return container, True
+
+    def _create_container(
+        self,
+        command: list[str],
+        role: str = BUILD_ROLE,
+        cache_root: Optional[Path] = None,
+    ) -> Container:
+        """
+        Container of the image running the command, labeled with its role and
+        with the package cache checkout under cache_root mounted if given.
+        """
+        kwargs = {"labels": {**self.handler.labels, LABEL_ROLE: role}}
+        if cache_root is not None:
+            kwargs["volumes"] = PackageCache.volumes(
+                cache_root, isinstance(self.handler._client, PodmanClient)
+            )
+
+        return self.handler._client.containers.create(
+            image=self.handler._image, command=command, detach=True, **kwargs
+        )
+
+    def _commit(self, container: Container, command: str = "") -> None:
+        parent_id = self.handler.image_id
+        # following commands run on the committed image
+        self.handler._image = container.commit(
+            repository=self.handler._repository_name,
+            tag=self.handler._tag_name,
+            changes=label_changes(self.handler.labels),
+        )
+        self.handler._snapshot(parent_id, command)
+
     def _collect_outputs_from_container(
+        self,
         container: Container,
         command: list[str],
         print_logs: bool = True,
         raise_on_fail: bool = True,
     ) -> tuple[int, str]:
-        stdout_lines = []
-        for line in container.logs(stream=True):
-            stripped = line.decode().strip()
-            stdout_lines.append(stripped)
-            if print_logs:
-                tqdm.write(stripped)
+        # chunks of the log stream split lines and even characters
+        terminal = CoalescedLines() if print_logs else None
+        with self.handler.command_log(_printable(command)) as log_file:
+            stream = OutputStream(
+                None, [terminal] if terminal else [], log_file, MAX_CAPTURED_OUTPUT
+            )
+            for chunk in container.logs(stream=True):
+                stream.feed(chunk)
+
+            stream.feed(b"")
+
+        if terminal is not None:
+            terminal.flush()
 
         retval = container.wait()
+        # docker tells the exit code in a dict, podman as it is
+        if isinstance(retval, dict):
+            retval = retval["StatusCode"]
+
+        output = stream.buffer.getvalue()
         if raise_on_fail and retval != SUCCESS:
             raise PyVemContainerException(
-                f"Command {''.join(command)} failed with code: {retval}"
+                failure_message(
+                    _printable(command), retval, output, self.handler.log_path
+                )
             )
 
-        return retval, "\n".join(stdout_lines)
+        return retval, output.strip()
 
     def _collect_outputs_from_container_and_commit(
         self,
@@ -68,7 +159,7 @@ class State(ABC):
             container, command, print_logs, raise_on_fail
         )
         if commit:
-            container.commit(repository=self.handler._repository_name, tag="latest")
+            self._commit(container, _printable(command))
 
         return retval, output
 
@@ -82,8 +173,8 @@ class RepositoryContainerHandlerState(State):
                 f"No repository found under name {repository_name}"
             ) from exc
 
-    def tag(self, repository: str) -> None:
-        self.handler._image.tag(repository, tag="latest")
+    def tag(self, repository: str, tag_name: str = "latest") -> None:
+        self.handler._image.tag(repository, tag=tag_name)
 
     def command(
         self,
@@ -92,23 +183,21 @@ class RepositoryContainerHandlerState(State):
         print_logs: bool = True,
         raise_on_fail: bool = True,
     ) -> tuple[int, str]:
-        container = self.handler._client.containers.create(
-            image=self.handler._image, command=command, detach=True
-        )
-        container.start()
-
-        retval, output = self._collect_outputs_from_container_and_commit(
-            container=container,
-            command=command,
-            commit=commit,
-            print_logs=print_logs,
-            raise_on_fail=raise_on_fail,
-        )
-
-        if container.status == "running":
-            container.stop()
+        with self.handler.package_cache_checkout() as cache_root:
+            container = self._create_container(command, cache_root=cache_root)
+            # removed even when the command fails, force stops it if still running
+            try:
+                container.start()
+                retval, output = self._collect_outputs_from_container_and_commit(
+                    container=container,
+                    command=command,
+                    commit=commit,
+                    print_logs=print_logs,
+                    raise_on_fail=raise_on_fail,
+                )
+            finally:
+                container.remove(force=True)
 
-        container.remove()
         return retval, output
 
 
@@ -117,8 +206,14 @@ class ContainerHandlerState(State):
         # TODO: they have
         raise PyVemContainerException("Container don't have repo or image")
 
-    def tag(self, repository: str) -> None:
-        self.handler._image.tag(repository, tag="latest")
+    def _session_container(
+        self, commit: bool, cache_root: Optional[Path] = None
+    ) -> tuple[Container, bool]:
+        container = self.handler._client.containers.get(self.handler._repository_name)
+        return container, False
+
+    def tag(self, repository: str, tag_name: str = "latest") -> None:
+        self.handler._image.tag(repository, tag=tag_name)
 
     def command(
         self,
@@ -128,14 +223,12 @@ class ContainerHandlerState(State):
         raise_on_fail: bool = True,
     ) -> tuple[int, str]:
         container = self.handler._client.containers.get(self.handler._repository_name)
-        container.exec_run(command)
-        retval, output = self._collect_outputs_from_container_and_commit(
-            container=container,
-            command=command,
-            commit=commit,
-            print_logs=print_logs,
-            raise_on_fail=raise_on_fail,
+        retval, output = ContainerSession(container).command(
+            command, print_logs=print_logs, raise_on_fail=raise_on_fail
         )
+        if commit:
+            self._commit(container, _printable(command))
+
         return retval, output
 
 
@@ -144,14 +237,43 @@ class ImageContainerHandlerState(State):
         # in fact image name
         return self.handler._client.images.pull(repository_name, tag_name)
 
-    def tag(self, repository: str) -> None:
-        _tag_name = "latest"
-        self.handler._image.tag(repository, tag=_tag_name)
+    def _session_container(
+        self, commit: bool, cache_root: Optional[Path] = None
+    ) -> tuple[Container, bool]:
+        if commit:
+            raise PyVemContainerException("Unable to make commit to pure image.")
 
+        return super()._session_container(commit, cache_root)
+
+    def tag(self, repository: str, tag_name: str = "latest") -> None:
         # pure image was downloaded from the outside world so keeping the
         # image as is, switching to the tagged one
-        self.handler._repository_name = repository
-        self.handler._tag_name = _tag_name
+        handler = self.handler
+        handler._repository_name = repository
+        handler._tag_name = tag_name
+        if handler.history is not None:
+            handler.history = handler.history.for_repository(repository, tag_name)
+
+        # pulled images lack the labels repositories are found by, committed
+        # with them instead of only tagged, once for each repository
+        step = handler.step(["pyvem-label"])
+        if step is not None and handler.use_cached_step(step) is not None:
+            return
+
+        # never started, committed only for the labels
+        container = handler._client.containers.create(
+            image=handler._image,
+            command=["true"],
+            labels={**handler.labels, LABEL_ROLE: BUILD_ROLE},
+        )
+        handler._step = step
+        try:
+            self._commit(container, "pyvem-label")
+        finally:
+            handler._step = None
+            container.remove(force=True)
+
+        handler._record_step(step)
 
     def command(
         self,
@@ -163,23 +285,112 @@ class ImageContainerHandlerState(State):
         if commit:
             raise PyVemContainerException("Unable to make commit to pure image.")
 
-        container = self.handler._client.containers.create(
-            image=self.handler._image, command=command, detach=True
-        )
-        container.start()
+        with self.handler.package_cache_checkout() as cache_root:
+            container = self._create_container(command, cache_root=cache_root)
+            try:
+                container.start()
+                retval, output = self._collect_outputs_from_container(
+                    container=container,
+                    command=command,
+                    print_logs=print_logs,
+                    raise_on_fail=raise_on_fail,
+                )
+            finally:
+                container.remove(force=True)
 
-        retval, output = self._collect_outputs_from_container(
-            container=container,
-            command=command,
-            print_logs=print_logs,
-            raise_on_fail=raise_on_fail,
-        )
+        return retval, output
 
-        if container.status == "running":
-            container.stop()
 
-        container.remove()
-        return retval, output
+class ContainerSession:
+    """
+    Commands run one after another in the same container, see
+    `ContainerHandler.session`.
+    """
+
+    def __init__(
+        self,
+        container: Container,
+        user: Optional[str] = None,
+        print_logs: bool = True,
+        log_path: Optional[Path] = None,
+    ) -> None:
+        self.container = container
+        self.user = user
+        self.print_logs = print_logs
+        # whole output of the commands is appended to it
+        self.log_path = log_path
+
+    def command(
+        self,
+        command: Union[list[str], str],
+        print_logs: Optional[bool] = None,
+        raise_on_fail: bool = True,
+        timeout: Optional[float] = None,
+    ) -> tuple[int, str]:
+        """
+        Run command in the container of the session, its stdout and stderr are
+        printed as they come.
+
+        Args:
+            command: Command to run.
+            print_logs: Print output of the command, None means as the session
+                does.
+            raise_on_fail: Raise if the command fails.
+            timeout: Seconds after which the command is killed.
+
+        Returns:
+            Exit code of the command and its stdout.
+        """
+        if print_logs is None:
+            print_logs = self.print_logs
+
+        terminal = CoalescedLines() if print_logs else None
+        if self.log_path is not None:
+            log = command_log(self.log_path, _printable(command))
+        else:
+            log = nullcontext()
+
+        with log as log_file:
+            try:
+                result = exec_in_container(
+                    self.container,
+                    command,
+                    user=self.user,
+                    timeout=timeout,
+                    stdout_callback=terminal,
+                    stderr_callback=terminal,
+                    log_file=log_file,
+                )
+            finally:
+                if terminal is not None:
+                    terminal.flush()
+
+        if raise_on_fail and result.retval != SUCCESS:
+            raise PyVemContainerException(
+                failure_message(
+                    _printable(command),
+                    result.retval,
+                    result.stderr or result.stdout,
+                    self.log_path,
+                )
+            )
+
+        return result.retval, result.stdout.strip()
+
+    def put_file(self, path: Path, directory: str) -> str:
+        """
+        Copy file from the host to the directory in the container.
+
+        Returns:
+            Path to the file in the container.
+        """
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode="w") as tar:
+            tar.add(str(path), arcname=path.name)
+
+        self.command(["mkdir", "-p", directory], print_logs=False)
+        self.container.put_archive(directory, archive.getvalue())
+        return f"{directory.rstrip('/')}/{path.name}"
 
 
 DEFAULT_STATE = RepositoryContainerHandlerState()
@@ -202,37 +413,280 @@ class ContainerHandler:
         repository_name: str,
         client: ContainerClient,
         state: State = DEFAULT_STATE,
+        package_cache: Optional[PackageCache] = None,
+        project_path: Optional[Path] = None,
+        build_cache: Optional[BuildCache] = None,
+        history: Optional[ImageHistory] = None,
+        logs_dir: Optional[Path] = None,
     ) -> None:
+        """
+        Args:
+            repository_name: Repository, image or container name.
+            client: Docker or podman client.
+            state: What the name refers to.
+            package_cache: Package manager cache mounted to created containers.
+            project_path: Project the images are built for, put on labels.
+            build_cache: Cache of committed steps, see `step`.
+            history: Records each commit as snapshot, its repository is
+                replaced by the one of the handler.
+            logs_dir: Whole output of commands is appended to log file of the
+                repository in this directory.
+        """
         self._repository_name, self._tag_name = parse_repository_name(repository_name)
         self._client = client
+        self.package_cache = package_cache
+        self.project_path = project_path
+        self.build_cache = build_cache
+        self.logs_dir = logs_dir
+        self.history = None
+        if history is not None:
+            self.history = history.for_repository(self._repository_name, self._tag_name)
+
+        # step being committed, its key goes to the image labels
+        self._step: Optional[BuildStep] = None
         self.set_state(state)
 
+    @property
+    def image(self) -> Image:
+        return self._image
+
+    @property
+    def image_id(self) -> str:
+        return self._image.id
+
     def set_state(self, state: State) -> None:
-        self._state = state
+        # states keep their handler, each handler needs its own copy so handlers
+        # used from different threads don't overwrite it for each other
+        self._state = copy(state)
         self._state.handler = self
         self._image = self._get_image(self._repository_name, self._tag_name)
 
+    @property
+    def labels(self) -> dict[str, str]:
+        """
+        Labels of committed images and created containers, see
+        `pyvem.containers.labels`.
+        """
+        labels = pyvem_labels(self._repository_name, self.project_path)
+        # always set, images would inherit the key of their parent otherwise
+        labels[LABEL_STEP] = self._step.key if self._step else ""
+        # commits would copy role of the build container to the image
+        labels[LABEL_ROLE] = ""
+        return labels
+
+    def step(
+        self, command: Union[list[str], str], inputs: Sequence[Path] = ()
+    ) -> Optional[BuildStep]:
+        """
+        Build step of the command run on the current image, None without build
+        cache.
+
+        Args:
+            command: Command (or anything describing the step) to commit.
+            inputs: Files from the host the step uses.
+        """
+        if self.build_cache is None:
+            return None
+
+        return BuildStep(
+            key=step_cache_key(self._repository_name, self.image_id, command, inputs),
+            command=_printable(command),
+            parent_id=self.image_id,
+        )
+
+    def use_cached_step(self, step: BuildStep) -> Optional[str]:
+        """
+        Fast-forward to the image the step committed before, if there is one.
+
+        Returns:
+            Output of the step when it ran, None if it has to run.
+        """
+        found = self.build_cache.find(self._client, step.key)
+        if found is None:
+            return None
+
+        image, output = found
+        image.tag(self._repository_name, tag=self._tag_name)
+        self._image = image
+        self._snapshot(step.parent_id, f"{step.command} (cached)")
+        return output
+
+    def _snapshot(self, parent_id: str, command: str) -> None:
+        """
+        Record current image in the history, pruning the old snapshots.
+        """
+        if self.history is None:
+            return
+
+        self.history.record(self._image, parent_id, command)
+        self.history.prune(self._client)
+
+    def _record_step(self, step: Optional[BuildStep], output: str = "") -> None:
+        if step is not None and self.image_id != step.parent_id:
+            self.build_cache.record(step, self.image_id, output)
+
+    @property
+    def log_path(self) -> Optional[Path]:
+        if self.logs_dir is None:
+            return None
+
+        return repository_log_path(self.logs_dir, self._repository_name, self._tag_name)
+
+    def command_log(self, command: str) -> ContextManager[Optional[TextIO]]:
+        """
+        Log file to append output of the command to, None without logs dir.
+        """
+        if self.log_path is None:
+            return nullcontext()
+
+        return command_log(self.log_path, command)
+
+    def package_cache_checkout(self) -> ContextManager[Optional[Path]]:
+        """
+        Checkout of the package cache for a created container, None without
+        package cache, see `PackageCache.checkout`.
+        """
+        if self.package_cache is None:
+            return nullcontext()
+
+        return self.package_cache.checkout()
+
     def command(
         self,
         command: list[str],
         commit: bool = True,
         print_logs: bool = True,
         raise_on_fail: bool = True,
+        inputs: Sequence[Path] = (),
+        cache: bool = True,
     ) -> tuple[int, str]:
         """
         Create new container, run command in it and store the side effects to image.
+
+        With build cache, a command committed on the same image before isn't run
+        again, the image it committed is used instead.
+
+        Args:
+            inputs: Files from the host the command uses, part of the cache key.
+            cache: Use build cache, commands depending on outside state (like
+                repositories) shouldn't.
+        """
+        # failed commands are committed when they don't raise, never reuse them
+        step = None
+        if commit and raise_on_fail and cache:
+            step = self.step(command, inputs)
+
+        if step is not None:
+            output = self.use_cached_step(step)
+            if output is not None:
+                if print_logs:
+                    tqdm.write(f"Using cached image of {step.command}")
+
+                return SUCCESS, output
+
+        self._step = step
+        try:
+            retval, output = self._state.command(
+                command=command,
+                commit=commit,
+                print_logs=print_logs,
+                raise_on_fail=raise_on_fail,
+            )
+        finally:
+            self._step = None
+
+        self._record_step(step, output)
+        return retval, output
+
+    @contextmanager
+    def session(
+        self,
+        commit: bool = True,
+        user: Optional[str] = None,
+        print_logs: bool = True,
+        step: Optional[BuildStep] = None,
+        description: str = "session",
+    ) -> Iterator[ContainerSession]:
+        """
+        Run many commands in one long-lived container instead of a new container
+        (and image layer) per command.
+
+        Side effects of all the commands are committed to the image at once when
+        the session ends. If any of them fails (raises), nothing is committed and
+        the image stays as it was before the session.
+
+        Args:
+            commit: Commit the container to the image at the end.
+            user: User the commands run as.
+            print_logs: Print output of the commands.
+            step: Build step the session commits, see `step`.
+            description: What the session does, shown in the history.
+        """
+        with self.package_cache_checkout() as cache_root:
+            container, owned = self._state._session_container(commit, cache_root)
+            try:
+                yield ContainerSession(container, user, print_logs, self.log_path)
+                if commit:
+                    self._step = step
+                    try:
+                        self._state._commit(container, description)
+                    finally:
+                        self._step = None
+
+                    self._record_step(step)
+            finally:
+                if owned:
+                    container.remove(force=True)
+
+    def commit(self, container: Container, description: str) -> None:
+        """
+        Commit container running the image, like one of the pool, to the image.
+
+        Args:
+            container: The container.
+            description: What changed the container, shown in the history.
+        """
+        self._state._commit(container, description)
+
+    def create_container(self, command: list[str], role: str = BUILD_ROLE) -> Container:
         """
-        return self._state.command(
-            command=command,
-            commit=commit,
-            print_logs=print_logs,
-            raise_on_fail=raise_on_fail,
+        Create (not start) container of the image running the command. It has
+        no package cache mounted, it may outlive any checkout of it.
+        """
+        return self._state._create_container(command, role)
+
+    def squash(self) -> Image:
+        """
+        Flatten the image to a single layer, see `pyvem.containers.squash`. The
+        layered image stays as the previous snapshot.
+
+        Returns:
+            The squashed image.
+        """
+        parent_id = self.image_id
+        # never started, only its filesystem is exported
+        container = self._client.containers.create(
+            image=self._image,
+            command=["true"],
+            labels={**self.labels, LABEL_ROLE: BUILD_ROLE},
         )
+        try:
+            self._image = import_image(
+                self._client,
+                container.export(),
+                self._repository_name,
+                self._tag_name,
+                config_changes(self._image),
+            )
+        finally:
+            container.remove(force=True)
+
+        self._snapshot(parent_id, "squash")
+        return self._image
 
-    def tag(self, repository: str) -> None:
-        # TODO: implement versioning with tags and store tag history in pyvem venv
-        #  directory. It would require some version control logic.
-        self._state.tag(repository=repository)
+    def tag(self, repository: str, tag_name: str = "latest") -> None:
+        # versions of the image are kept by snapshots, see `history`
+        self._state.tag(repository=repository, tag_name=tag_name)
 
     def _get_image(self, repository_name: str, tag_name: str) -> Image:
         return self._state._get_image(
@@ -243,11 +697,16 @@ class ContainerHandler:
         self, repository_name: str, tag_name: str
     ) -> "ContainerHandler":
         state_to_pass = self._state
-        if self._state == IMAGE_STATE:
+        if isinstance(self._state, ImageContainerHandlerState):
             state_to_pass = REPOSITORY_STATE
 
         return self.__class__(
             repository_name=f"{repository_name}:{tag_name}",
             client=self._client,
             state=state_to_pass,
+            package_cache=self.package_cache,
+            project_path=self.project_path,
+            build_cache=self.build_cache,
+            history=self.history,
+            logs_dir=self.logs_dir,
         )
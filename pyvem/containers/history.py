@@ -0,0 +1,211 @@
+"""
+Snapshots of repository images, one for every commit.
+
+Each committed image gets its own tag `<tag>-snapshot-<n>` besides the tag of
+the repository, which the next commit moves on, and is recorded in a history
+index in pyvem dir. Rolling back is only tagging the snapshot again. Old
+snapshots are untagged by the retention policy so the engine can free them.
+"""
+
+import json
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Optional
+
+from docker.errors import APIError as DockerAPIError
+from docker.errors import ImageNotFound as DockerImageNotFound
+from podman.errors import APIError as PodmanAPIError
+from podman.errors import ImageNotFound as PodmanImageNotFound
+
+from pyvem.constants import HISTORY_DIR, SNAPSHOT_TAG, SNAPSHOTS_KEEP
+from pyvem.exceptions import PyVemContainerException
+from pyvem.spells import locked_json, repository_file_name
+from pyvem.typedefs import ContainerClient, Image
+
+
+@dataclass
+class Snapshot:
+    number: int
+    tag: str
+    image_id: str
+    parent_id: str
+    command: str
+    created: float
+    size: int
+
+
+class ImageHistory:
+    def __init__(
+        self,
+        pyvem_dir: Path,
+        repository: str,
+        tag: str = "latest",
+        keep: int = SNAPSHOTS_KEEP,
+        max_age: Optional[float] = None,
+    ) -> None:
+        """
+        Args:
+            pyvem_dir: Where the history index is stored.
+            repository: Repository of the images.
+            tag: Tag of the repository commits move on.
+            keep: Number of the newest snapshots prune keeps.
+            max_age: Seconds after which prune removes snapshots.
+        """
+        self.pyvem_dir = pyvem_dir
+        self.repository = repository
+        self.tag = tag
+        self.keep = keep
+        self.max_age = max_age
+        self.path = (
+            pyvem_dir / HISTORY_DIR / repository_file_name(repository, tag, ".json")
+        )
+
+    def for_repository(self, repository: str, tag: str) -> "ImageHistory":
+        """
+        History of another repository with the same retention policy.
+        """
+        return self.__class__(self.pyvem_dir, repository, tag, self.keep, self.max_age)
+
+    def snapshots(self) -> list[Snapshot]:
+        """
+        Snapshots from the oldest to the newest.
+        """
+        # written atomically, reading needs no lock
+        try:
+            index = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return []
+
+        return [Snapshot(**snapshot) for snapshot in index.get("snapshots", [])]
+
+    def get(self, number: int) -> Snapshot:
+        for snapshot in self.snapshots():
+            if snapshot.number == number:
+                return snapshot
+
+        raise PyVemContainerException(
+            f"No snapshot {number} of {self.repository}:{self.tag}"
+        )
+
+    def record(self, image: Image, parent_id: str, command: str) -> Snapshot:
+        """
+        Tag the image as new snapshot and add it to the history.
+        """
+        with locked_json(self.path) as index:
+            number = index.get("next", 1)
+            snapshot = Snapshot(
+                number=number,
+                tag=SNAPSHOT_TAG.format(tag=self.tag, number=number),
+                image_id=image.id,
+                parent_id=parent_id,
+                command=command,
+                created=time.time(),
+                size=image.attrs.get("Size", 0),
+            )
+            image.tag(self.repository, tag=snapshot.tag)
+            index["next"] = number + 1
+            index.setdefault("snapshots", []).append(asdict(snapshot))
+
+        return snapshot
+
+    def current(self, client: ContainerClient) -> Optional[str]:
+        """
+        Id of the image the repository tag points to.
+        """
+        try:
+            return client.images.get(f"{self.repository}:{self.tag}").id
+        except (DockerImageNotFound, PodmanImageNotFound):
+            return None
+
+    def rollback(self, client: ContainerClient, number: int) -> Snapshot:
+        """
+        Point the repository tag to the snapshot again.
+        """
+        snapshot = self.get(number)
+        try:
+            image = client.images.get(f"{self.repository}:{snapshot.tag}")
+        except (DockerImageNotFound, PodmanImageNotFound) as exc:
+            raise PyVemContainerException(
+                f"Image of snapshot {number} is gone, it was probably pruned"
+            ) from exc
+
+        image.tag(self.repository, tag=self.tag)
+        return snapshot
+
+    def prune(
+        self,
+        client: ContainerClient,
+        keep: Optional[int] = None,
+        max_age: Optional[float] = None,
+    ) -> list[Snapshot]:
+        """
+        Untag snapshots beyond the newest `keep` ones and those older than
+        max_age seconds, the one the repository tag points to is always kept.
+        Images are removed by the engine once nothing else refers to them.
+
+        Args:
+            client: Docker or podman client.
+            keep: Overrides keep of the history.
+            max_age: Overrides max_age of the history.
+
+        Returns:
+            Pruned snapshots.
+        """
+        keep = self.keep if keep is None else keep
+        max_age = self.max_age if max_age is None else max_age
+        current = self.current(client)
+        oldest = time.time() - max_age if max_age is not None else None
+        pruned = []
+        with locked_json(self.path) as index:
+            snapshots = [
+                Snapshot(**snapshot) for snapshot in index.get("snapshots", [])
+            ]
+            kept = []
+            for position, snapshot in enumerate(reversed(snapshots)):
+                expired = position >= keep or (
+                    oldest is not None and snapshot.created < oldest
+                )
+                if not expired or snapshot.image_id == current:
+                    kept.append(snapshot)
+                    continue
+
+                try:
+                    client.images.remove(f"{self.repository}:{snapshot.tag}")
+                except (DockerImageNotFound, PodmanImageNotFound):
+                    pass
+                except (DockerAPIError, PodmanAPIError):
+                    # still used by a container, next prune tries again
+                    kept.append(snapshot)
+                    continue
+
+                pruned.append(snapshot)
+
+            index["snapshots"] = [asdict(snapshot) for snapshot in reversed(kept)]
+
+        return pruned
+
+    def remove(self, client: ContainerClient) -> list[Snapshot]:
+        """
+        Untag all the snapshots and remove the history, for removing the
+        repository. Snapshots used by containers stay in the history.
+
+        Returns:
+            Snapshots which couldn't be untagged.
+        """
+        with locked_json(self.path) as index:
+            kept = []
+            for snapshot in index.get("snapshots", []):
+                try:
+                    client.images.remove(f"{self.repository}:{snapshot['tag']}")
+                except (DockerImageNotFound, PodmanImageNotFound):
+                    continue
+                except (DockerAPIError, PodmanAPIError):
+                    kept.append(snapshot)
+
+            index["snapshots"] = kept
+
+        if not kept:
+            self.path.unlink(missing_ok=True)
+
+        return [Snapshot(**snapshot) for snapshot in kept]
@@ -0,0 +1,53 @@
+"""
+Labels pyvem puts on images it commits and containers it creates.
+
+The engine filters images and containers by labels itself, so pyvem finds its
+own ones with a single list call instead of listing everything on the host and
+matching names client side.
+"""
+
+import json
+from functools import cache
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+from typing import Optional
+
+from pyvem.constants import LABEL_PROJECT, LABEL_REPOSITORY, LABEL_VERSION
+
+
+@cache
+def pyvem_version() -> str:
+    try:
+        return version("pyvem")
+    except PackageNotFoundError:
+        return "unknown"
+
+
+def pyvem_labels(
+    repository: str, project_path: Optional[Path] = None
+) -> dict[str, str]:
+    labels = {LABEL_REPOSITORY: repository, LABEL_VERSION: pyvem_version()}
+    if project_path is not None:
+        labels[LABEL_PROJECT] = str(project_path)
+
+    return labels
+
+
+def label_changes(labels: dict[str, str]) -> list[str]:
+    """
+    Labels as Dockerfile instructions for the `changes` argument of commit.
+    """
+    return [f"LABEL {key}={json.dumps(value)}" for key, value in labels.items()]
+
+
+def repository_filter(repository: str) -> dict[str, list[str]]:
+    """
+    Filters argument of `images.list` and `containers.list` matching only
+    images and containers of the repository.
+    """
+    return {"label": [f"{LABEL_REPOSITORY}={repository}"]}
+
+
+def normalize_tag(tag: str) -> str:
+    # podman prefixes names of local images with localhost/
+    return tag.removeprefix("localhost/").removeprefix("docker.io/library/")
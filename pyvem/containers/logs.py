@@ -0,0 +1,108 @@
+"""
+Output of commands run in containers.
+
+The whole output goes to a log file of the repository in pyvem dir, only its
+tail stays in memory for error messages. Lines shown on the terminal are
+coalesced, each `tqdm.write` redraws the progress bars, so verbose commands
+are written at most once per `CONTAINER_LOG_FLUSH_INTERVAL` in one go.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator, Optional, TextIO
+
+from tqdm import tqdm
+
+from pyvem.constants import (
+    CONTAINER_LOG_FLUSH_INTERVAL,
+    CONTAINER_LOG_MAX_SIZE,
+    CONTAINER_LOG_TAIL_LINES,
+)
+from pyvem.spells import repository_file_name
+
+
+class CoalescedLines:
+    """
+    Line callback collecting lines and writing them together, at most once per
+    interval. Lines never wait longer than the interval.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[str], None] = tqdm.write,
+        interval: float = CONTAINER_LOG_FLUSH_INTERVAL,
+    ) -> None:
+        self.write = write
+        self.interval = interval
+        self._pending: list[str] = []
+        self._last_write = 0.0
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+
+    def __call__(self, line: str) -> None:
+        with self._lock:
+            self._pending.append(line.rstrip("\r"))
+            wait = self._last_write + self.interval - time.monotonic()
+            if wait <= 0:
+                self._flush()
+            elif self._timer is None:
+                self._timer = threading.Timer(wait, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        if self._pending:
+            self.write("\n".join(self._pending))
+            self._pending.clear()
+
+        self._last_write = time.monotonic()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush()
+
+
+def repository_log_path(logs_dir: Path, repository: str, tag: str) -> Path:
+    return logs_dir / repository_file_name(repository, tag, ".log")
+
+
+@contextmanager
+def command_log(path: Path, command: str) -> Iterator[TextIO]:
+    """
+    Log file of the repository opened for appending output of the command,
+    the previous log is kept as `.1` once the file grows too big.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        if path.stat().st_size > CONTAINER_LOG_MAX_SIZE:
+            os.replace(path, path.with_name(path.name + ".1"))
+    except FileNotFoundError:
+        pass
+
+    with open(path, "a", encoding="utf-8") as log_file:
+        log_file.write(f"\n$ {command}\n")
+        yield log_file
+
+
+def failure_message(
+    command: str, retval: int, output: str, path: Optional[Path] = None
+) -> str:
+    """
+    Message of failed command with the last lines of its output.
+    """
+    message = f"Command {command} failed with code: {retval}"
+    tail = output.strip().splitlines()[-CONTAINER_LOG_TAIL_LINES:]
+    if tail:
+        message += "\n" + "\n".join(tail)
+
+    if path is not None:
+        message += f"\nWhole output is in {path}"
+
+    return message
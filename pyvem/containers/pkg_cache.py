@@ -0,0 +1,225 @@
+"""
+Package manager cache shared by containers pyvem creates.
+
+Directories in pyvem dir are bind mounted over the cache directories of dnf in
+containers, so repository metadata are downloaded and parsed once and not in
+each container again. Being mounted, the cache never ends up in committed
+images either.
+
+dnf locks its cache only inside the container, so containers running at once
+must not write to the same directories. Each container gets its own checkout
+of the cache, copied (reflinked where the filesystem can) from the shared one,
+and what dnf changed in it is merged back when the container is done. The lock
+of the shared cache is held only while copying and merging, never while dnf
+runs, so builds running at once don't wait for each other.
+"""
+
+import fcntl
+import logging
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Iterator
+
+from pyvem.constants import PACKAGE_CACHE_DIR, PACKAGE_CACHE_MOUNTS
+from pyvem.exceptions import PyVemContainerException
+from pyvem.spells import link_file
+
+logger = logging.getLogger(__name__)
+
+# (mtime_ns, size) of a cached file
+_FileState = tuple[int, int]
+
+
+@dataclass
+class CacheCheckout:
+    """
+    Private copy of the cache for one container.
+    """
+
+    root: Path
+    # state of the copied files, what differs afterwards was changed by dnf
+    seeded: dict[str, _FileState] = field(default_factory=dict)
+
+
+def _file_states(root: Path) -> dict[str, _FileState]:
+    states = {}
+    for directory, _, files in os.walk(root):
+        for file in files:
+            path = os.path.join(directory, file)
+            try:
+                stat = os.lstat(path)
+            except OSError:
+                continue
+
+            states[os.path.relpath(path, root)] = (stat.st_mtime_ns, stat.st_size)
+
+    return states
+
+
+@contextmanager
+def _flock(path: Path, operation: int) -> Iterator[None]:
+    with open(path, "a") as lock_file:
+        fcntl.flock(lock_file.fileno(), operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+class PackageCache:
+    def __init__(self, pyvem_dir: Path) -> None:
+        self.path = pyvem_dir / PACKAGE_CACHE_DIR
+        self.lock_path = self.path / "lock"
+        # checkouts of running containers
+        self.checkouts_path = self.path / "checkouts"
+        # files of dnf are never changed in place, reflinks only save space
+        self._link_modes = ["reflink", "copy"]
+
+    @staticmethod
+    def volumes(root: Path, is_podman: bool) -> dict[str, dict[str, Any]]:
+        """
+        Volumes argument of `containers.create` mounting the cache directories
+        under root, see `checkout`.
+        """
+        result = {}
+        for name, container_path in PACKAGE_CACHE_MOUNTS.items():
+            host_path = root / name
+            host_path.mkdir(parents=True, exist_ok=True)
+            # `z` relabels the directory so SELinux lets containers use it
+            if is_podman:
+                volume = {"bind": container_path, "mode": "rw", "extended_mode": ["z"]}
+            else:
+                volume = {"bind": container_path, "mode": "rw,z"}
+
+            result[str(host_path)] = volume
+
+        return result
+
+    @contextmanager
+    def lock(self, exclusive: bool = True) -> Iterator[None]:
+        """
+        Lock of the shared cache, taken shared for copying from it and
+        exclusively for changing it.
+        """
+        self.path.mkdir(parents=True, exist_ok=True)
+        with _flock(self.lock_path, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH):
+            yield
+
+    def _seed(self, checkout: CacheCheckout) -> None:
+        with self.lock(exclusive=False):
+            for name in PACKAGE_CACHE_MOUNTS:
+                shared = self.path / name
+                for relpath in _file_states(shared):
+                    target = checkout.root / name / relpath
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    link_file(shared / relpath, target, self._link_modes)
+
+            checkout.seeded = _file_states(checkout.root)
+
+    def _merge(self, checkout: CacheCheckout) -> None:
+        """
+        Move files dnf changed in the checkout to the shared cache and remove
+        those it deleted, unless another checkout changed them meanwhile. Files
+        which can't be moved, e.g. owned by root of a rootful engine, are left
+        out of the cache.
+        """
+        with self.lock():
+            current = _file_states(checkout.root)
+            for relpath, state in current.items():
+                if checkout.seeded.get(relpath) == state:
+                    continue
+
+                target = self.path / relpath
+                try:
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    os.replace(checkout.root / relpath, target)
+                except OSError as exc:
+                    logger.debug(f"Not caching {relpath}: {exc}")
+                    continue
+
+            for relpath, state in checkout.seeded.items():
+                if relpath in current:
+                    continue
+
+                target = self.path / relpath
+                try:
+                    if _file_states(target.parent).get(target.name) == state:
+                        target.unlink()
+                except OSError:
+                    continue
+
+    @contextmanager
+    def checkout(self) -> Iterator[Path]:
+        """
+        Private copy of the cache for a container, merged back to the shared
+        cache when the block ends without error.
+
+        Returns:
+            Root of the copy, mount it with `volumes`.
+        """
+        self.checkouts_path.mkdir(parents=True, exist_ok=True)
+        checkout = CacheCheckout(self.checkouts_path / uuid.uuid4().hex)
+        checkout.root.mkdir()
+        lock_path = checkout.root.with_suffix(".lock")
+        try:
+            # tells prune the checkout is in use
+            with _flock(lock_path, fcntl.LOCK_EX):
+                try:
+                    self._seed(checkout)
+                    yield checkout.root
+                    self._merge(checkout)
+                finally:
+                    shutil.rmtree(checkout.root, ignore_errors=True)
+        finally:
+            lock_path.unlink(missing_ok=True)
+
+    def size(self) -> int:
+        return sum(
+            size
+            for name in PACKAGE_CACHE_MOUNTS
+            for _, size in _file_states(self.path / name).values()
+        )
+
+    def _prune_checkouts(self) -> None:
+        """
+        Remove checkouts left behind by killed pyvem processes.
+        """
+        for lock_path in self.checkouts_path.glob("*.lock"):
+            with open(lock_path, "a") as lock_file:
+                try:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+
+                shutil.rmtree(lock_path.with_suffix(""), ignore_errors=True)
+                lock_path.unlink(missing_ok=True)
+
+    def prune(self) -> int:
+        """
+        Remove everything cached, checkouts of running containers are left
+        alone.
+
+        Returns:
+            Bytes freed.
+        """
+        with self.lock():
+            freed = self.size()
+            for name in PACKAGE_CACHE_MOUNTS:
+                try:
+                    shutil.rmtree(self.path / name)
+                except FileNotFoundError:
+                    continue
+                except PermissionError as exc:
+                    raise PyVemContainerException(
+                        f"Unable to remove {exc.filename}, the cache was probably"
+                        " written by a rootful engine, remove it as root"
+                    ) from exc
+
+            if self.checkouts_path.exists():
+                self._prune_checkouts()
+
+        return freed
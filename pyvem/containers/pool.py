@@ -0,0 +1,266 @@
+"""
+Warm pool of running containers of a repository.
+
+Creating and starting a container takes far longer than executing a command
+in one which already runs. The pool keeps up to `size` started containers of
+the repository image and lends them to commands, each pyvem process leasing a
+container records itself in an index in pyvem dir, so processes never share
+one at the same time.
+
+Containers are used again until they served `max_uses` commands, the
+repository image changes or `idle_timeout` seconds pass since they were last
+used, then they are recycled. While a command runs, the pool starts the
+containers it lacks in the background, so commands never wait for them.
+
+Containers run until they're removed, however long their commands take. No
+process watches them, expired ones are removed whenever the pool is used and
+`pyvem container pool --drain` removes those of a pool which isn't used again.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+from docker.errors import NotFound as DockerNotFound
+from podman.errors import NotFound as PodmanNotFound
+
+from pyvem.constants import POOL_DIR, POOL_ROLE, SESSION_COMMAND
+from pyvem.containers.handler import ContainerHandler
+from pyvem.spells import locked_json, repository_file_name
+from pyvem.typedefs import Container
+
+
+@dataclass
+class PooledContainer:
+    id: str
+    image_id: str
+    created: float = field(default_factory=time.time)
+    last_used: float = field(default_factory=time.time)
+    uses: int = 0
+    # pid of the process using the container
+    leased_by: Optional[int] = None
+
+
+def _is_process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+    return True
+
+
+class ContainerPool:
+    def __init__(
+        self,
+        handler: ContainerHandler,
+        pyvem_dir: Path,
+        size: int,
+        max_uses: int,
+        idle_timeout: float,
+    ) -> None:
+        """
+        Args:
+            handler: Handler of the repository, containers run its image.
+            pyvem_dir: Where the pool index is stored.
+            size: Number of idle containers kept running.
+            max_uses: Commands a container serves before it's recycled.
+            idle_timeout: Seconds after which idle containers are removed.
+        """
+        self.handler = handler
+        self.size = size
+        self.max_uses = max_uses
+        self.idle_timeout = idle_timeout
+        repository, tag = handler._repository_name, handler._tag_name
+        self.path = (
+            pyvem_dir / POOL_DIR / repository_file_name(repository, tag, ".json")
+        )
+
+    def _is_expired(self, container: PooledContainer) -> bool:
+        if container.leased_by is not None:
+            return not _is_process_alive(container.leased_by)
+
+        return (
+            container.image_id != self.handler.image_id
+            or container.uses >= self.max_uses
+            or time.time() - container.last_used > self.idle_timeout
+        )
+
+    def _expire(self, index: dict[str, Any]) -> list[str]:
+        """
+        Drop expired containers from the index.
+
+        Returns:
+            Ids of the dropped containers, they are to be removed.
+        """
+        containers = [PooledContainer(**data) for data in index.get("containers", [])]
+        kept = [
+            container for container in containers if not self._is_expired(container)
+        ]
+        index["containers"] = [asdict(container) for container in kept]
+        return [container.id for container in containers if container not in kept]
+
+    def _remove(self, container_ids: list[str]) -> None:
+        for container_id in container_ids:
+            try:
+                self.handler._client.containers.get(container_id).remove(force=True)
+            except (DockerNotFound, PodmanNotFound):
+                continue
+
+    def _get_running(self, container_id: str) -> Optional[Container]:
+        try:
+            container = self.handler._client.containers.get(container_id)
+        except (DockerNotFound, PodmanNotFound):
+            return None
+
+        return container if container.status == "running" else None
+
+    def _start(self) -> Container:
+        container = self.handler.create_container(SESSION_COMMAND, role=POOL_ROLE)
+        container.start()
+        return container
+
+    def _acquire(self) -> Container:
+        while True:
+            with locked_json(self.path) as index:
+                expired = self._expire(index)
+                idle = next(
+                    (data for data in index["containers"] if data["leased_by"] is None),
+                    None,
+                )
+                if idle is not None:
+                    idle["leased_by"] = os.getpid()
+
+            self._remove(expired)
+            if idle is None:
+                break
+
+            container = self._get_running(idle["id"])
+            if container is not None:
+                return container
+
+            # stopped or removed behind pool's back
+            self._forget(idle["id"])
+            self._remove([idle["id"]])
+
+        # cold start, the pool was empty
+        container = self._start()
+        leased = PooledContainer(container.id, self.handler.image_id)
+        leased.leased_by = os.getpid()
+        with locked_json(self.path) as index:
+            index.setdefault("containers", []).append(asdict(leased))
+
+        return container
+
+    def _forget(self, container_id: str) -> None:
+        with locked_json(self.path) as index:
+            index["containers"] = [
+                data
+                for data in index.get("containers", [])
+                if data["id"] != container_id
+            ]
+
+    def _release(self, container_id: str, healthy: bool) -> None:
+        with locked_json(self.path) as index:
+            for data in index.get("containers", []):
+                if data["id"] == container_id:
+                    data["leased_by"] = None
+                    data["uses"] += 1
+                    data["last_used"] = time.time()
+                    if not healthy:
+                        # recycled by the expiration below
+                        data["uses"] = self.max_uses
+
+            expired = self._expire(index)
+
+        self._remove(expired)
+
+    @contextmanager
+    def lease(self, refill: bool = True) -> Iterator[Container]:
+        """
+        Running container of the repository for exclusive use, returned to
+        the pool (or recycled) when the block ends.
+
+        Args:
+            refill: Fill the pool while the block runs, pointless if the
+                block changes the repository image.
+        """
+        container = self._acquire()
+        filling = None
+        if refill:
+            filling = threading.Thread(target=self.fill)
+            filling.start()
+
+        healthy = False
+        try:
+            yield container
+            healthy = True
+        finally:
+            # started containers are recorded before the process may exit
+            if filling is not None:
+                filling.join()
+
+            self._release(container.id, healthy)
+
+    def _count_idle(self, containers: list[dict[str, Any]]) -> int:
+        return sum(
+            data["leased_by"] is None
+            or (data["leased_by"] == os.getpid() and data["uses"] + 1 < self.max_uses)
+            for data in containers
+        )
+
+    def fill(self) -> None:
+        """
+        Start containers until the pool has `size` idle ones, containers this
+        process leases count as idle if they return to the pool.
+        """
+        with locked_json(self.path) as index:
+            expired = self._expire(index)
+            idle = self._count_idle(index["containers"])
+
+        self._remove(expired)
+        started = [
+            PooledContainer(self._start().id, self.handler.image_id)
+            for _ in range(self.size - idle)
+        ]
+        if not started:
+            return
+
+        # other processes may have filled the pool meanwhile
+        with locked_json(self.path) as index:
+            containers = index.setdefault("containers", [])
+            idle = self._count_idle(containers)
+            missing = max(self.size - idle, 0)
+            containers.extend(map(asdict, started[:missing]))
+
+        self._remove([pooled.id for pooled in started[missing:]])
+
+    def containers(self) -> list[PooledContainer]:
+        with locked_json(self.path) as index:
+            return [PooledContainer(**data) for data in index.get("containers", [])]
+
+    def drain(self) -> int:
+        """
+        Remove all idle containers of the pool.
+
+        Returns:
+            Number of removed containers.
+        """
+        with locked_json(self.path) as index:
+            idle = [
+                data["id"]
+                for data in index.get("containers", [])
+                if not data["leased_by"]
+            ]
+            index["containers"] = [
+                data for data in index.get("containers", []) if data["leased_by"]
+            ]
+
+        self._remove(idle)
+        return len(idle)
@@ -1,3 +1,5 @@
+import shlex
+from hashlib import sha256
 from os import getcwd
 from pathlib import Path
 from typing import Optional
@@ -5,8 +7,10 @@ from typing import Optional
 from tqdm import tqdm
 
 from pyvem.config import Config
-from pyvem.constants import NO_DEPS_FOUND, SUCCESS
+from pyvem.constants import CONTAINER_RECIPE_DIR, NO_DEPS_FOUND, SUCCESS
 from pyvem.containers.base import LinuxDistro
+from pyvem.containers.deps_cache import DependencyCache, deps_cache_key
+from pyvem.containers.handler import ContainerSession
 from pyvem.exceptions import PyVemContainerException
 from pyvem.spells import find_first_occurrence_of_file, progress_bar
 
@@ -15,11 +19,36 @@ class RPM(LinuxDistro):
     def __init__(self, repository_name: str, config: Optional[Config] = None) -> None:
         super().__init__(repository_name, config)
 
-    @staticmethod
-    def get_recipe_path() -> Optional[Path]:
-        return find_first_occurrence_of_file(Path(getcwd()), "*.spec")
+    RECIPE_PATTERN = "*.spec"
+
+    @classmethod
+    def get_recipe_path(cls) -> Optional[Path]:
+        return find_first_occurrence_of_file(Path(getcwd()), cls.RECIPE_PATTERN)
 
-    def _get_deps_from_spec(self, spec: Path, bar: tqdm) -> list[str]:
+    @staticmethod
+    def _parse_transaction(output: str) -> list[str]:
+        """
+        Names of packages dnf would install, taken from its transaction table.
+        """
+        packages = []
+        in_table = False
+        for line in output.splitlines():
+            stripped = line.strip()
+            if stripped.startswith("Installing"):
+                in_table = True
+                continue
+
+            if stripped.startswith("Transaction Summary"):
+                break
+
+            if in_table and stripped and not stripped.endswith(":"):
+                packages.append(stripped.split()[0])
+
+        return packages
+
+    def _get_deps_from_spec(
+        self, session: ContainerSession, spec: Path, bar: tqdm
+    ) -> list[str]:
         bar.total = 4
         bar.refresh()
         bar.update(1)
@@ -27,27 +56,27 @@ class RPM(LinuxDistro):
             {"Current job": f"Getting dependencies from spec file: {spec.name}"}
         )
 
-        retval, output = self.container_handler.command(
-            ["dnf", "install", "'dnf-command(builddep)'", "-y"],
-            commit=False,
-            raise_on_fail=False,
+        retval, output = session.command(
+            ["dnf", "install", "dnf-command(builddep)", "-y"], raise_on_fail=False
         )
         if retval != SUCCESS:
             raise PyVemContainerException(NO_DEPS_FOUND.format(code=retval))
 
         bar.update(1)
 
-        _, output = self.container_handler.command(
-            ["dnf", "builddep", spec, "--assumeno"], commit=False
+        spec_in_container = session.put_file(spec, CONTAINER_RECIPE_DIR)
+        # --assumeno makes dnf exit with failure even when it resolves fine
+        _, output = session.command(
+            ["dnf", "builddep", spec_in_container, "--assumeno"], raise_on_fail=False
         )
-        out_lines = output.split()
-        deps_lines = out_lines[
-            out_lines.index("Installing:") + 1 : out_lines.index("Transaction Summary")
-        ]
-        return list(map(lambda line: line.split()[0], deps_lines))
+        return self._parse_transaction(output)
 
     def _get_deps(
-        self, package: Optional[str], spec: Optional[Path], bar: tqdm
+        self,
+        session: ContainerSession,
+        package: Optional[str],
+        spec: Optional[Path],
+        bar: tqdm,
     ) -> list[str]:
         if not package:
             if spec is None:
@@ -55,7 +84,7 @@ class RPM(LinuxDistro):
                     "Please provide some information for installation"
                 )
 
-            return self._get_deps_from_spec(spec, bar)
+            return self._get_deps_from_spec(session, spec, bar)
 
         bar.total = 3
         bar.refresh()
@@ -64,32 +93,120 @@ class RPM(LinuxDistro):
             {"Current job": f"Getting dependencies from package: {package}"}
         )
 
-        retval, output = self.container_handler.command(
+        retval, output = session.command(
             ["dnf", "repoquery", "--requires", "--resolve", "--recursive", package],
-            commit=False,
             raise_on_fail=False,
         )
         if retval != SUCCESS:
             raise PyVemContainerException(NO_DEPS_FOUND.format(code=retval))
 
-        return [line.strip() for line in output.split("\n")]
+        return [line.strip() for line in output.split("\n") if line.strip()]
+
+    @staticmethod
+    def _repos_state(session: ContainerSession) -> Optional[str]:
+        """
+        Last update times of the enabled repositories as dnf knows them, None if
+        dnf doesn't tell.
+        """
+        retval, output = session.command(
+            ["dnf", "repoinfo"], print_logs=False, raise_on_fail=False
+        )
+        if retval != SUCCESS:
+            return None
+
+        updated = [
+            line.strip()
+            for line in output.splitlines()
+            if line.strip().lower().startswith(("repo-id", "repo-updated"))
+        ]
+        return "\n".join(updated) or None
+
+    def _get_deps_cached(
+        self,
+        session: ContainerSession,
+        package: Optional[str],
+        spec: Optional[Path],
+        bar: tqdm,
+        repos_state: Optional[str],
+    ) -> list[str]:
+        if (not package and spec is None) or repos_state is None:
+            return self._get_deps(session, package, spec, bar)
+
+        key = deps_cache_key(
+            self.container_handler.image_id, repos_state, spec=spec, package=package
+        )
+        cache = DependencyCache(self.pyvem_dir)
+        dependencies = cache.get(key)
+        if dependencies is not None:
+            bar.total = 2
+            bar.refresh()
+            bar.update(1)
+            bar.set_postfix({"Current job": "Using cached dependencies"})
+            return dependencies
+
+        dependencies = self._get_deps(session, package, spec, bar)
+        cache.put(key, dependencies)
+        return dependencies
 
     def install(
         self,
         dependencies: Optional[list[str]],
         package: Optional[str],
         recipe: Optional[Path],
+        position: int = 1,
+        print_logs: bool = True,
     ) -> int:
-        with progress_bar(desc=f"Installing repo {self.repository_name}") as bar:
-            project_dependencies = dependencies or [] + self._get_deps(
-                package, recipe, bar
-            )
+        with progress_bar(
+            desc=f"Installing repo {self.repository_name}:{self.tag_name}",
+            position=position,
+        ) as bar:
+            # resolving installs the builddep plugin and copies the spec file to
+            # the container, none of it belongs to the image
+            with self.container_handler.session(
+                commit=False, print_logs=print_logs
+            ) as session:
+                repos_state = self._repos_state(session)
+                # the same packages installed to the same image from the same
+                # repositories make the same image, not cached when dnf doesn't
+                # tell the state of the repositories
+                description = ["rpm-install", f"--package={package or ''}"]
+                description += sorted(dependencies or [])
+                if recipe is not None and not package:
+                    description.append(f"--recipe={recipe.name}")
+
+                step = None
+                if repos_state is not None:
+                    digest = sha256(repos_state.encode()).hexdigest()[:12]
+                    step = self.container_handler.step(
+                        description + [f"--repos={digest}"],
+                        inputs=[recipe] if recipe is not None and not package else [],
+                    )
+
+                if (
+                    step is not None
+                    and self.container_handler.use_cached_step(step) is not None
+                ):
+                    if print_logs:
+                        tqdm.write(f"Using cached image of {self.repository_name}")
+
+                    return SUCCESS
+
+                project_dependencies = list(dependencies or []) + self._get_deps_cached(
+                    session, package, recipe, bar, repos_state
+                )
 
             bar.update(1)
+            if not project_dependencies:
+                return SUCCESS
+
             bar.set_postfix({"Current job": "Installing dependencies"})
-            retval, _ = self.container_handler.command(
-                ["dnf", "install", " ".join(project_dependencies), "-y"]
-            )
+            # the install is one commit, nothing is committed if it fails
+            with self.container_handler.session(
+                print_logs=print_logs, step=step, description=shlex.join(description)
+            ) as session:
+                retval, _ = session.command(
+                    ["dnf", "install", "-y"] + project_dependencies
+                )
 
         return retval
 
@@ -99,5 +216,6 @@ class RPM(LinuxDistro):
         else:
             cmd = "dnf upgrade -y"
 
-        retval, _ = self.container_handler.command(cmd)
+        # upgrades depend on the repositories, not only on the image
+        retval, _ = self.container_handler.command(cmd, cache=False)
         return retval
@@ -0,0 +1,75 @@
+"""
+Flattening image layers.
+
+Every commit adds a layer, containers of images with long layer chains start
+slower and each layer costs space. Exporting filesystem of a container and
+importing it back makes image of a single layer, the export is streamed
+straight into the import without being stored anywhere. Import keeps no
+configuration of the image, so it is given again as Dockerfile instructions.
+"""
+
+import json
+from typing import Iterator
+
+from podman import PodmanClient
+
+from pyvem.containers.labels import label_changes
+from pyvem.typedefs import ContainerClient, Image
+
+
+def layer_count(image: Image) -> int:
+    return len((image.attrs.get("RootFS") or {}).get("Layers") or [])
+
+
+def config_changes(image: Image) -> list[str]:
+    """
+    Configuration of the image as Dockerfile instructions for import.
+    """
+    config = image.attrs.get("Config") or {}
+    changes = []
+    for env in config.get("Env") or []:
+        key, _, value = env.partition("=")
+        changes.append(f"ENV {key}={json.dumps(value)}")
+
+    if config.get("Entrypoint"):
+        changes.append(f"ENTRYPOINT {json.dumps(config['Entrypoint'])}")
+
+    if config.get("Cmd"):
+        changes.append(f"CMD {json.dumps(config['Cmd'])}")
+
+    if config.get("WorkingDir"):
+        changes.append(f"WORKDIR {config['WorkingDir']}")
+
+    if config.get("User"):
+        changes.append(f"USER {config['User']}")
+
+    for port in config.get("ExposedPorts") or {}:
+        changes.append(f"EXPOSE {port}")
+
+    return changes + label_changes(config.get("Labels") or {})
+
+
+def import_image(
+    client: ContainerClient,
+    archive: Iterator[bytes],
+    repository: str,
+    tag: str,
+    changes: list[str],
+) -> Image:
+    """
+    Create image of single layer from the filesystem archive.
+    """
+    if isinstance(client, PodmanClient):
+        response = client.api.post(
+            "/images/import",
+            params={"reference": f"{repository}:{tag}", "changes": changes},
+            data=archive,
+            headers={"Content-Type": "application/x-tar"},
+        )
+        response.raise_for_status()
+    else:
+        client.api.import_image_from_stream(
+            archive, repository=repository, tag=tag, changes=changes
+        )
+
+    return client.images.get(f"{repository}:{tag}")
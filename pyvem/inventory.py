@@ -0,0 +1,280 @@
+"""
+Distributions installed in a virtual environment, read straight from the
+`*.dist-info` and `*.egg-info` metadata in its `site-packages` without starting
+pip or the interpreter of the environment.
+"""
+
+import json
+import os
+from dataclasses import dataclass, field
+from hashlib import sha256
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import Any, Optional
+
+from packaging.requirements import InvalidRequirement, Requirement
+
+from pyvem.constants import INVENTORY_DIR, PROTECTED_DISTRIBUTIONS
+from pyvem.spells import canonicalize_name
+
+
+@dataclass
+class InstalledDistribution:
+    name: str
+    version: str
+    dist_info: Path
+    requires: list[Requirement] = field(default_factory=list)
+    # URL of PEP 610 `direct_url.json`, set for editable, local and VCS installs
+    direct_url: Optional[str] = None
+    editable: bool = False
+
+    @property
+    def canonical_name(self) -> str:
+        return canonicalize_name(self.name)
+
+    @property
+    def freeze_line(self) -> str:
+        """
+        Requirement pinning the distribution, the same `pip freeze` prints.
+        """
+        if self.editable and self.direct_url:
+            return f"-e {self.direct_url}"
+
+        if self.direct_url:
+            return f"{self.name} @ {self.direct_url}"
+
+        return f"{self.name}=={self.version}"
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "version": self.version,
+            "dist_info": str(self.dist_info),
+            "requires": [str(requirement) for requirement in self.requires],
+            "direct_url": self.direct_url,
+            "editable": self.editable,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "InstalledDistribution":
+        return cls(
+            name=data["name"],
+            version=data["version"],
+            dist_info=Path(data["dist_info"]),
+            requires=[Requirement(requirement) for requirement in data["requires"]],
+            direct_url=data["direct_url"],
+            editable=data["editable"],
+        )
+
+
+def _read_metadata_headers(metadata_path: Path) -> list[tuple[str, str]]:
+    """
+    Headers of the core metadata file, the (often long) description in its body
+    is never read.
+    """
+    headers: list[tuple[str, str]] = []
+    with open(metadata_path, encoding="utf-8", errors="replace") as metadata:
+        for line in metadata:
+            if line in ("\n", "\r\n"):
+                break
+
+            if line[0] in " \t" and headers:
+                key, value = headers[-1]
+                headers[-1] = (key, value + " " + line.strip())
+                continue
+
+            key, sep, value = line.partition(":")
+            if sep:
+                headers.append((key.strip(), value.strip()))
+
+    return headers
+
+
+def _parse_requirements(lines: list[str]) -> list[Requirement]:
+    requires = []
+    for line in lines:
+        try:
+            requires.append(Requirement(line))
+        except InvalidRequirement:
+            continue
+
+    return requires
+
+
+def _read_egg_requires(requires_path: Path) -> list[Requirement]:
+    """
+    Requirements of `requires.txt` in egg-info, its `[extra:marker]` sections
+    are turned to markers the way `Requires-Dist` expresses them.
+    """
+    try:
+        lines = requires_path.read_text().splitlines()
+    except OSError:
+        return []
+
+    result = []
+    marker = ""
+    for line in map(str.strip, lines):
+        if not line or line.startswith("#"):
+            continue
+
+        if line.startswith("[") and line.endswith("]"):
+            extra, _, section_marker = line[1:-1].partition(":")
+            markers = [f"({section_marker})"] if section_marker else []
+            markers += [f'extra == "{extra}"'] if extra else []
+            marker = " and ".join(markers)
+            continue
+
+        result.append(f"{line} ; {marker}" if marker else line)
+
+    return _parse_requirements(result)
+
+
+def _read_direct_url(dist_info: Path) -> tuple[Optional[str], bool]:
+    try:
+        direct_url = json.loads((dist_info / "direct_url.json").read_text())
+    except (OSError, ValueError):
+        return None, False
+
+    url = direct_url.get("url")
+    vcs_info = direct_url.get("vcs_info")
+    if url and vcs_info:
+        url = f"{vcs_info['vcs']}+{url}@{vcs_info['commit_id']}"
+
+    return url, bool(direct_url.get("dir_info", {}).get("editable"))
+
+
+def read_distribution(metadata_dir: Path) -> Optional[InstalledDistribution]:
+    """
+    Read distribution from its `.dist-info` or `.egg-info` (directory or file).
+    """
+    is_egg_info = metadata_dir.name.endswith(".egg-info")
+    if not is_egg_info:
+        metadata_path = metadata_dir / "METADATA"
+    elif metadata_dir.is_dir():
+        metadata_path = metadata_dir / "PKG-INFO"
+    else:
+        metadata_path = metadata_dir
+
+    try:
+        headers = _read_metadata_headers(metadata_path)
+    except OSError:
+        return None
+
+    values = dict(headers)
+    if "Name" not in values or "Version" not in values:
+        return None
+
+    if is_egg_info:
+        requires = _read_egg_requires(metadata_dir / "requires.txt")
+    else:
+        requires = _parse_requirements(
+            [value for key, value in headers if key == "Requires-Dist"]
+        )
+
+    direct_url, editable = _read_direct_url(metadata_dir)
+    return InstalledDistribution(
+        name=values["Name"],
+        version=values["Version"],
+        dist_info=metadata_dir,
+        requires=requires,
+        direct_url=direct_url,
+        editable=editable,
+    )
+
+
+def installed_distributions(site_packages: Path) -> dict[str, InstalledDistribution]:
+    """
+    Distributions installed in site-packages.
+
+    Args:
+        site_packages: Path to `site-packages` of the environment.
+
+    Returns:
+        Distributions by their canonical name.
+    """
+    result = {}
+    for entry in os.scandir(site_packages):
+        if not entry.name.endswith((".dist-info", ".egg-info")):
+            continue
+
+        distribution = read_distribution(Path(entry.path))
+        if distribution is not None:
+            result[distribution.canonical_name] = distribution
+
+    return result
+
+
+def freeze_lines(
+    distributions: list[InstalledDistribution], include_all: bool = False
+) -> list[str]:
+    """
+    Pinned requirements of the distributions, like `pip freeze` omitting pip,
+    setuptools and wheel unless include_all is set.
+    """
+    return [
+        distribution.freeze_line
+        for distribution in distributions
+        if include_all or distribution.canonical_name not in PROTECTED_DISTRIBUTIONS
+    ]
+
+
+class InventoryCache:
+    """
+    Inventories of environments cached in JSON files in pyvem dir, an
+    inventory is valid while mtime of the site-packages directory stays the
+    same, installing or removing a distribution always changes it.
+    """
+
+    def __init__(self, pyvem_dir: Path) -> None:
+        self.path = pyvem_dir / INVENTORY_DIR
+
+    def _cache_file(self, site_packages: Path) -> Path:
+        key = sha256(str(site_packages).encode()).hexdigest()[:16]
+        return self.path / f"{key}.json"
+
+    def _load(self, cache_file: Path, mtime_ns: int) -> Optional[dict[str, Any]]:
+        try:
+            cached = json.loads(cache_file.read_text())
+        except (OSError, ValueError):
+            return None
+
+        if cached.get("mtime_ns") != mtime_ns:
+            return None
+
+        return cached
+
+    def _save(self, cache_file: Path, content: dict[str, Any]) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        with NamedTemporaryFile(
+            "w", dir=self.path, suffix=".tmp", delete=False
+        ) as tmp_file:
+            json.dump(content, tmp_file)
+
+        os.replace(tmp_file.name, cache_file)
+
+    def get(self, site_packages: Path) -> dict[str, InstalledDistribution]:
+        """
+        Distributions installed in site-packages, see `installed_distributions`.
+        """
+        mtime_ns = site_packages.stat().st_mtime_ns
+        cache_file = self._cache_file(site_packages)
+        cached = self._load(cache_file, mtime_ns)
+        if cached is not None:
+            return {
+                name: InstalledDistribution.from_dict(data)
+                for name, data in cached["distributions"].items()
+            }
+
+        distributions = installed_distributions(site_packages)
+        self._save(
+            cache_file,
+            {
+                "site_packages": str(site_packages),
+                "mtime_ns": mtime_ns,
+                "distributions": {
+                    name: distribution.to_dict()
+                    for name, distribution in distributions.items()
+                },
+            },
+        )
+        return distributions
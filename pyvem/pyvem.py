@@ -7,9 +7,11 @@ from pyvem.config import Config
 
 
 class PyVem:
-    def __init__(self, config: Optional[Config] = None) -> None:
+    def __init__(
+        self, config: Optional[Config] = None, project_path: Optional[Path] = None
+    ) -> None:
         self.config = config or Config.get_config()
-        self.cwd = Path(getcwd())
+        self.cwd = project_path or Path(getcwd())
         self.project_name = self.cwd.name
         self.cmd = Cmd(self.cwd).run_cmd
         self.pyvem_dir = self.config.path_to_pyvem_dir
@@ -0,0 +1,189 @@
+"""
+Incremental sync of a venv environment with its requirements file.
+
+Instead of handing the whole file to pip, which checks every requirement again,
+the requirements are compared with distributions installed in the environment
+(see pyvem.inventory) and pip gets only those which are missing or whose
+installed version doesn't match anymore.
+"""
+
+import re
+import shlex
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator, Optional
+
+from packaging.requirements import InvalidRequirement, Requirement
+from packaging.version import InvalidVersion
+
+from pyvem.constants import PROTECTED_DISTRIBUTIONS
+from pyvem.inventory import InstalledDistribution
+from pyvem.spells import canonicalize_name
+
+_COMMENT = re.compile(r"(^|\s+)#.*$")
+
+
+@dataclass
+class RequirementsFile:
+    requirements: list[Requirement] = field(default_factory=list)
+    # pip options of the file (indexes, constraints, ...), passed on to pip
+    options: list[str] = field(default_factory=list)
+
+
+@dataclass
+class ReconcilePlan:
+    # requirements to pass to pip install
+    install: list[str]
+    # installed distributions no requirement needs
+    extraneous: list[str]
+
+
+def _logical_lines(path: Path) -> Iterator[str]:
+    line = ""
+    for physical_line in path.read_text().splitlines():
+        physical_line = _COMMENT.sub("", physical_line)
+        if physical_line.endswith("\\"):
+            line += physical_line[:-1]
+            continue
+
+        line = (line + physical_line).strip()
+        if line:
+            yield line
+
+        line = ""
+
+    if line.strip():
+        yield line.strip()
+
+
+def _read_requirements_file(
+    path: Path, result: RequirementsFile, seen: set[Path]
+) -> bool:
+    path = path.resolve()
+    if path in seen:
+        return True
+
+    seen.add(path)
+    for line in _logical_lines(path):
+        if "${" in line:
+            # environment variables are expanded by pip only
+            return False
+
+        if line.startswith("-"):
+            tokens = shlex.split(line)
+            option, _, value = tokens[0].partition("=")
+            value = value or (tokens[1] if len(tokens) > 1 else "")
+            if option in ("-r", "--requirement"):
+                if not _read_requirements_file(path.parent / value, result, seen):
+                    return False
+            elif option in ("-c", "--constraint"):
+                result.options += ["-c", str(path.parent / value)]
+            elif option in ("-e", "--editable"):
+                return False
+            else:
+                result.options += tokens
+
+            continue
+
+        try:
+            requirement = Requirement(line)
+        except InvalidRequirement:
+            # local paths, archives and per-requirement options
+            return False
+
+        if requirement.url:
+            return False
+
+        result.requirements.append(requirement)
+
+    return True
+
+
+def read_requirements_file(path: Path) -> Optional[RequirementsFile]:
+    """
+    Parse requirements file, including the files it references.
+
+    Returns:
+        Parsed file or None if it uses something only pip can reason about
+        (editable installs, URLs, local paths or environment variables).
+    """
+    result = RequirementsFile()
+    if not _read_requirements_file(path, result, set()):
+        return None
+
+    return result
+
+
+def _applies(requirement: Requirement, extras: tuple[str, ...]) -> bool:
+    if requirement.marker is None:
+        return True
+
+    return any(requirement.marker.evaluate({"extra": extra}) for extra in extras)
+
+
+def _is_satisfied(
+    requirement: Requirement, distribution: Optional[InstalledDistribution]
+) -> bool:
+    if distribution is None:
+        return False
+
+    try:
+        return requirement.specifier.contains(distribution.version, prereleases=True)
+    except InvalidVersion:
+        return False
+
+
+def _without_marker(requirement: Requirement) -> str:
+    extras = f"[{','.join(sorted(requirement.extras))}]" if requirement.extras else ""
+    return f"{requirement.name}{extras}{requirement.specifier}"
+
+
+def reconcile(
+    requirements: RequirementsFile, installed: dict[str, InstalledDistribution]
+) -> ReconcilePlan:
+    """
+    Compare requirements with installed distributions.
+
+    Requirements of installed distributions are followed, so changed transitive
+    dependencies are found as well. Whatever pip gets to install it resolves on
+    its own, dependencies of those are not examined.
+
+    Args:
+        requirements: Parsed requirements file.
+        installed: Distributions installed in the environment by canonical name.
+
+    Returns:
+        What to install and what nothing needs.
+    """
+    install: dict[str, None] = {}
+    needed: set[str] = set()
+    visited: set[tuple[str, frozenset[str]]] = set()
+    pending = [(requirement, ("",)) for requirement in requirements.requirements]
+    while pending:
+        requirement, extras = pending.pop()
+        if not _applies(requirement, extras):
+            continue
+
+        name = canonicalize_name(requirement.name)
+        needed.add(name)
+        distribution = installed.get(name)
+        if not _is_satisfied(requirement, distribution):
+            install[_without_marker(requirement)] = None
+            continue
+
+        key = (name, frozenset(requirement.extras))
+        if key in visited:
+            continue
+
+        visited.add(key)
+        assert distribution is not None
+        dependency_extras = ("", *sorted(requirement.extras))
+        for dependency in distribution.requires:
+            pending.append((dependency, dependency_extras))
+
+    extraneous = sorted(
+        distribution.name
+        for name, distribution in installed.items()
+        if name not in needed and name not in PROTECTED_DISTRIBUTIONS
+    )
+    return ReconcilePlan(install=list(install), extraneous=extraneous)
@@ -0,0 +1,229 @@
+"""
+Index of projects managed by pyvem.
+
+Maps absolute project path to its virtual environment so commands don't need to
+detect the tool and parse manifests of the project over and over. A record is
+valid only while the manifests of the project keep the mtimes they had when the
+record was saved.
+"""
+
+import json
+import sqlite3
+import time
+from dataclasses import dataclass, field
+from hashlib import sha256
+from pathlib import Path
+from typing import Optional
+
+from pyvem.constants import MANIFEST_FILES, REGISTRY_FILE, VenvEnum
+
+# each item upgrades the schema by one version, never change already released ones
+_MIGRATIONS = [
+    """
+    CREATE TABLE projects (
+        project_path TEXT PRIMARY KEY,
+        venv_type TEXT NOT NULL,
+        ve_name TEXT NOT NULL UNIQUE,
+        env_path TEXT,
+        interpreter TEXT,
+        python_version TEXT,
+        manifests TEXT NOT NULL,
+        last_used REAL NOT NULL
+    )
+    """,
+    "ALTER TABLE projects ADD COLUMN interpreter_stamp TEXT",
+    "ALTER TABLE projects ADD COLUMN lockfile_stamp TEXT",
+    "ALTER TABLE projects ADD COLUMN sync_fingerprint TEXT",
+]
+
+
+def manifest_mtimes(project_path: Path) -> dict[str, Optional[int]]:
+    result: dict[str, Optional[int]] = {}
+    for manifest in MANIFEST_FILES:
+        try:
+            result[manifest] = (project_path / manifest).stat().st_mtime_ns
+        except FileNotFoundError:
+            result[manifest] = None
+
+    return result
+
+
+def file_stamp(path: Path) -> Optional[str]:
+    """
+    Cheap identity of file content, changes whenever the file is replaced or
+    modified. Symlinks are followed.
+    """
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+
+    return f"{stat.st_dev}:{stat.st_ino}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+@dataclass
+class ProjectRecord:
+    project_path: Path
+    venv_type: VenvEnum
+    # name of the environment (or link to it) in the `ve` directory of pyvem
+    ve_name: str
+    env_path: Optional[Path] = None
+    interpreter: Optional[Path] = None
+    python_version: Optional[str] = None
+    manifests: dict[str, Optional[int]] = field(default_factory=dict)
+    last_used: float = 0.0
+    # stamps of interpreter and lockfile at the time the env metadata was stored
+    interpreter_stamp: Optional[str] = None
+    lockfile_stamp: Optional[str] = None
+    # fingerprint of dependency files and the environment after the last sync
+    sync_fingerprint: Optional[str] = None
+
+    @property
+    def is_fresh(self) -> bool:
+        return self.manifests == manifest_mtimes(self.project_path)
+
+
+class ProjectRegistry:
+    def __init__(self, pyvem_dir: Path) -> None:
+        self.path = pyvem_dir / REGISTRY_FILE
+        self._connection: Optional[sqlite3.Connection] = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(self.path, timeout=30)
+            self._connection.row_factory = sqlite3.Row
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._migrate(self._connection)
+
+        return self._connection
+
+    @staticmethod
+    def _migrate(connection: sqlite3.Connection) -> None:
+        if connection.execute("PRAGMA user_version").fetchone()[0] == len(_MIGRATIONS):
+            return
+
+        # other pyvem processes may be migrating at the same time
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            version = connection.execute("PRAGMA user_version").fetchone()[0]
+            for migration in _MIGRATIONS[version:]:
+                connection.execute(migration)
+
+            connection.execute(f"PRAGMA user_version = {len(_MIGRATIONS)}")
+        except BaseException:
+            connection.rollback()
+            raise
+
+        connection.commit()
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    @staticmethod
+    def _to_record(row: sqlite3.Row) -> ProjectRecord:
+        return ProjectRecord(
+            project_path=Path(row["project_path"]),
+            venv_type=VenvEnum(row["venv_type"]),
+            ve_name=row["ve_name"],
+            env_path=Path(row["env_path"]) if row["env_path"] else None,
+            interpreter=Path(row["interpreter"]) if row["interpreter"] else None,
+            python_version=row["python_version"],
+            manifests=json.loads(row["manifests"]),
+            last_used=row["last_used"],
+            interpreter_stamp=row["interpreter_stamp"],
+            lockfile_stamp=row["lockfile_stamp"],
+            sync_fingerprint=row["sync_fingerprint"],
+        )
+
+    def get(self, project_path: Path, fresh: bool = True) -> Optional[ProjectRecord]:
+        """
+        Get record of the project.
+
+        Args:
+            project_path: Absolute path to the project.
+            fresh: Return the record only if manifests of the project haven't
+                changed since it was saved.
+
+        Returns:
+            Record of the project or None if there is no (fresh) record.
+        """
+        row = self.connection.execute(
+            "SELECT * FROM projects WHERE project_path = ?", (str(project_path),)
+        ).fetchone()
+        if row is None:
+            return None
+
+        record = self._to_record(row)
+        if fresh and not record.is_fresh:
+            return None
+
+        return record
+
+    def all(self) -> list[ProjectRecord]:
+        rows = self.connection.execute(
+            "SELECT * FROM projects ORDER BY project_path"
+        ).fetchall()
+        return [self._to_record(row) for row in rows]
+
+    def save(self, record: ProjectRecord) -> None:
+        record.manifests = manifest_mtimes(record.project_path)
+        record.last_used = time.time()
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO projects (project_path, venv_type, ve_name,"
+                " env_path, interpreter, python_version, manifests, last_used,"
+                " interpreter_stamp, lockfile_stamp, sync_fingerprint)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    str(record.project_path),
+                    record.venv_type.value,
+                    record.ve_name,
+                    str(record.env_path) if record.env_path else None,
+                    str(record.interpreter) if record.interpreter else None,
+                    record.python_version,
+                    json.dumps(record.manifests),
+                    record.last_used,
+                    record.interpreter_stamp,
+                    record.lockfile_stamp,
+                    record.sync_fingerprint,
+                ),
+            )
+
+    def touch(self, record: ProjectRecord) -> None:
+        record.last_used = time.time()
+        with self.connection:
+            self.connection.execute(
+                "UPDATE projects SET last_used = ? WHERE project_path = ?",
+                (record.last_used, str(record.project_path)),
+            )
+
+    def remove(self, project_path: Path) -> None:
+        with self.connection:
+            self.connection.execute(
+                "DELETE FROM projects WHERE project_path = ?", (str(project_path),)
+            )
+
+    def owner_of(self, ve_name: str) -> Optional[Path]:
+        row = self.connection.execute(
+            "SELECT project_path FROM projects WHERE ve_name = ?", (ve_name,)
+        ).fetchone()
+        return Path(row["project_path"]) if row else None
+
+    def allocate_ve_name(self, project_path: Path) -> str:
+        """
+        Pick name in the `ve` directory for the project.
+
+        Directory basename is used unless another project already owns it, then
+        the name is suffixed with a hash of the project path.
+        """
+        owner = self.owner_of(project_path.name)
+        if owner is None or owner == project_path:
+            return project_path.name
+
+        digest = sha256(str(project_path).encode()).hexdigest()[:8]
+        return f"{project_path.name}-{digest}"
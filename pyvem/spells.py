@@ -2,14 +2,26 @@
 :magic:
 """
 
+import errno
+import fcntl
 import fnmatch
+import json
 import os
-from collections import deque
+import re
+import shutil
 from contextlib import contextmanager
 from pathlib import Path
-from typing import Any, Optional
+from tempfile import NamedTemporaryFile
+from typing import TYPE_CHECKING, Any, Iterable, Iterator, Optional
+from urllib.parse import quote
 
-from tqdm import tqdm
+from pyvem.constants import IGNORED_DIRS
+
+if TYPE_CHECKING:
+    from tqdm import tqdm
+
+# ioctl request cloning whole file on btrfs/xfs (linux/fs.h)
+_FICLONE = 0x40049409
 
 
 def nested_get(d: dict[Any, Any], *args) -> Optional[Any]:
@@ -25,26 +37,220 @@ def nested_get(d: dict[Any, Any], *args) -> Optional[Any]:
     return result
 
 
+# (pattern, only_dirs, anchored)
+_GitIgnoreRule = tuple[str, bool, bool]
+
+
+def _read_gitignore(directory: str) -> list[_GitIgnoreRule]:
+    """
+    Parse `.gitignore` in directory to `(pattern, only_dirs, anchored)` rules.
+
+    Only the commonly used subset of the syntax is supported, negated patterns
+    are skipped.
+    """
+    try:
+        with open(os.path.join(directory, ".gitignore")) as gitignore:
+            lines = gitignore.read().splitlines()
+    except OSError:
+        return []
+
+    rules = []
+    for line in lines:
+        pattern = line.strip()
+        if not pattern or pattern.startswith(("#", "!")):
+            continue
+
+        only_dirs = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+        anchored = "/" in pattern
+        rules.append((pattern.lstrip("/"), only_dirs, anchored))
+
+    return rules
+
+
+def _is_gitignored(
+    path: str, is_dir: bool, gitignores: list[tuple[str, list[_GitIgnoreRule]]]
+) -> bool:
+    name = os.path.basename(path)
+    for base_dir, rules in gitignores:
+        relative_path = os.path.relpath(path, base_dir)
+        for pattern, only_dirs, anchored in rules:
+            if only_dirs and not is_dir:
+                continue
+
+            if fnmatch.fnmatch(relative_path if anchored else name, pattern):
+                return True
+
+    return False
+
+
+def find_first_occurrences(
+    path: Path,
+    patterns: Iterable[str],
+    max_depth: int = 4,
+    ignored_dirs: frozenset[str] = IGNORED_DIRS,
+) -> dict[str, Path]:
+    """
+    Search the directory tree breadth first for files matching the patterns.
+
+    The tree is walked only once for all the patterns and never deeper than
+    `max_depth` levels below `path`. Directories from `ignored_dirs`, gitignored
+    paths and symlinks to directories are not entered.
+
+    Args:
+        path: Directory to start the search in.
+        patterns: Shell-style patterns of file names, e.g. `*.spec`.
+        max_depth: How many levels of subdirectories are searched.
+        ignored_dirs: Names of directories which are never entered.
+
+    Returns:
+        Mapping of each found pattern to the full path of its shallowest
+        match. Patterns without match are missing.
+    """
+    remaining = list(dict.fromkeys(patterns))
+    found: dict[str, Path] = {}
+    level: list[tuple[str, list[tuple[str, list[_GitIgnoreRule]]]]] = [
+        (str(path.resolve()), [])
+    ]
+    for _ in range(max_depth + 1):
+        next_level = []
+        for directory, parent_gitignores in level:
+            try:
+                with os.scandir(directory) as it:
+                    entries = sorted(it, key=lambda entry: entry.name)
+            except OSError:
+                continue
+
+            gitignores = parent_gitignores
+            if any(entry.name == ".gitignore" for entry in entries):
+                rules = _read_gitignore(directory)
+                if rules:
+                    gitignores = parent_gitignores + [(directory, rules)]
+
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    continue
+
+                if is_dir and entry.name in ignored_dirs:
+                    continue
+
+                if gitignores and _is_gitignored(entry.path, is_dir, gitignores):
+                    continue
+
+                if is_dir:
+                    next_level.append((entry.path, gitignores))
+                    continue
+
+                matched = [p for p in remaining if fnmatch.fnmatch(entry.name, p)]
+                if not matched:
+                    continue
+
+                for pattern in matched:
+                    found[pattern] = Path(entry.path)
+
+                remaining = [pattern for pattern in remaining if pattern not in found]
+                if not remaining:
+                    return found
+
+        level = next_level
+
+    return found
+
+
 def find_first_occurrence_of_file(
     path: Path, pattern: str, max_depth: int = 4
 ) -> Optional[Path]:
-    resolved_path_str = str(path.resolve())
-    queue = deque([(resolved_path_str, 0)])
-    while queue:
-        curr_dir, curr_depth = queue.popleft()
-        if curr_depth > max_depth:
-            continue
+    return find_first_occurrences(path, [pattern], max_depth).get(pattern)
+
+
+def canonicalize_name(name: str) -> str:
+    """
+    Normalize python distribution name as PEP 503 does.
+    """
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def find_site_packages(env_path: Path) -> Path:
+    """
+    Path to `site-packages` of the python virtual environment.
+    """
+    for site_packages in sorted(env_path.glob("lib/python*/site-packages")):
+        return site_packages
+
+    raise FileNotFoundError(f"No site-packages in environment {env_path}")
 
-        # Path has walk method in 3.12
-        for root, dirs, files in os.walk(curr_dir):
-            matches = fnmatch.filter(files, pattern)
-            if matches:
-                return matches[0]
 
-            for subdir in dirs:
-                queue.append((os.path.join(root, subdir), curr_depth + 1))
+def link_file(src: Path, dst: Path, modes: list[str]) -> None:
+    """
+    Make dst share content with src using the first mode that works, modes
+    that fail because of the filesystem are dropped from the list for next time.
+    """
+    while modes:
+        mode = modes[0]
+        try:
+            if mode == "reflink":
+                with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+                    fcntl.ioctl(dst_file.fileno(), _FICLONE, src_file.fileno())
+                shutil.copystat(src, dst)
+            elif mode == "hardlink":
+                os.link(src, dst)
+            else:
+                shutil.copy2(src, dst)
 
-    return None
+            return
+        except OSError as exc:
+            if mode == "copy" or exc.errno not in (
+                errno.EXDEV,
+                errno.EPERM,
+                errno.EOPNOTSUPP,
+                errno.EINVAL,
+                errno.ENOTTY,
+                errno.EMLINK,
+            ):
+                raise
+
+            dst.unlink(missing_ok=True)
+            modes.pop(0)
+
+
+@contextmanager
+def locked_json(path: Path) -> Iterator[dict[str, Any]]:
+    """
+    Content of JSON file for reading and changing, locked against other
+    processes and threads for the whole block and written back atomically when
+    the block ends without error. Missing or broken file reads as empty dict.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path.with_name(path.name + ".lock"), "a") as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            try:
+                content = json.loads(path.read_text())
+            except (OSError, ValueError):
+                content = {}
+
+            yield content
+            with NamedTemporaryFile(
+                "w", dir=path.parent, suffix=".tmp", delete=False
+            ) as tmp_file:
+                json.dump(content, tmp_file)
+
+            os.replace(tmp_file.name, path)
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def format_table(header: tuple[str, ...], rows: list[tuple[str, ...]]) -> str:
+    """
+    Plain text table with left aligned columns.
+    """
+    widths = [max(len(row[i]) for row in [header, *rows]) for i in range(len(header))]
+    return "\n".join(
+        "  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip()
+        for row in [header, *rows]
+    )
 
 
 def parse_repository_name(repository_name: str) -> tuple[str, str]:
@@ -55,6 +261,14 @@ def parse_repository_name(repository_name: str) -> tuple[str, str]:
     return repository_name, "latest"
 
 
+def repository_file_name(repository: str, tag: str, suffix: str) -> str:
+    """
+    Name of a file of the repository and tag in pyvem dir, unique for each of
+    them. Neither contains a colon and slashes of repository are quoted.
+    """
+    return quote(f"{repository}:{tag}", safe=":") + suffix
+
+
 @contextmanager
 def progress_bar(
     desc: Optional[str] = None,
@@ -62,7 +276,9 @@ def progress_bar(
     update_tick: int = 0.3,
     position: int = 1,
     total: Optional[int] = None,
-) -> tqdm:
+) -> Iterator["tqdm"]:
+    from tqdm import tqdm
+
     bar = tqdm(
         desc=desc,
         total=total,
@@ -0,0 +1,490 @@
+"""
+Content-addressed store of unpacked wheels shared by virtual environments.
+
+Each distribution is unpacked once to `objects/<sha256>` in the store, keyed by
+the hash of the archive pip resolved it to (the wheel, or the sdist the wheel
+was built from). Environments get its files as reflinks, or copies if the
+filesystem doesn't support them, so environments pinning the same packages
+share them on disk while each can change its own files. Hardlinks are used only
+when asked for, the stored files are read-only then, so an environment can't
+change them for the others. The store counts which environments use which
+objects and objects are removed once no environment uses them.
+
+Environments take the store lock shared while installing and pruning takes it
+exclusively, so objects fetched but not referenced yet are never pruned.
+"""
+
+import csv
+import errno
+import fcntl
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import stat
+import zipfile
+from configparser import ConfigParser
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Iterator, Optional
+
+from pyvem.cmd import Cmd
+from pyvem.constants import STORE_DIR, SUCCESS
+from pyvem.exceptions import PyVemException
+from pyvem.spells import canonicalize_name, find_site_packages, link_file
+
+logger = logging.getLogger(__name__)
+
+_SCRIPT_TEMPLATE = """#!{interpreter}
+# -*- coding: utf-8 -*-
+import re
+import sys
+from {module} import {import_name}
+if __name__ == "__main__":
+    sys.argv[0] = re.sub(r"(-script\\.pyw|\\.exe)?$", "", sys.argv[0])
+    sys.exit({func}())
+"""
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    hash TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    version TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS refs (
+    env_path TEXT NOT NULL,
+    name TEXT NOT NULL,
+    hash TEXT NOT NULL REFERENCES objects(hash),
+    PRIMARY KEY (env_path, name)
+);
+CREATE INDEX IF NOT EXISTS refs_hash ON refs(hash);
+"""
+
+
+@dataclass
+class ResolvedDistribution:
+    name: str
+    version: str
+    # sha256 of the archive, None for local directories and VCS checkouts
+    hash: Optional[str]
+    # requirement string for pip if the distribution can't be stored
+    requirement: str
+    url: str
+
+
+def _make_read_only(path: Path) -> None:
+    for root, _, files in os.walk(path):
+        for file in files:
+            file_path = Path(root) / file
+            mode = file_path.stat().st_mode
+            file_path.chmod(mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+
+
+class PackageStore:
+    def __init__(
+        self, pyvem_dir: Path, cmd: Optional[Cmd] = None, hardlinks: bool = False
+    ) -> None:
+        """
+        Args:
+            pyvem_dir: Where the store is.
+            cmd: Runs pip.
+            hardlinks: Hardlink stored files to environments when reflinks are
+                not supported instead of copying them.
+        """
+        self.path = pyvem_dir / STORE_DIR
+        self.objects_dir = self.path / "objects"
+        self.cmd = cmd or Cmd()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._link_modes = ["reflink", "copy"]
+        if hardlinks:
+            self._link_modes.insert(1, "hardlink")
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self.objects_dir.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(self.path / "store.db", timeout=30)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.executescript(_SCHEMA)
+
+        return self._connection
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    @contextmanager
+    def lock(self, exclusive: bool = False) -> Iterator[None]:
+        """
+        Lock of the store between processes, installs hold it shared and prune
+        exclusively.
+        """
+        self.path.mkdir(parents=True, exist_ok=True)
+        with open(self.path / "lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def resolve(
+        self, pip_cmd: list[str], requirement_args: list[str], upgrade: bool
+    ) -> list[ResolvedDistribution]:
+        """
+        Ask pip which distributions the requirements need in the environment.
+
+        Without `upgrade` the whole set is returned, with it only the ones pip
+        would (re)install.
+        """
+        with TemporaryDirectory() as tmp:
+            report_path = Path(tmp) / "report.json"
+            cmd = pip_cmd + ["install", "--dry-run", "--quiet"]
+            cmd += ["--upgrade"] if upgrade else ["--ignore-installed"]
+            cmd += ["--report", str(report_path)] + requirement_args
+            self.cmd.run_cmd(cmd, tee_to_stdout=False, raise_on_failure=True)
+            report = json.loads(report_path.read_text())
+
+        result = []
+        for item in report["install"]:
+            name = canonicalize_name(item["metadata"]["name"])
+            version = item["metadata"]["version"]
+            download_info = item["download_info"]
+            url = download_info["url"]
+            archive_hash = None
+            if "archive_info" in download_info:
+                archive_info = download_info["archive_info"]
+                archive_hash = archive_info.get("hashes", {}).get("sha256")
+                legacy_hash = archive_info.get("hash", "")
+                if archive_hash is None and legacy_hash.startswith("sha256="):
+                    archive_hash = legacy_hash.split("=", 1)[1]
+
+            if "vcs_info" in download_info:
+                vcs_info = download_info["vcs_info"]
+                requirement = f"{vcs_info['vcs']}+{url}@{vcs_info['commit_id']}"
+            elif download_info.get("dir_info", {}).get("editable"):
+                requirement = f"-e {url}"
+            else:
+                requirement = url
+
+            result.append(
+                ResolvedDistribution(
+                    name=name,
+                    version=version,
+                    hash=archive_hash,
+                    requirement=requirement,
+                    url=url,
+                )
+            )
+
+        return result
+
+    def _object_path(self, object_hash: str) -> Path:
+        return self.objects_dir / object_hash
+
+    def _fetch(self, pip_cmd: list[str], missing: list[ResolvedDistribution]) -> None:
+        """
+        Download (or build from sdist) wheels of the distributions and unpack them
+        to the store.
+        """
+        # unpacked in the store so they can be renamed to place atomically
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        with TemporaryDirectory(dir=self.path) as tmp:
+            wheel_dir = Path(tmp) / "wheels"
+            self.cmd.run_cmd(
+                pip_cmd
+                + ["wheel", "--no-deps", "--quiet", "--wheel-dir", str(wheel_dir)]
+                + [f"{dist.url}#sha256={dist.hash}" for dist in missing],
+                tee_to_stdout=False,
+                raise_on_failure=True,
+            )
+            wheels = {
+                canonicalize_name(wheel.name.split("-")[0]): wheel
+                for wheel in wheel_dir.glob("*.whl")
+            }
+            for dist in missing:
+                assert dist.hash is not None
+                wheel = wheels.get(dist.name)
+                if wheel is None:
+                    raise PyVemException(f"pip built no wheel for {dist.name}")
+
+                unpacked = Path(tmp) / dist.hash
+                with zipfile.ZipFile(wheel) as wheel_zip:
+                    wheel_zip.extractall(unpacked)
+
+                # hardlinked to environments, none of them may change it
+                _make_read_only(unpacked)
+
+                try:
+                    unpacked.rename(self._object_path(dist.hash))
+                except OSError as exc:
+                    # unpacked by another pyvem process in the meantime
+                    if exc.errno not in (errno.EEXIST, errno.ENOTEMPTY):
+                        raise
+
+                with self.connection:
+                    self.connection.execute(
+                        "INSERT OR IGNORE INTO objects VALUES (?, ?, ?)",
+                        (dist.hash, dist.name, dist.version),
+                    )
+
+    @staticmethod
+    def _installed(site_packages: Path) -> dict[str, Path]:
+        return {
+            canonicalize_name(dist_info.name.rsplit("-", 1)[0]): dist_info
+            for dist_info in site_packages.glob("*.dist-info")
+        }
+
+    @staticmethod
+    def _remove_installed(site_packages: Path, dist_info: Path) -> None:
+        """
+        Remove files of the installed distribution listed in its RECORD, the same
+        way `pip uninstall` does.
+        """
+        record = dist_info / "RECORD"
+        if record.exists():
+            with open(record, newline="") as record_file:
+                for row in csv.reader(record_file):
+                    if row:
+                        (site_packages / row[0]).unlink(missing_ok=True)
+
+        shutil.rmtree(dist_info, ignore_errors=True)
+
+    def _link_tree(
+        self, src: Path, dst: Path, record: list[str], site_packages: Path
+    ) -> None:
+        for root, _, files in os.walk(src):
+            target_dir = dst / Path(root).relative_to(src)
+            target_dir.mkdir(parents=True, exist_ok=True)
+            for file in files:
+                target = target_dir / file
+                self._link(Path(root) / file, target)
+                record.append(os.path.relpath(target, site_packages))
+
+    def _link(self, src: Path, target: Path) -> None:
+        target.unlink(missing_ok=True)
+        link_file(src, target, self._link_modes)
+        target_stat = target.stat()
+        if target_stat.st_nlink == 1:
+            # own copy of the environment, copied as read-only from the store
+            target.chmod(target_stat.st_mode | stat.S_IWUSR)
+
+    def _install_script(self, content: bytes, target: Path, interpreter: Path) -> None:
+        if content.startswith(b"#!python"):
+            content = b"#!" + str(interpreter).encode() + content[len(b"#!python") :]
+
+        target.unlink(missing_ok=True)
+        target.write_bytes(content)
+        target.chmod(0o755)
+
+    def _link_object(
+        self, object_hash: str, env_path: Path, site_packages: Path
+    ) -> None:
+        """
+        Put distribution from the store to the environment, following the wheel
+        installation scheme of a virtual environment.
+        """
+        interpreter = env_path / "bin" / "python"
+        obj = self._object_path(object_hash)
+        record: list[str] = []
+        dist_info = None
+        for entry in obj.iterdir():
+            if entry.name.endswith(".dist-info"):
+                dist_info = entry
+
+            if not entry.name.endswith(".data"):
+                target = site_packages / entry.name
+                if entry.is_dir():
+                    self._link_tree(entry, target, record, site_packages)
+                else:
+                    self._link(entry, target)
+                    record.append(entry.name)
+
+                continue
+
+            for scheme in entry.iterdir():
+                if scheme.name in ("purelib", "platlib"):
+                    self._link_tree(scheme, site_packages, record, site_packages)
+                elif scheme.name == "data":
+                    self._link_tree(scheme, env_path, record, site_packages)
+                elif scheme.name == "headers":
+                    target = env_path / "include" / "site" / site_packages.parent.name
+                    self._link_tree(scheme, target, record, site_packages)
+                elif scheme.name == "scripts":
+                    for script in scheme.iterdir():
+                        target = env_path / "bin" / script.name
+                        self._install_script(script.read_bytes(), target, interpreter)
+                        record.append(os.path.relpath(target, site_packages))
+
+        if dist_info is None:
+            raise PyVemException(f"No .dist-info in stored wheel {object_hash}")
+
+        env_dist_info = site_packages / dist_info.name
+        record += self._write_entry_points(dist_info, env_path, site_packages)
+
+        # RECORD and INSTALLER are environment specific, never share them
+        installer = env_dist_info / "INSTALLER"
+        installer.unlink(missing_ok=True)
+        installer.write_text("pyvem\n")
+        record.append(os.path.relpath(installer, site_packages))
+
+        record_path = env_dist_info / "RECORD"
+        record_relpath = os.path.relpath(record_path, site_packages)
+        record_path.unlink(missing_ok=True)
+        with open(record_path, "w", newline="") as record_file:
+            writer = csv.writer(record_file)
+            for path in dict.fromkeys(record):
+                if path != record_relpath:
+                    writer.writerow([path, "", ""])
+
+            writer.writerow([record_relpath, "", ""])
+
+    @staticmethod
+    def _write_entry_points(
+        dist_info: Path, env_path: Path, site_packages: Path
+    ) -> list[str]:
+        entry_points_file = dist_info / "entry_points.txt"
+        if not entry_points_file.exists():
+            return []
+
+        parser = ConfigParser(delimiters=("=",))
+        parser.optionxform = str  # type: ignore[assignment,method-assign]
+        parser.read(entry_points_file)
+        written = []
+        for section in ("console_scripts", "gui_scripts"):
+            if not parser.has_section(section):
+                continue
+
+            for script_name, value in parser.items(section):
+                module, _, func = value.split("[")[0].strip().partition(":")
+                target = env_path / "bin" / script_name
+                target.unlink(missing_ok=True)
+                target.write_text(
+                    _SCRIPT_TEMPLATE.format(
+                        interpreter=env_path / "bin" / "python",
+                        module=module.strip(),
+                        import_name=func.strip().split(".")[0],
+                        func=func.strip(),
+                    )
+                )
+                target.chmod(0o755)
+                written.append(os.path.relpath(target, site_packages))
+
+        return written
+
+    def _install_storable(
+        self,
+        env_path: Path,
+        site_packages: Path,
+        pip_cmd: list[str],
+        storable: list[ResolvedDistribution],
+    ) -> None:
+        missing = [
+            dist
+            for dist in {dist.hash: dist for dist in storable}.values()
+            if not self._object_path(str(dist.hash)).exists()
+        ]
+        if missing:
+            logger.debug(f"Fetching to store: {[dist.name for dist in missing]}")
+            self._fetch(pip_cmd, missing)
+
+        installed = self._installed(site_packages)
+        for dist in storable:
+            assert dist.hash is not None
+            if dist.name in installed:
+                self._remove_installed(site_packages, installed[dist.name])
+
+            self._link_object(dist.hash, env_path, site_packages)
+            with self.connection:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO refs VALUES (?, ?, ?)",
+                    (str(env_path), dist.name, dist.hash),
+                )
+
+    def install(
+        self,
+        env_path: Path,
+        pip_cmd: list[str],
+        requirement_args: list[str],
+        upgrade: bool = False,
+    ) -> int:
+        """
+        Install requirements to the environment from the store.
+
+        Distributions missing in the store are fetched to it first. Local
+        directories and VCS checkouts can't be stored, those are installed by pip
+        as usual.
+
+        Args:
+            env_path: Root of the virtual environment.
+            pip_cmd: Command running pip for the environment.
+            requirement_args: Arguments of `pip install` selecting requirements.
+            upgrade: Upgrade already installed distributions.
+
+        Returns:
+            retval
+        """
+        site_packages = find_site_packages(env_path)
+        resolved = self.resolve(pip_cmd, requirement_args, upgrade)
+        storable = [dist for dist in resolved if dist.hash is not None]
+        # objects are unreferenced until linked, prune must wait for them
+        with self.lock():
+            self._install_storable(env_path, site_packages, pip_cmd, storable)
+
+        not_storable = [dist for dist in resolved if dist.hash is None]
+        if not not_storable:
+            return SUCCESS
+
+        args = []
+        for dist in not_storable:
+            args += dist.requirement.split(" ", 1)
+
+        return self.cmd.run_cmd(pip_cmd + ["install", "--no-deps"] + args).retval
+
+    def release(self, env_path: Path, names: Optional[list[str]] = None) -> None:
+        """
+        Forget objects used by the environment and prune unused ones.
+
+        Args:
+            env_path: Root of the virtual environment.
+            names: Forget only objects of these distributions.
+        """
+        with self.connection:
+            if names is None:
+                self.connection.execute(
+                    "DELETE FROM refs WHERE env_path = ?", (str(env_path),)
+                )
+            else:
+                self.connection.executemany(
+                    "DELETE FROM refs WHERE env_path = ? AND name = ?",
+                    [(str(env_path), canonicalize_name(name)) for name in names],
+                )
+
+        self.prune()
+
+    def prune(self) -> list[str]:
+        """
+        Remove objects no environment uses.
+
+        Returns:
+            Hashes of the removed objects.
+        """
+        with self.lock(exclusive=True):
+            unused = [
+                row[0]
+                for row in self.connection.execute(
+                    "SELECT hash FROM objects WHERE hash NOT IN (SELECT hash FROM refs)"
+                )
+            ]
+            for object_hash in unused:
+                with self.connection:
+                    self.connection.execute(
+                        "DELETE FROM objects WHERE hash = ?", (object_hash,)
+                    )
+
+                shutil.rmtree(self._object_path(object_hash), ignore_errors=True)
+
+        return unused
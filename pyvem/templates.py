@@ -0,0 +1,123 @@
+"""
+Pre-built virtual environments new venv environments are cloned from.
+
+Creating a virtual environment with pip means running `ensurepip`, which takes
+seconds. Instead an environment is created once per interpreter (and python
+version) in the `templates` directory of pyvem and every new environment is
+cloned from it: files are reflinked or copied, symlinks recreated and the
+files naming the environment path (`pyvenv.cfg`, activate scripts and shebangs
+of scripts in `bin`) rewritten to the new location. Files are never hardlinked,
+environments write into their files and would change the template.
+"""
+
+import errno
+import logging
+import os
+import platform
+import stat
+import sys
+import venv
+from hashlib import sha256
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from pyvem.constants import TEMPLATES_DIR
+from pyvem.spells import link_file
+
+logger = logging.getLogger(__name__)
+
+
+def _rewrite_file(src: Path, dst: Path, old: bytes, new: bytes) -> bool:
+    """
+    Write src with old replaced by new to dst, nothing is written if src doesn't
+    contain old.
+    """
+    content = src.read_bytes()
+    if old not in content:
+        return False
+
+    mode = src.stat().st_mode
+    dst.unlink(missing_ok=True)
+    dst.write_bytes(content.replace(old, new))
+    dst.chmod(stat.S_IMODE(mode))
+    return True
+
+
+class VenvTemplates:
+    def __init__(self, pyvem_dir: Path, with_pip: bool = True) -> None:
+        self.path = pyvem_dir / TEMPLATES_DIR
+        self.with_pip = with_pip
+        # the interpreter `venv` creates environments for
+        self.interpreter = Path(getattr(sys, "_base_executable", sys.executable))
+        self._link_modes = ["reflink", "copy"]
+
+    @property
+    def template_path(self) -> Path:
+        key = f"{self.interpreter}:{platform.python_version()}:{self.with_pip}"
+        return self.path / sha256(key.encode()).hexdigest()[:16]
+
+    def _build(self) -> Path:
+        template = self.template_path
+        self.path.mkdir(parents=True, exist_ok=True)
+        logger.debug(f"Building venv template {template} for {self.interpreter}")
+        with TemporaryDirectory(dir=self.path) as tmp:
+            # renamed to its final path once built, the path baked into its
+            # scripts is rewritten to it first
+            building = Path(tmp) / "env"
+            venv.create(str(building), with_pip=self.with_pip)
+            old, new = str(building).encode(), str(template).encode()
+            for file in [building / "pyvenv.cfg", *(building / "bin").iterdir()]:
+                if not file.is_symlink():
+                    _rewrite_file(file, file, old, new)
+
+            try:
+                building.rename(template)
+            except OSError as exc:
+                # built by another pyvem process in the meantime
+                if exc.errno not in (errno.EEXIST, errno.ENOTEMPTY):
+                    raise
+
+        return template
+
+    def get(self) -> Path:
+        """
+        Path to the template of the interpreter, built if it doesn't exist yet.
+        """
+        template = self.template_path
+        if (template / "pyvenv.cfg").exists():
+            return template
+
+        return self._build()
+
+    def clone(self, target: Path) -> None:
+        """
+        Create virtual environment at target from the template.
+
+        Args:
+            target: Root of the new virtual environment, may already exist.
+        """
+        template = self.get()
+        old, new = str(template).encode(), str(target).encode()
+        for root, dirs, files in os.walk(template):
+            relative_root = Path(root).relative_to(template)
+            target_dir = target / relative_root
+            target_dir.mkdir(parents=True, exist_ok=True)
+            for name in dirs + files:
+                src = Path(root) / name
+                dst = target_dir / name
+                if src.is_symlink():
+                    if dst.is_symlink() or dst.is_file():
+                        dst.unlink()
+
+                    dst.symlink_to(os.readlink(src))
+                elif name in dirs:
+                    continue
+                elif relative_root == Path("bin") or name == "pyvenv.cfg":
+                    if not _rewrite_file(src, dst, old, new):
+                        dst.unlink(missing_ok=True)
+                        link_file(src, dst, self._link_modes)
+                else:
+                    # bytecode is cloned too, it only makes tracebacks of pip
+                    # show the path the template was built at
+                    dst.unlink(missing_ok=True)
+                    link_file(src, dst, self._link_modes)
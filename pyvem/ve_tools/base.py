@@ -3,20 +3,266 @@ Abstract class for merging the functionality of all the virtual environment
 tools in `ve_tools/` to one tool.
 """
 
+import os
+import shutil
 from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from hashlib import sha256
 from pathlib import Path
+from typing import TYPE_CHECKING, NoReturn, Optional
 
+from pyvem.config import Config
+from pyvem.constants import SUCCESS, VenvEnum
+from pyvem.exceptions import PyVemException
 from pyvem.pyvem import PyVem
+from pyvem.registry import ProjectRecord, ProjectRegistry, file_stamp
+from pyvem.spells import find_site_packages
+
+if TYPE_CHECKING:
+    from pyvem.inventory import InstalledDistribution
+
+
+@dataclass
+class EnvMetadata:
+    interpreter: Path
+    python_version: str
+    env_path: Path
 
 
 class VirtualEnvironment(ABC, PyVem):
-    def __init__(self) -> None:
-        super().__init__()
+    venv_type: VenvEnum
+    # file which changes whenever the tool changes the environment
+    lockfile: Optional[str] = None
+    # files of the project the dependencies of the environment are synced from
+    sync_files: tuple[str, ...] = ()
+
+    def __init__(
+        self,
+        config: Optional[Config] = None,
+        registry: Optional[ProjectRegistry] = None,
+        project_path: Optional[Path] = None,
+    ) -> None:
+        super().__init__(config=config, project_path=project_path)
         self.ve_dir = self.pyvem_dir / "ve"
         if not self.ve_dir.exists():
             self.ve_dir.mkdir(parents=True, exist_ok=True)
 
-        self.project_dir = self.ve_dir / self.project_name
+        self.registry = registry or ProjectRegistry(self.pyvem_dir)
+        self.record = self._get_record()
+        self.project_dir = self.ve_dir / self.record.ve_name
+
+    def _get_record(self) -> ProjectRecord:
+        record = self.registry.get(self.cwd, fresh=False)
+        if record is None:
+            record = ProjectRecord(
+                project_path=self.cwd,
+                venv_type=self.venv_type,
+                ve_name=self.registry.allocate_ve_name(self.cwd),
+            )
+            self.registry.save(record)
+            return record
+
+        if record.venv_type != self.venv_type:
+            # project switched to another tool, the old environment is not ours
+            record.venv_type = self.venv_type
+            record.env_path = record.interpreter = record.python_version = None
+            record.sync_fingerprint = None
+            self.registry.save(record)
+        elif not record.is_fresh:
+            self.registry.save(record)
+        else:
+            self.registry.touch(record)
+
+        return record
+
+    def _lockfile_stamp(self) -> Optional[str]:
+        if self.lockfile is None:
+            return None
+
+        return file_stamp(self.cwd / self.lockfile)
+
+    def _cached_env_metadata(self) -> Optional[EnvMetadata]:
+        record = self.record
+        if (
+            record.interpreter is None
+            or record.python_version is None
+            or record.env_path is None
+            or record.interpreter_stamp is None
+        ):
+            return None
+
+        if record.interpreter_stamp != file_stamp(record.interpreter):
+            return None
+
+        if record.lockfile_stamp != self._lockfile_stamp():
+            return None
+
+        return EnvMetadata(
+            interpreter=record.interpreter,
+            python_version=record.python_version,
+            env_path=record.env_path,
+        )
+
+    def env_metadata(self, refresh: bool = False) -> EnvMetadata:
+        """
+        Interpreter, python version and root of the environment.
+
+        Answered from the registry while the interpreter binary and the lockfile
+        of the project are the same as when the metadata were stored, otherwise
+        the tool is asked and the registry updated.
+
+        Args:
+            refresh: Ignore the stored metadata.
+
+        Returns:
+            Metadata of the environment.
+        """
+        if not refresh:
+            cached = self._cached_env_metadata()
+            if cached is not None:
+                return cached
+
+        metadata = self._query_env_metadata()
+        self.record.interpreter = metadata.interpreter
+        self.record.python_version = metadata.python_version
+        self.record.env_path = metadata.env_path
+        self.record.interpreter_stamp = file_stamp(metadata.interpreter)
+        self.record.lockfile_stamp = self._lockfile_stamp()
+        self.registry.save(self.record)
+        return metadata
+
+    def _sync_fingerprint(self, dev: bool) -> Optional[str]:
+        """
+        Hash of everything a sync of dependencies depends on: content of the sync
+        files, the interpreter and distributions installed in the environment.
+
+        Returns:
+            Fingerprint or None if the environment doesn't exist.
+        """
+        try:
+            metadata = self.env_metadata()
+            site_packages = find_site_packages(metadata.env_path)
+            distributions = sorted(
+                entry.name
+                for entry in os.scandir(site_packages)
+                if entry.name.endswith((".dist-info", ".egg-info", ".egg-link"))
+            )
+        except (PyVemException, OSError):
+            return None
+
+        fingerprint = sha256()
+        fingerprint.update(f"{self.venv_type.value}:{dev}\n".encode())
+        for sync_file in self.sync_files:
+            try:
+                content = (self.cwd / sync_file).read_bytes()
+            except FileNotFoundError:
+                content = b""
+
+            digest = sha256(content).hexdigest()
+            fingerprint.update(f"{sync_file}:{digest}\n".encode())
+
+        fingerprint.update(
+            f"{metadata.interpreter}:{file_stamp(metadata.interpreter)}\n".encode()
+        )
+        fingerprint.update("\n".join(distributions).encode())
+        return fingerprint.hexdigest()
+
+    def _record_sync(self, dev: bool) -> None:
+        self.record.sync_fingerprint = self._sync_fingerprint(dev)
+        self.registry.save(self.record)
+
+    def update_deps(self, dev: bool, upgrade: bool = False) -> int:
+        """
+        Updates dependencies in virtual environment.
+
+        Nothing is done if neither the sync files, the interpreter nor installed
+        distributions changed since the last successful sync, unless an upgrade
+        is asked for, newer versions may have been released meanwhile.
+
+        Args:
+            dev: Install also development dependencies
+            upgrade: Upgrade dependencies to the newest allowed versions even
+                if nothing changed
+
+        Returns:
+            retval
+        """
+        if not upgrade and self.record.sync_fingerprint is not None:
+            if self.record.sync_fingerprint == self._sync_fingerprint(dev):
+                print("Dependencies are up to date, use --upgrade to upgrade them")
+                return SUCCESS
+
+        retval = self._update_deps(dev)
+        if retval == SUCCESS:
+            self._record_sync(dev)
+
+        return retval
+
+    def installed_distributions(self) -> list["InstalledDistribution"]:
+        """
+        Distributions installed in the environment, read from their metadata
+        in site-packages and cached until site-packages changes.
+
+        Returns:
+            Distributions sorted by name.
+        """
+        try:
+            site_packages = find_site_packages(self.env_metadata().env_path)
+        except FileNotFoundError as exc:
+            raise PyVemException(f"{exc}, is the environment installed?") from exc
+
+        # packaging it needs is slow to import, only these commands read it
+        from pyvem.inventory import InventoryCache
+
+        distributions = InventoryCache(self.pyvem_dir).get(site_packages)
+        return [distributions[name] for name in sorted(distributions)]
+
+    def env_variables(self) -> dict[str, str]:
+        """
+        Environment variables of a process running inside the virtual environment,
+        the same as sourcing its `activate` script would set.
+        """
+        try:
+            bin_dir = self.env_metadata().interpreter.parent
+        except FileNotFoundError as exc:
+            raise PyVemException(
+                f"Virtual environment of {self.project_name} is not installed,"
+                " run `pyvem install` first"
+            ) from exc
+
+        environ = dict(os.environ)
+        environ.pop("PYTHONHOME", None)
+        environ["VIRTUAL_ENV"] = str(bin_dir.parent)
+        environ["PATH"] = os.pathsep.join(
+            filter(None, [str(bin_dir), environ.get("PATH")])
+        )
+        return environ
+
+    def exec_in_env(self, args: list[str]) -> NoReturn:
+        """
+        Replace the current process with the command running in the virtual
+        environment. No shell nor the tool itself is started in between.
+
+        Args:
+            args: Command and its arguments, passed to the process as they are.
+        """
+        environ = self.env_variables()
+        executable = shutil.which(args[0], path=environ["PATH"])
+        if executable is None:
+            raise PyVemException(f"Command {args[0]} not found in the environment")
+
+        os.chdir(self.cwd)
+        os.execve(executable, args, environ)
+
+    def _python_version_of(self, interpreter: Path) -> str:
+        return (
+            self.cmd([str(interpreter), "-V"], tee_to_stdout=False)
+            .stderr_and_stdout.split(" ")[-1]
+            .strip()
+        )
+
+    def unregister(self) -> None:
+        self.registry.remove(self.cwd)
 
     def unlink_ve_dir(self) -> None:
         if not self.project_dir.exists():
@@ -28,9 +274,18 @@ class VirtualEnvironment(ABC, PyVem):
         self.project_dir.symlink_to(link_folder, target_is_directory=True)
 
     @abstractmethod
-    def update_deps(self, dev: bool) -> int:
+    def _query_env_metadata(self) -> EnvMetadata:
         """
-        Updates dependencies in virtual environment.
+        Ask the tool about the environment, see `env_metadata`.
+
+        Returns:
+            Metadata of the environment.
+        """
+
+    @abstractmethod
+    def _update_deps(self, dev: bool) -> int:
+        """
+        Updates dependencies in virtual environment, see `update_deps`.
 
         Args:
             dev: Install also development dependencies
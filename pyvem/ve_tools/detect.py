@@ -0,0 +1,68 @@
+"""
+Pick the virtual environment tool which manages a project.
+"""
+
+from os import listdir
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional, Type
+
+from pyvem.config import Config
+from pyvem.constants import NO_KNOWN_VENV, VenvEnum
+from pyvem.exceptions import PyVemException
+from pyvem.registry import ProjectRegistry
+
+if TYPE_CHECKING:
+    from pyvem.ve_tools.base import VirtualEnvironment
+
+
+def detect_venv_type(project_path: Path) -> VenvEnum:
+    dir_content = listdir(project_path)
+    if "Pipfile" in dir_content:
+        return VenvEnum.pipenv
+
+    if (
+        "pyproject.toml" in dir_content
+        and "[tool.poetry]" in (project_path / "pyproject.toml").read_text()
+    ):
+        return VenvEnum.poetry
+
+    if "setup.py" in dir_content or "pyproject.toml" in dir_content:
+        return VenvEnum.venv
+
+    raise PyVemException(NO_KNOWN_VENV)
+
+
+# backends are imported only once we know which one the project uses so a command
+# never pays for importing the tools it won't touch
+def get_venv_class(venv_type: VenvEnum) -> Type["VirtualEnvironment"]:
+    if venv_type == VenvEnum.pipenv:
+        from pyvem.ve_tools.pipenv import Pipenv
+
+        return Pipenv
+
+    if venv_type == VenvEnum.poetry:
+        from pyvem.ve_tools.poetry import Poetry
+
+        return Poetry
+
+    from pyvem.ve_tools.venv import Venv
+
+    return Venv
+
+
+def get_venv_instance(
+    project_path: Path, config: Optional[Config] = None
+) -> "VirtualEnvironment":
+    """
+    Create virtual environment tool instance of the project.
+
+    The tool is taken from the project registry if manifests of the project are
+    unchanged since the last run, otherwise it is detected from the manifests.
+    """
+    config = config or Config.get_config()
+    registry = ProjectRegistry(config.path_to_pyvem_dir)
+    record = registry.get(project_path)
+    venv_type = record.venv_type if record else detect_venv_type(project_path)
+    return get_venv_class(venv_type)(
+        config=config, registry=registry, project_path=project_path
+    )
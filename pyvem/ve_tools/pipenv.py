@@ -3,14 +3,15 @@ from pathlib import Path
 
 from pyvem.constants import INFO_TEMPLATE, SUCCESS, VenvEnum
 from pyvem.exceptions import PyVemException
-from pyvem.ve_tools.base import VirtualEnvironment
+from pyvem.ve_tools.base import EnvMetadata, VirtualEnvironment
 
 
 class Pipenv(VirtualEnvironment):
-    def __init__(self) -> None:
-        super().__init__()
+    venv_type = VenvEnum.pipenv
+    lockfile = "Pipfile.lock"
+    sync_files = ("Pipfile", "Pipfile.lock")
 
-    def update_deps(self, dev: bool) -> int:
+    def _update_deps(self, dev: bool) -> int:
         cmd = ["pipenv", "update"]
         if dev:
             cmd.append("--dev")
@@ -19,37 +20,40 @@ class Pipenv(VirtualEnvironment):
 
     def delete(self) -> int:
         self.unlink_ve_dir()
+        self.unregister()
         return self.cmd(["pipenv", "--rm"]).retval
 
-    def env_path(self) -> Path:
-        return Path(
-            self.cmd(
-                ["pipenv", "--py"], tee_to_stdout=False, raise_on_failure=True
-            ).stderr_and_stdout.split("\n")[-1]
+    def _query_env_metadata(self) -> EnvMetadata:
+        result = self.cmd(
+            ["pipenv", "--py"], tee_to_stdout=False, raise_on_failure=True
+        )
+        interpreter = Path(result.stderr_and_stdout.split("\n")[-1])
+        # asking the interpreter directly spares the startup of `pipenv run`
+        return EnvMetadata(
+            interpreter=interpreter,
+            python_version=self._python_version_of(interpreter),
+            # the interpreter is `<env>/bin/python`, no need to ask `pipenv --venv`
+            env_path=interpreter.parent.parent,
         )
 
-    def _get_python_version(self) -> str:
-        return self.cmd(
-            ["pipenv", "run", "python3", "-V"],
-            tee_to_stdout=False,
-            raise_on_failure=True,
-        ).stderr_and_stdout.split("\n")[-1]
+    def env_path(self) -> Path:
+        return self.env_metadata().interpreter
 
     def info(self) -> str:
         try:
-            py_version = self._get_python_version()
+            metadata = self.env_metadata()
         except PyVemException as e:
             if "pipenv --python path/to/python" not in str(e):
                 raise
 
             self.cmd(["pipenv", "--python", sys.executable], raise_on_failure=True)
-            py_version = self._get_python_version()
+            metadata = self.env_metadata(refresh=True)
 
         return INFO_TEMPLATE.format(
-            version=py_version,
+            version=metadata.python_version,
             name=self.project_name,
             folder_path=self.project_dir if self.project_dir.exists() else "NA",
-            interpreter_path=str(self.env_path()),
+            interpreter_path=str(metadata.interpreter),
             venv_type=VenvEnum.pipenv.value,
         )
 
@@ -67,7 +71,8 @@ class Pipenv(VirtualEnvironment):
 
         retval = self.cmd(cmd).retval
         if retval == SUCCESS:
-            self.link_ve_dir(self.env_path().parent.parent)
+            self.link_ve_dir(self.env_metadata(refresh=True).env_path)
+            self._record_sync(dev)
 
         return retval
 
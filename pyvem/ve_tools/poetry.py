@@ -2,14 +2,15 @@ from pathlib import Path
 
 from pyvem.constants import INFO_TEMPLATE, SUCCESS, VenvEnum
 from pyvem.exceptions import PyVemException
-from pyvem.ve_tools.base import VirtualEnvironment
+from pyvem.ve_tools.base import EnvMetadata, VirtualEnvironment
 
 
 class Poetry(VirtualEnvironment):
-    def __init__(self) -> None:
-        super().__init__()
+    venv_type = VenvEnum.poetry
+    lockfile = "poetry.lock"
+    sync_files = ("poetry.lock", "pyproject.toml")
 
-    def update_deps(self, dev: bool) -> int:
+    def _update_deps(self, dev: bool) -> int:
         cmd = ["poetry", "update"]
         if not dev:
             cmd += ["--only", "main"]
@@ -18,34 +19,47 @@ class Poetry(VirtualEnvironment):
 
     def delete(self) -> int:
         self.unlink_ve_dir()
+        self.unregister()
         return self.cmd(["poetry", "env", "remove", "--all"]).retval
 
-    def env_path(self) -> Path:
+    def _query_env_metadata(self) -> EnvMetadata:
         output = self.cmd(
             ["poetry", "env", "info"], tee_to_stdout=False, raise_on_failure=True
         )
-        for line in output.stderr_and_stdout.split("\n"):
-            if line.startswith("Executable:"):
-                return Path(line.split(":")[-1].strip())
-
-        raise PyVemException("No executable env path provided by poetry")
 
-    def info(self) -> str:
-        output = self.cmd(
-            ["poetry", "env", "info"], tee_to_stdout=False, raise_on_failure=True
+        # the first section describes the virtualenv, the second the base python
+        values: dict[str, str] = {}
+        for line in output.stderr_and_stdout.split("\n"):
+            key, sep, value = line.partition(":")
+            if sep and key.strip() not in values:
+                values[key.strip()] = value.strip()
+
+        executable = values.get("Executable")
+        if executable is None or executable == "NA":
+            raise PyVemException("No executable env path provided by poetry")
+
+        interpreter = Path(executable)
+        env_path = values.get("Path")
+        return EnvMetadata(
+            interpreter=interpreter,
+            python_version=values.get("Python", ""),
+            env_path=(
+                Path(env_path)
+                if env_path and env_path != "NA"
+                else interpreter.parent.parent
+            ),
         )
 
-        py_version = ""
-        for line in output.stderr_and_stdout.split("\n"):
-            if line.startswith("Python:"):
-                py_version = line.split(":")[-1].strip()
-                break
+    def env_path(self) -> Path:
+        return self.env_metadata().interpreter
 
+    def info(self) -> str:
+        metadata = self.env_metadata()
         return INFO_TEMPLATE.format(
-            version=py_version,
+            version=metadata.python_version,
             name=self.project_name,
             folder_path=self.project_dir if self.project_dir.exists() else "NA",
-            interpreter_path=str(self.env_path()),
+            interpreter_path=str(metadata.interpreter),
             venv_type=VenvEnum.poetry.value,
         )
 
@@ -59,7 +73,8 @@ class Poetry(VirtualEnvironment):
 
         retval = self.cmd(cmd).retval
         if retval == SUCCESS:
-            self.link_ve_dir(self.env_path().parent.parent)
+            self.link_ve_dir(self.env_metadata(refresh=True).env_path)
+            self._record_sync(dev)
 
         return retval
 
@@ -1,24 +1,41 @@
 import os
 import shutil
-import venv
-from os import get_terminal_size, getcwd, listdir
+import sys
+from functools import cached_property
+from os import get_terminal_size, listdir
 from pathlib import Path
+from typing import TYPE_CHECKING, Optional
 
-from pexpect import spawn
-
+from pyvem.cmd import Cmd
+from pyvem.config import Config
 from pyvem.constants import (
+    COMMAND_NOT_FOUND,
     INFO_TEMPLATE,
     REQUIREMENTS_FILE,
     SUCCESS,
     ShellEnum,
     VenvEnum,
 )
-from pyvem.ve_tools.base import VirtualEnvironment
+from pyvem.registry import ProjectRegistry
+from pyvem.spells import find_site_packages
+from pyvem.templates import VenvTemplates
+from pyvem.ve_tools.base import EnvMetadata, VirtualEnvironment
+
+if TYPE_CHECKING:
+    from pyvem.store import PackageStore
 
 
 class Venv(VirtualEnvironment):
-    def __init__(self) -> None:
-        super().__init__()
+    venv_type = VenvEnum.venv
+    sync_files = (REQUIREMENTS_FILE, "pyproject.toml", "setup.py", "setup.cfg")
+
+    def __init__(
+        self,
+        config: Optional[Config] = None,
+        registry: Optional[ProjectRegistry] = None,
+        project_path: Optional[Path] = None,
+    ) -> None:
+        super().__init__(config=config, registry=registry, project_path=project_path)
         _shell_path = os.getenv("SHELL") or "/bin/bash"
         self.shell_path = Path(_shell_path)
 
@@ -31,24 +48,31 @@ class Venv(VirtualEnvironment):
 
         return ShellEnum[shell]
 
-    def update_deps(self, dev: bool) -> int:
-        return self.cmd(self._get_requirements_install_cmd(dev, True)).retval
+    def _update_deps(self, dev: bool) -> int:
+        return self._install_requirements(dev, True)
 
     def delete(self) -> int:
         shutil.rmtree(self.project_dir)
+        if self.config.use_package_store:
+            self.store.release(self.project_dir)
+
+        self.unregister()
         return SUCCESS
 
     def env_path(self) -> Path:
         return self.project_dir / "bin" / "python3"
 
-    def info(self) -> str:
-        py_version = (
-            self.cmd([str(self.env_path()), "--version"])
-            .stderr_and_stdout.split(" ")[-1]
-            .strip()
+    def _query_env_metadata(self) -> EnvMetadata:
+        interpreter = self.env_path()
+        return EnvMetadata(
+            interpreter=interpreter,
+            python_version=self._python_version_of(interpreter),
+            env_path=self.project_dir,
         )
+
+    def info(self) -> str:
         return INFO_TEMPLATE.format(
-            version=py_version,
+            version=self.env_metadata().python_version,
             name=self.project_name,
             folder_path=self.project_dir if self.project_dir.exists() else "NA",
             interpreter_path=self.env_path(),
@@ -63,6 +87,8 @@ class Venv(VirtualEnvironment):
         return self.env_path().parent / activate_suffix
 
     def use(self) -> int:
+        from pexpect import spawn
+
         activate_script = self._get_activate_script()
 
         terminal = get_terminal_size()
@@ -74,29 +100,115 @@ class Venv(VirtualEnvironment):
         child.close()
         return child.exitstatus
 
-    def _get_requirements_install_cmd(self, dev: bool, update: bool) -> list[str]:
-        cmd = [str(self.env_path()), "-m", "pip", "install"]
+    @cached_property
+    def store(self) -> "PackageStore":
+        from pyvem.store import PackageStore
+
+        return PackageStore(
+            self.pyvem_dir,
+            Cmd(self.cwd),
+            hardlinks=self.config.package_store_hardlinks,
+        )
+
+    @cached_property
+    def templates(self) -> VenvTemplates:
+        return VenvTemplates(self.pyvem_dir, with_pip=not self.config.venv_without_pip)
+
+    def _pip_cmd(self) -> list[str]:
+        if self.config.venv_without_pip:
+            return [sys.executable, "-m", "pip", "--python", str(self.env_path())]
+
+        return [str(self.env_path()), "-m", "pip"]
+
+    def _get_requirements_args(self, dev: bool) -> list[str]:
+        if REQUIREMENTS_FILE in listdir(self.cwd):
+            return ["-r", REQUIREMENTS_FILE]
+
+        if dev:
+            return ["-e", ".[dev]"]
+
+        return ["-e", "."]
+
+    def _get_requirements_install_cmd(
+        self, requirement_args: list[str], update: bool
+    ) -> list[str]:
+        cmd = self._pip_cmd() + ["install"]
         if update:
             cmd.append("--upgrade")
 
-        if REQUIREMENTS_FILE in listdir(getcwd()):
-            cmd += ["-r", REQUIREMENTS_FILE]
-            return cmd
+        return cmd + requirement_args
 
-        cmd.append("-e")
-        if dev:
-            cmd.append(".[dev]")
-        else:
-            cmd.append(".")
+    def _pip_install(self, requirement_args: list[str], update: bool) -> int:
+        if not self.config.use_package_store:
+            cmd = self._get_requirements_install_cmd(requirement_args, update)
+            return self.cmd(cmd).retval
+
+        return self.store.install(
+            self.project_dir, self._pip_cmd(), requirement_args, upgrade=update
+        )
+
+    def _reconcile_requirements(self) -> Optional[int]:
+        """
+        Install only requirements the environment doesn't satisfy and, if
+        configured, uninstall distributions no requirement needs.
+
+        Returns:
+            retval or None if the requirements can't be reconciled and have to
+            be handed to pip as a whole.
+        """
+        from pyvem.inventory import installed_distributions
+        from pyvem.reconcile import read_requirements_file, reconcile
+
+        requirements_path = self.cwd / REQUIREMENTS_FILE
+        if not requirements_path.exists():
+            return None
+
+        requirements = read_requirements_file(requirements_path)
+        if requirements is None:
+            return None
 
-        return cmd
+        site_packages = find_site_packages(self.project_dir)
+        plan = reconcile(requirements, installed_distributions(site_packages))
+        if plan.install:
+            retval = self._pip_install(requirements.options + plan.install, False)
+            if retval != SUCCESS:
+                return retval
+
+            # pip may have brought new dependencies or dropped old ones
+            plan = reconcile(requirements, installed_distributions(site_packages))
+
+        if not self.config.prune_extraneous_deps or not plan.extraneous:
+            return SUCCESS
+
+        cmd = self._pip_cmd() + ["uninstall", "--yes"] + plan.extraneous
+        retval = self.cmd(cmd).retval
+        if retval == SUCCESS and self.config.use_package_store:
+            self.store.release(self.project_dir, plan.extraneous)
+
+        return retval
+
+    def _install_requirements(self, dev: bool, update: bool) -> int:
+        # reconciling keeps satisfied distributions, upgrades go through pip
+        if self.config.reconcile_venv_deps and not update:
+            retval = self._reconcile_requirements()
+            if retval is not None:
+                return retval
+
+        return self._pip_install(self._get_requirements_args(dev), update)
 
     def install(self, dev: bool) -> int:
-        self.project_dir.mkdir(parents=True, exist_ok=True)
-        venv.create(str(self.project_dir), with_pip=True)
-        return self.cmd(self._get_requirements_install_cmd(dev, False)).retval
+        self.templates.clone(self.project_dir)
+        self.env_metadata(refresh=True)
+        retval = self._install_requirements(dev, False)
+        if retval == SUCCESS:
+            self._record_sync(dev)
+
+        return retval
 
     def run(self, args: list[str]) -> int:
-        activate_script = self._get_activate_script()
-        activate_cmd = f"source {str(activate_script)} && {' '.join(args)}; deactivate"
-        return self.cmd(["bash", "-c", activate_cmd]).retval
+        environ = self.env_variables()
+        try:
+            return self.cmd(args, env=environ).retval
+        except FileNotFoundError:
+            print(f"pyvem: {args[0]}: command not found", file=sys.stderr)
+            return COMMAND_NOT_FOUND
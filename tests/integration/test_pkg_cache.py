@@ -0,0 +1,193 @@
+import os
+import shutil
+import subprocess
+import threading
+from pathlib import Path
+
+import pytest
+
+from pyvem.containers.pkg_cache import PackageCache
+from pyvem.exceptions import PyVemContainerException
+
+TEST_IMAGE = "fedora:latest"
+
+
+@pytest.fixture
+def local_repo(tmp_path):
+    """
+    Repository on a file:// URL, its metadata is what dnf caches.
+    """
+    repo = tmp_path / "repo"
+    (repo / "repodata").mkdir(parents=True)
+    (repo / "repodata" / "repomd.xml").write_text("<repomd>1</repomd>\n")
+    (repo / "repodata" / "primary.xml.gz").write_bytes(b"packages")
+    return repo
+
+
+def fake_makecache(cache_root: Path, repo: Path) -> bool:
+    """
+    What `dnf makecache` does to the cache of the repository.
+
+    Returns:
+        Whether the metadata were in the cache already.
+    """
+    cached = cache_root / "dnf" / "local" / "repodata"
+    repomd = (repo / "repodata" / "repomd.xml").read_bytes()
+    if (cached / "repomd.xml").exists() and (
+        cached / "repomd.xml"
+    ).read_bytes() == repomd:
+        return True
+
+    shutil.rmtree(cached, ignore_errors=True)
+    shutil.copytree(repo / "repodata", cached)
+    return False
+
+
+def test_builds_run_at_once_and_metadata_are_merged(tmp_path, local_repo):
+    cache = PackageCache(tmp_path / "pyvem")
+    # both builds are in dnf at the same time, fails if one waits for the other
+    both_running = threading.Barrier(2, timeout=10)
+    hits = []
+    errors = []
+
+    def build() -> None:
+        try:
+            with cache.checkout() as cache_root:
+                both_running.wait()
+                hits.append(fake_makecache(cache_root, local_repo))
+                both_running.wait()
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=build) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert hits == [False, False]
+    shared = cache.path / "dnf" / "local" / "repodata"
+    assert (shared / "primary.xml.gz").read_bytes() == b"packages"
+    assert list(cache.checkouts_path.iterdir()) == []
+
+    with cache.checkout() as cache_root:
+        assert fake_makecache(cache_root, local_repo)
+
+
+def test_deleted_files_are_removed_unless_changed_meanwhile(tmp_path, local_repo):
+    cache = PackageCache(tmp_path / "pyvem")
+    with cache.checkout() as cache_root:
+        fake_makecache(cache_root, local_repo)
+
+    shared = cache.path / "dnf" / "local" / "repodata"
+    with cache.checkout() as first, cache.checkout() as second:
+        (first / "dnf" / "local" / "repodata" / "primary.xml.gz").unlink()
+        (first / "dnf" / "local" / "repodata" / "repomd.xml").unlink()
+        (second / "dnf" / "local" / "repodata" / "repomd.xml").write_text("2")
+
+    # the second build merged its repomd.xml before the first one deleted it
+    assert not (shared / "primary.xml.gz").exists()
+    assert (shared / "repomd.xml").read_text() == "2"
+
+
+def test_failed_build_is_not_merged(tmp_path, local_repo):
+    cache = PackageCache(tmp_path / "pyvem")
+    with pytest.raises(RuntimeError):
+        with cache.checkout() as cache_root:
+            fake_makecache(cache_root, local_repo)
+            raise RuntimeError("dnf failed")
+
+    assert not (cache.path / "dnf" / "local").exists()
+    assert list(cache.checkouts_path.iterdir()) == []
+
+
+def test_files_which_cannot_be_merged_are_skipped(tmp_path, local_repo, monkeypatch):
+    cache = PackageCache(tmp_path / "pyvem")
+    replace = os.replace
+
+    def replace_unless_root_owned(src, dst):
+        if Path(src).name == "primary.xml.gz":
+            raise PermissionError(13, "Permission denied", str(src))
+
+        replace(src, dst)
+
+    monkeypatch.setattr(os, "replace", replace_unless_root_owned)
+    with cache.checkout() as cache_root:
+        fake_makecache(cache_root, local_repo)
+
+    shared = cache.path / "dnf" / "local" / "repodata"
+    assert (shared / "repomd.xml").exists()
+    assert not (shared / "primary.xml.gz").exists()
+    assert list(cache.checkouts_path.iterdir()) == []
+
+
+def test_prune_leaves_running_checkouts(tmp_path, local_repo):
+    cache = PackageCache(tmp_path / "pyvem")
+    with cache.checkout() as cache_root:
+        fake_makecache(cache_root, local_repo)
+
+    # left behind by a killed process
+    (cache.checkouts_path / "dead").mkdir()
+    (cache.checkouts_path / "dead.lock").touch()
+    with cache.checkout() as running:
+        assert cache.prune() > 0
+        assert running.exists()
+
+    assert not (cache.path / "dnf").exists()
+    assert list(cache.checkouts_path.iterdir()) == []
+
+
+def _engine_client():
+    from pyvem.containers.client import get_container_client
+
+    try:
+        client = get_container_client()
+        client.images.get(TEST_IMAGE)
+    except PyVemContainerException:
+        pytest.skip("no container engine running")
+    except Exception:
+        pytest.skip(f"image {TEST_IMAGE} is not pulled")
+
+    return client
+
+
+def test_dnf_of_parallel_containers(tmp_path):
+    if shutil.which("createrepo_c") is None:
+        pytest.skip("createrepo_c is not installed")
+
+    from pyvem.containers.handler import ContainerHandler
+
+    client = _engine_client()
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    subprocess.run(["createrepo_c", "--quiet", str(repo)], check=True)
+    cache = PackageCache(tmp_path / "pyvem")
+    errors = []
+
+    def build() -> None:
+        handler = ContainerHandler(TEST_IMAGE, client, package_cache=cache)
+        try:
+            with handler.session(commit=False, print_logs=False) as session:
+                session.put_file(repo, "/srv")
+                session.command(
+                    [
+                        "dnf",
+                        "makecache",
+                        "--repofrompath=local,file:///srv/repo",
+                        "--repo=local",
+                    ]
+                )
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=build) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert cache.size() > 0
@@ -0,0 +1,161 @@
+"""
+Container engine kept in memory, enough of docker's client for the code
+talking to the engine.
+"""
+
+import itertools
+import json
+from typing import Any, Optional, Union
+
+import pytest
+from docker.errors import APIError, ImageNotFound, NotFound
+
+
+class FakeImage:
+    def __init__(
+        self, images: "FakeImages", image_id: str, labels: Optional[dict] = None
+    ) -> None:
+        self.images = images
+        self.id = image_id
+        self.labels = dict(labels or {})
+        self.attrs = {"Size": 100}
+
+    @property
+    def tags(self) -> list[str]:
+        return [
+            name for name, image_id in self.images.tags.items() if image_id == self.id
+        ]
+
+    def tag(self, repository: str, tag: str = "latest") -> None:
+        self.images.tags[f"{repository}:{tag}"] = self.id
+
+
+class FakeImages:
+    def __init__(self) -> None:
+        self.images: dict[str, FakeImage] = {}
+        self.tags: dict[str, str] = {}
+        # images used by containers, the engine keeps them tagged
+        self.used: set[str] = set()
+        self._ids = (f"image{number}" for number in itertools.count())
+
+    def add(
+        self,
+        image_id: Optional[str] = None,
+        name: Optional[str] = None,
+        labels: Optional[dict] = None,
+    ) -> FakeImage:
+        image_id = image_id or next(self._ids)
+        image = self.images.setdefault(image_id, FakeImage(self, image_id, labels))
+        if name is not None:
+            image.tag(*name.split(":"))
+
+        return image
+
+    def get(self, name: str) -> FakeImage:
+        image_id = self.tags.get(name, name)
+        if image_id not in self.images:
+            raise ImageNotFound(name)
+
+        return self.images[image_id]
+
+    def pull(self, repository: str, tag: str = "latest") -> FakeImage:
+        return self.get(f"{repository}:{tag}")
+
+    def list(self, filters: Optional[dict] = None) -> list[FakeImage]:
+        images = list(self.images.values())
+        for label in (filters or {}).get("label", []):
+            key, _, value = label.partition("=")
+            images = [image for image in images if image.labels.get(key) == value]
+
+        return images
+
+    def remove(self, name: str, force: bool = False) -> None:
+        image = self.get(name)
+        if name not in self.tags and len(image.tags) > 1 and not force:
+            raise APIError(f"conflict: image {name} is referenced by many tags")
+
+        names = [name] if name in self.tags else image.tags
+        if image.id in self.used and len(image.tags) == len(names):
+            raise APIError(f"conflict: image {name} is used by a container")
+
+        for tag in names:
+            del self.tags[tag]
+
+        if not image.tags:
+            del self.images[image.id]
+
+
+class FakeContainer:
+    def __init__(
+        self,
+        client: "FakeClient",
+        container_id: str,
+        image: Union[FakeImage, str, None],
+        command: Any,
+        labels: Optional[dict] = None,
+    ) -> None:
+        self.client = client
+        self.id = container_id
+        self.image = image
+        self.command = command
+        self.labels = dict(labels or {})
+        self.status = "created"
+
+    def start(self) -> None:
+        self.status = "running"
+
+    def logs(self, stream: bool = False) -> Any:
+        return iter([b""]) if stream else b""
+
+    def wait(self) -> dict[str, int]:
+        self.status = "exited"
+        return {"StatusCode": 0}
+
+    def commit(
+        self, repository: str, tag: str, changes: tuple[str, ...] = ()
+    ) -> FakeImage:
+        labels = dict(getattr(self.image, "labels", {}))
+        labels.update(self.labels)
+        for change in changes:
+            key, value = change.removeprefix("LABEL ").split("=", 1)
+            labels[key] = json.loads(value)
+
+        return self.client.images.add(name=f"{repository}:{tag}", labels=labels)
+
+    def remove(self, force: bool = False) -> None:
+        del self.client.containers.containers[self.id]
+
+
+class FakeContainers:
+    def __init__(self, client: "FakeClient") -> None:
+        self.client = client
+        self.containers: dict[str, FakeContainer] = {}
+        self._ids = (f"container{number}" for number in itertools.count())
+
+    def create(
+        self,
+        image: Union[FakeImage, str, None] = None,
+        command: Any = None,
+        labels: Optional[dict] = None,
+        **kwargs: Any,
+    ) -> FakeContainer:
+        container = FakeContainer(self.client, next(self._ids), image, command, labels)
+        self.containers[container.id] = container
+        return container
+
+    def get(self, container_id: str) -> FakeContainer:
+        try:
+            return self.containers[container_id]
+        except KeyError:
+            raise NotFound(container_id) from None
+
+
+class FakeClient:
+    def __init__(self) -> None:
+        self.images = FakeImages()
+        self.containers = FakeContainers(self)
+
+
+@pytest.fixture
+def client() -> FakeClient:
+    return FakeClient()
@@ -0,0 +1,25 @@
+import io
+from pathlib import Path
+
+from pyvem.batch import _PrefixedWriter, project_labels
+
+
+def test_project_labels_tell_apart_same_basenames():
+    labels = project_labels([Path("/work/a/app"), Path("/work/b/app")])
+
+    assert labels == {Path("/work/a/app"): "a/app", Path("/work/b/app"): "b/app"}
+
+
+def test_project_labels_single_project_is_its_name():
+    assert project_labels([Path("/work/a/app")]) == {Path("/work/a/app"): "app"}
+
+
+def test_prefixed_writer_writes_whole_lines():
+    stream = io.StringIO()
+    writer = _PrefixedWriter("[a/app] ", stream)
+    writer.write("first\nsec")
+    assert stream.getvalue() == "[a/app] first\n"
+
+    writer.write("ond\nlast")
+    writer.finish()
+    assert stream.getvalue() == "[a/app] first\n[a/app] second\n[a/app] last\n"
@@ -0,0 +1,122 @@
+import pytest
+
+from pyvem.constants import BUILD_CACHE_MAX_AGE, LABEL_STEP
+from pyvem.containers.build_cache import BuildCache, BuildStep, step_cache_key
+from pyvem.containers.handler import IMAGE_STATE, ContainerHandler
+from pyvem.containers.labels import repository_filter
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return BuildCache(tmp_path / "pyvem")
+
+
+def step_of(key: str) -> BuildStep:
+    return BuildStep(key=key, command="dnf install -y gcc", parent_id="parent")
+
+
+def test_step_cache_key(tmp_path):
+    spec = tmp_path / "app.spec"
+    spec.write_text("Name: app\n")
+    key = step_cache_key("app", "parent", ["dnf", "install", "-y", "gcc"], [spec])
+
+    assert key == step_cache_key("app", "parent", "dnf  install -y 'gcc'", [spec])
+    assert key != step_cache_key(
+        "app", "other", ["dnf", "install", "-y", "gcc"], [spec]
+    )
+    assert key != step_cache_key("app", "parent", ["dnf", "install", "-y", "gcc"])
+
+    assert key != step_cache_key(
+        "db", "parent", ["dnf", "install", "-y", "gcc"], [spec]
+    )
+
+    spec.write_text("Name: app\nVersion: 2\n")
+    assert key != step_cache_key(
+        "app", "parent", ["dnf", "install", "-y", "gcc"], [spec]
+    )
+
+
+def test_record_and_find(cache, client):
+    assert cache.find(client, "key") is None
+
+    client.images.add("committed", labels={LABEL_STEP: "key"})
+    cache.record(step_of("key"), "committed", "installed gcc")
+    image, output = cache.find(client, "key")
+    assert image.id == "committed"
+    assert output == "installed gcc"
+
+    stats = cache.stats()
+    assert (stats.entries, stats.hits, stats.misses) == (1, 1, 1)
+    assert stats.hit_rate == 0.5
+
+
+def test_find_by_label_without_index(cache, client):
+    client.images.add("committed", labels={LABEL_STEP: "key"})
+
+    image, output = cache.find(client, "key")
+    assert image.id == "committed"
+    assert output == ""
+    assert cache.stats().entries == 1
+
+
+def test_image_of_other_step_is_not_reused(cache, client):
+    # the id got reused by an image of another step
+    client.images.add("committed", labels={LABEL_STEP: "other"})
+    cache.record(step_of("key"), "committed")
+
+    assert cache.find(client, "key") is None
+    assert cache.stats().entries == 0
+
+
+def test_drop_missing(cache, client):
+    client.images.add("kept", labels={LABEL_STEP: "kept"})
+    cache.record(step_of("kept"), "kept")
+    cache.record(step_of("gone"), "gone")
+
+    assert cache.drop_missing(client) == 1
+    assert cache.stats().entries == 1
+
+
+def test_old_entries_are_pruned(cache):
+    cache.record(step_of("old"), "old")
+    with cache._index() as index:
+        index["entries"]["old"]["last_used"] -= BUILD_CACHE_MAX_AGE + 1
+
+    cache.record(step_of("new"), "new")
+    with cache._index() as index:
+        assert list(index["entries"]) == ["new"]
+
+
+def test_repositories_with_same_steps_get_own_images(cache, client):
+    client.images.add("base", "one:latest")
+    client.images.add("base", "two:latest")
+    images = {}
+    for repository in ("one", "two"):
+        handler = ContainerHandler(f"{repository}:latest", client, build_cache=cache)
+        handler.command(["dnf", "install", "-y", "gcc"], print_logs=False)
+        images[repository] = handler.image
+
+    assert images["one"].id != images["two"].id
+    for repository, image in images.items():
+        assert client.images.list(filters=repository_filter(repository)) == [image]
+
+    # the second build of a repository is served from the cache
+    client.images.get("base").tag("two")
+    handler = ContainerHandler("two:latest", client, build_cache=cache)
+    handler.command(["dnf", "install", "-y", "gcc"], print_logs=False)
+    assert handler.image.id == images["two"].id
+    assert cache.stats().hits == 1
+
+
+def test_tagged_base_image_is_labeled_once(cache, client):
+    client.images.add("base", "fedora:40")
+    tagged = []
+    for _ in range(2):
+        handler = ContainerHandler("fedora:40", client, IMAGE_STATE, build_cache=cache)
+        handler.tag("app", "latest")
+        tagged.append(handler.image)
+
+    assert client.images.list(filters=repository_filter("app")) == [tagged[0]]
+    assert client.images.get("app:latest") == tagged[0] == tagged[1]
+    assert client.images.get("fedora:40").labels == {}
+    assert client.containers.containers == {}
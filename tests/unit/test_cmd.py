@@ -0,0 +1,100 @@
+import asyncio
+import io
+import sys
+
+import pytest
+
+from pyvem.cmd import Cmd, OutputBuffer, OutputStream
+from pyvem.exceptions import PyVemException
+
+
+def test_output_buffer_keeps_everything_under_limit():
+    buffer = OutputBuffer(max_size=10)
+    buffer.append("abc")
+    buffer.append("def")
+
+    assert buffer.getvalue() == "abcdef"
+    assert not buffer.truncated
+
+
+def test_output_buffer_keeps_last_characters():
+    buffer = OutputBuffer(max_size=5)
+    for chunk in ("abc", "def", "ghi"):
+        buffer.append(chunk)
+
+    assert buffer.getvalue() == "efghi"
+    assert buffer.truncated
+
+
+def test_output_buffer_single_chunk_over_limit():
+    buffer = OutputBuffer(max_size=3)
+    buffer.append("abcdef")
+
+    assert buffer.getvalue() == "def"
+    assert buffer.truncated
+
+
+@pytest.mark.parametrize("max_size", [0, -1])
+def test_output_buffer_without_capacity(max_size):
+    buffer = OutputBuffer(max_size=max_size)
+    buffer.append("abc")
+    buffer.append("def")
+
+    assert buffer.getvalue() == ""
+    assert buffer.truncated
+
+
+def test_output_stream_joins_split_characters_and_lines():
+    lines = []
+    stream = OutputStream(None, [lines.append], None, max_size=100)
+    data = "žluťoučký\nkůň".encode()
+    for i in range(len(data)):
+        stream.feed(data[i : i + 1])
+    stream.feed(b"")
+
+    assert lines == ["žluťoučký", "kůň"]
+    assert stream.buffer.getvalue() == "žluťoučký\nkůň"
+
+
+def test_output_stream_spills_everything():
+    spill = io.StringIO()
+    stream = OutputStream(None, [], spill, max_size=2)
+    stream.feed(b"abcdef")
+    stream.feed(b"")
+
+    assert spill.getvalue() == "abcdef"
+    assert stream.buffer.getvalue() == "ef"
+
+
+def test_run_cmd_captures_both_streams(tmp_path):
+    script = "import sys; print('out'); print('err', file=sys.stderr); sys.exit(3)"
+    result = Cmd(tmp_path).run_cmd([sys.executable, "-c", script], tee_to_stdout=False)
+
+    assert result.retval == 3
+    assert result.stdout == "out"
+    assert result.stderr == "err"
+
+
+def test_run_cmd_log_file_has_whole_output(tmp_path):
+    log_file = tmp_path / "logs" / "cmd.log"
+    script = "import sys; sys.stdout.write('x' * 100)"
+    result = Cmd(tmp_path).run_cmd(
+        [sys.executable, "-c", script],
+        tee_to_stdout=False,
+        log_file=log_file,
+        max_captured_output=10,
+    )
+
+    assert result.stdout == "x" * 10
+    assert log_file.read_text().strip() == "x" * 100
+
+
+def test_run_cmd_async_timeout_covers_wait(tmp_path):
+    # closes its pipes right away and keeps running
+    script = "import os, time; os.close(1); os.close(2); time.sleep(30)"
+    with pytest.raises(PyVemException, match="timed out"):
+        asyncio.run(
+            Cmd(tmp_path).run_cmd_async(
+                [sys.executable, "-c", script], tee_to_stdout=False, timeout=0.5
+            )
+        )
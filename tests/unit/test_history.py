@@ -0,0 +1,98 @@
+import pytest
+
+from pyvem.config import Config
+from pyvem.constants import HISTORY_DIR, LABEL_REPOSITORY
+from pyvem.containers import base
+from pyvem.containers.history import ImageHistory
+from pyvem.containers.rpm import RPM
+from pyvem.exceptions import PyVemContainerException
+
+
+@pytest.fixture
+def history(tmp_path):
+    return ImageHistory(tmp_path / "pyvem", "app", keep=2)
+
+
+def commit(client, history: ImageHistory, image_id: str, parent: str):
+    image = client.images.add(image_id, "app:latest")
+    return history.record(image, parent, f"build {image_id}")
+
+
+def test_record_tags_snapshots(client, history):
+    first = commit(client, history, "one", "base")
+    second = commit(client, history, "two", "one")
+
+    assert (first.number, first.tag) == (1, "latest-snapshot-1")
+    assert client.images.tags["app:latest-snapshot-2"] == "two"
+    assert history.snapshots() == [first, second]
+    assert history.get(2) == second
+    with pytest.raises(PyVemContainerException):
+        history.get(3)
+
+
+def test_rollback(client, history):
+    commit(client, history, "one", "base")
+    commit(client, history, "two", "one")
+
+    history.rollback(client, 1)
+    assert history.current(client) == "one"
+
+
+def test_prune_keeps_newest_and_current(client, history):
+    for number, image_id in enumerate(["one", "two", "three", "four"]):
+        commit(client, history, image_id, str(number))
+
+    history.rollback(client, 1)
+    pruned = history.prune(client)
+
+    assert [snapshot.number for snapshot in pruned] == [2]
+    assert [snapshot.number for snapshot in history.snapshots()] == [1, 3, 4]
+    with pytest.raises(PyVemContainerException):
+        history.rollback(client, 2)
+
+
+def test_remove_untags_snapshots_and_removes_index(client, history):
+    commit(client, history, "one", "base")
+    commit(client, history, "two", "one")
+    client.images.remove("app:latest")
+
+    assert history.remove(client) == []
+    assert client.images.tags == {}
+    assert not history.path.exists()
+
+
+def test_remove_keeps_snapshots_used_by_containers(client, history):
+    commit(client, history, "one", "base")
+    commit(client, history, "two", "one")
+    client.images.remove("app:latest")
+    client.images.used.add("one")
+
+    kept = history.remove(client)
+    assert [snapshot.number for snapshot in kept] == [1]
+    assert history.snapshots() == kept
+
+
+def test_distro_remove_of_image_with_snapshots(tmp_path, monkeypatch, client):
+    monkeypatch.setattr(base, "get_container_client", lambda use_podman: client)
+    config = Config.model_construct(path_to_pyvem_dir=tmp_path / "pyvem")
+    image = client.images.add("one", "app:latest", {LABEL_REPOSITORY: "app"})
+    distro = RPM("app:latest", config)
+    distro.history.record(image, "base", "build")
+
+    distro.remove()
+    assert client.images.tags == {}
+    assert not distro.history.path.exists()
+    with pytest.raises(PyVemContainerException):
+        RPM("app:latest", config).remove()
+
+
+def test_index_names_of_repositories_differ(tmp_path):
+    pyvem_dir = tmp_path / "pyvem"
+    paths = {
+        ImageHistory(pyvem_dir, "a_b", "c").path,
+        ImageHistory(pyvem_dir, "a", "b_c").path,
+        ImageHistory(pyvem_dir, "registry/a", "b").path,
+    }
+
+    assert len(paths) == 3
+    assert all(path.parent == pyvem_dir / HISTORY_DIR for path in paths)
@@ -0,0 +1,115 @@
+import json
+import os
+from pathlib import Path
+from typing import Optional
+
+from pyvem.inventory import (
+    InventoryCache,
+    freeze_lines,
+    installed_distributions,
+    read_distribution,
+)
+
+
+def make_dist_info(
+    site_packages: Path,
+    name: str,
+    version: str,
+    requires: tuple[str, ...] = (),
+    direct_url: Optional[dict] = None,
+) -> Path:
+    dist_info = site_packages / f"{name.replace('-', '_')}-{version}.dist-info"
+    dist_info.mkdir(parents=True)
+    headers = [f"Name: {name}", f"Version: {version}"]
+    headers += [f"Requires-Dist: {requirement}" for requirement in requires]
+    (dist_info / "METADATA").write_text(
+        "\n".join(headers) + "\n\nDescription: not a header\n"
+    )
+    if direct_url is not None:
+        (dist_info / "direct_url.json").write_text(json.dumps(direct_url))
+
+    return dist_info
+
+
+def test_read_dist_info(tmp_path):
+    dist_info = make_dist_info(
+        tmp_path, "Demo-Pkg", "1.0", ("requests>=2", "pytest ; extra == 'dev'")
+    )
+
+    distribution = read_distribution(dist_info)
+    assert distribution is not None
+    assert distribution.canonical_name == "demo-pkg"
+    assert distribution.version == "1.0"
+    assert [str(requirement) for requirement in distribution.requires] == [
+        "requests>=2",
+        'pytest; extra == "dev"',
+    ]
+
+
+def test_read_egg_info_sections_become_markers(tmp_path):
+    egg_info = tmp_path / "legacy-2.0.egg-info"
+    egg_info.mkdir()
+    (egg_info / "PKG-INFO").write_text("Name: legacy\nVersion: 2.0\n")
+    (egg_info / "requires.txt").write_text(
+        "six\n\n[test]\npytest\n\n[:python_version < '3.9']\nzipp\n"
+    )
+
+    distribution = read_distribution(egg_info)
+    assert distribution is not None
+    assert [str(requirement) for requirement in distribution.requires] == [
+        "six",
+        'pytest; extra == "test"',
+        'zipp; python_version < "3.9"',
+    ]
+
+
+def test_broken_metadata_is_skipped(tmp_path):
+    (tmp_path / "broken-1.0.dist-info").mkdir()
+    make_dist_info(tmp_path, "good", "1.0")
+
+    assert list(installed_distributions(tmp_path)) == ["good"]
+
+
+def test_freeze_lines(tmp_path):
+    make_dist_info(tmp_path, "pip", "24.0")
+    make_dist_info(tmp_path, "plain", "1.0")
+    make_dist_info(
+        tmp_path,
+        "editable",
+        "0.1",
+        direct_url={"url": "file:///src/editable", "dir_info": {"editable": True}},
+    )
+    make_dist_info(
+        tmp_path,
+        "vcs",
+        "0.2",
+        direct_url={
+            "url": "https://example.com/vcs.git",
+            "vcs_info": {"vcs": "git", "commit_id": "abc"},
+        },
+    )
+    distributions = sorted(
+        installed_distributions(tmp_path).values(), key=lambda d: d.name
+    )
+
+    assert freeze_lines(distributions) == [
+        "-e file:///src/editable",
+        "plain==1.0",
+        "vcs @ git+https://example.com/vcs.git@abc",
+    ]
+    assert "pip==24.0" in freeze_lines(distributions, include_all=True)
+
+
+def test_inventory_cache_is_invalidated_by_installs(tmp_path):
+    site_packages = tmp_path / "site-packages"
+    make_dist_info(site_packages, "first", "1.0")
+    cache = InventoryCache(tmp_path / "pyvem")
+
+    assert list(cache.get(site_packages)) == ["first"]
+    # served from the cache file now
+    assert list(cache.get(site_packages)) == ["first"]
+
+    make_dist_info(site_packages, "second", "1.0")
+    stat = site_packages.stat()
+    os.utime(site_packages, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert sorted(cache.get(site_packages)) == ["first", "second"]
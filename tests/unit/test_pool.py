@@ -0,0 +1,144 @@
+import os
+import threading
+
+import pytest
+
+from pyvem.constants import LABEL_ROLE, POOL_MAX_USES, SESSION_COMMAND
+from pyvem.containers.pool import ContainerPool
+from pyvem.spells import locked_json
+
+
+class FakeHandler:
+    _repository_name = "app"
+    _tag_name = "latest"
+
+    def __init__(self, client) -> None:
+        self._client = client
+        self.image_id = "image"
+
+    def create_container(self, command, role):
+        return self._client.containers.create(
+            self.image_id, command, labels={LABEL_ROLE: role}
+        )
+
+
+@pytest.fixture
+def handler(client):
+    return FakeHandler(client)
+
+
+def make_pool(handler, tmp_path, **kwargs) -> ContainerPool:
+    options = {"size": 2, "max_uses": POOL_MAX_USES, "idle_timeout": 60}
+    options.update(kwargs)
+    return ContainerPool(handler, tmp_path / "pyvem", **options)
+
+
+def running(handler) -> list[str]:
+    return sorted(handler._client.containers.containers)
+
+
+def test_containers_run_until_removed(handler, tmp_path):
+    pool = make_pool(handler, tmp_path)
+    pool.fill()
+
+    commands = [c.command for c in handler._client.containers.containers.values()]
+    assert commands == [SESSION_COMMAND, SESSION_COMMAND]
+
+
+def test_lease_fills_pool_while_command_runs(handler, tmp_path):
+    pool = make_pool(handler, tmp_path)
+
+    with pool.lease() as first:
+        assert [pooled.leased_by for pooled in pool.containers()].count(
+            os.getpid()
+        ) == 1
+
+    # the leased container returns, one more keeps the pool full
+    assert len(pool.containers()) == 2
+    assert first.id in running(handler)
+
+    with pool.lease() as second:
+        pass
+
+    assert second.id == first.id
+    assert len(running(handler)) == 2
+
+
+def test_lease_refills_containers_which_do_not_return(handler, tmp_path):
+    pool = make_pool(handler, tmp_path, max_uses=1)
+
+    with pool.lease() as container:
+        pass
+
+    assert container.id not in running(handler)
+    assert len(pool.containers()) == 2
+
+    with pool.lease(refill=False):
+        pass
+
+    assert len(pool.containers()) == 1
+
+
+def test_reused_up_to_max_uses(handler, tmp_path):
+    pool = make_pool(handler, tmp_path, size=1, max_uses=2)
+    ids = []
+    for _ in range(3):
+        with pool.lease(refill=False) as container:
+            ids.append(container.id)
+
+    assert ids[0] == ids[1] != ids[2]
+
+
+def test_failed_use_and_image_change_recycle(handler, tmp_path):
+    pool = make_pool(handler, tmp_path, size=1, max_uses=10)
+    with pytest.raises(RuntimeError):
+        with pool.lease(refill=False) as container:
+            raise RuntimeError("command failed")
+
+    assert running(handler) == []
+
+    with pool.lease(refill=False) as container:
+        pass
+
+    handler.image_id = "committed"
+    with pool.lease(refill=False) as other:
+        pass
+
+    assert container.id != other.id
+    assert container.id not in running(handler)
+
+
+def test_idle_containers_expire(handler, tmp_path):
+    pool = make_pool(handler, tmp_path, max_uses=10)
+    pool.fill()
+    old = running(handler)
+    with locked_json(pool.path) as index:
+        for data in index["containers"]:
+            data["last_used"] -= 61
+
+    with pool.lease(refill=False) as container:
+        assert container.id not in old
+
+    assert running(handler) == [container.id]
+
+
+def test_fill_does_not_overfill_when_run_at_once(handler, tmp_path):
+    pools = [make_pool(handler, tmp_path) for _ in range(4)]
+    threads = [threading.Thread(target=pool.fill) for pool in pools]
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    assert len(pools[0].containers()) == 2
+    assert len(running(handler)) == 2
+
+
+def test_drain(handler, tmp_path):
+    pool = make_pool(handler, tmp_path)
+    pool.fill()
+
+    assert pool.drain() == 2
+    assert running(handler) == []
+    assert pool.containers() == []
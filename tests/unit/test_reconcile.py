@@ -0,0 +1,94 @@
+from pathlib import Path
+
+from packaging.requirements import Requirement
+
+from pyvem.inventory import InstalledDistribution
+from pyvem.reconcile import read_requirements_file, reconcile
+
+
+def installed(*distributions: tuple[str, str, tuple[str, ...]]):
+    return {
+        name: InstalledDistribution(
+            name=name,
+            version=version,
+            dist_info=Path(f"/site-packages/{name}-{version}.dist-info"),
+            requires=[Requirement(requirement) for requirement in requires],
+        )
+        for name, version, requires in distributions
+    }
+
+
+def test_read_requirements_file_follows_includes(tmp_path):
+    (tmp_path / "base.txt").write_text("requests>=2  # http\n")
+    (tmp_path / "constraints.txt").write_text("urllib3<3\n")
+    requirements_file = tmp_path / "requirements.txt"
+    requirements_file.write_text(
+        "-r base.txt\n"
+        "-c constraints.txt\n"
+        "--index-url https://pypi.example.com/simple\n"
+        "click \\\n"
+        "  >=8\n"
+    )
+
+    result = read_requirements_file(requirements_file)
+    assert result is not None
+    assert [str(requirement) for requirement in result.requirements] == [
+        "requests>=2",
+        "click>=8",
+    ]
+    assert result.options == [
+        "-c",
+        str(tmp_path / "constraints.txt"),
+        "--index-url",
+        "https://pypi.example.com/simple",
+    ]
+
+
+def test_read_requirements_file_leaves_pip_only_lines_to_pip(tmp_path):
+    for line in ("-e .", "./local", "pkg @ https://x/pkg.whl", "pkg==${VERSION}"):
+        requirements_file = tmp_path / "requirements.txt"
+        requirements_file.write_text(f"click\n{line}\n")
+
+        assert read_requirements_file(requirements_file) is None
+
+
+def test_reconcile_installs_only_unsatisfied(tmp_path):
+    requirements_file = tmp_path / "requirements.txt"
+    requirements_file.write_text("click>=8\nrequests>=2\nrich\n")
+    requirements = read_requirements_file(requirements_file)
+    assert requirements is not None
+
+    plan = reconcile(
+        requirements,
+        installed(
+            ("click", "8.1.0", ()),
+            ("requests", "1.0", ()),
+            ("old-tool", "0.1", ()),
+            ("pip", "24.0", ()),
+        ),
+    )
+    assert plan.install == ["rich", "requests>=2"]
+    assert plan.extraneous == ["old-tool"]
+
+
+def test_reconcile_follows_dependencies_and_extras(tmp_path):
+    requirements_file = tmp_path / "requirements.txt"
+    requirements_file.write_text("app[cli]\n")
+    requirements = read_requirements_file(requirements_file)
+    assert requirements is not None
+
+    plan = reconcile(
+        requirements,
+        installed(
+            (
+                "app",
+                "1.0",
+                ("idna>=3", "click>=8 ; extra == 'cli'", "pytest ; extra == 'dev'"),
+            ),
+            ("idna", "2.0", ()),
+            ("click", "8.0", ()),
+            ("pytest", "8.0", ()),
+        ),
+    )
+    assert plan.install == ["idna>=3"]
+    assert plan.extraneous == ["pytest"]
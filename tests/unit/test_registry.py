@@ -0,0 +1,108 @@
+import os
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from pyvem.constants import VenvEnum
+from pyvem.registry import _MIGRATIONS, ProjectRecord, ProjectRegistry, file_stamp
+
+
+@pytest.fixture
+def registry(tmp_path):
+    registry = ProjectRegistry(tmp_path / "pyvem")
+    yield registry
+    registry.close()
+
+
+@pytest.fixture
+def project(tmp_path):
+    project = tmp_path / "projects" / "app"
+    project.mkdir(parents=True)
+    (project / "pyproject.toml").write_text("[project]\nname = 'app'\n")
+    return project
+
+
+def record_of(project: Path, ve_name: str = "app") -> ProjectRecord:
+    return ProjectRecord(
+        project_path=project,
+        venv_type=VenvEnum.poetry,
+        ve_name=ve_name,
+        env_path=Path("/envs/app"),
+        interpreter=Path("/envs/app/bin/python"),
+        python_version="3.11.4",
+    )
+
+
+def test_save_and_get_round_trip(registry, project):
+    registry.save(record_of(project))
+
+    record = registry.get(project)
+    assert record is not None
+    assert record.venv_type == VenvEnum.poetry
+    assert record.interpreter == Path("/envs/app/bin/python")
+    assert record.python_version == "3.11.4"
+    assert record.last_used > 0
+
+
+def test_record_goes_stale_when_manifest_changes(registry, project):
+    registry.save(record_of(project))
+    manifest = project / "pyproject.toml"
+    stat = manifest.stat()
+    os.utime(manifest, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    assert registry.get(project) is None
+    assert registry.get(project, fresh=False) is not None
+
+
+def test_record_goes_stale_when_manifest_appears(registry, project):
+    registry.save(record_of(project))
+    (project / "Pipfile").write_text("")
+
+    assert registry.get(project) is None
+
+
+def test_remove(registry, project):
+    registry.save(record_of(project))
+    registry.remove(project)
+
+    assert registry.get(project, fresh=False) is None
+    assert registry.all() == []
+
+
+def test_allocate_ve_name_of_same_basenames(registry, project, tmp_path):
+    assert registry.allocate_ve_name(project) == "app"
+    registry.save(record_of(project))
+    assert registry.allocate_ve_name(project) == "app"
+
+    other = tmp_path / "other" / "app"
+    other.mkdir(parents=True)
+    name = registry.allocate_ve_name(other)
+    assert name.startswith("app-")
+    assert name == registry.allocate_ve_name(other)
+
+
+def test_migrates_older_schema(tmp_path, project):
+    pyvem_dir = tmp_path / "pyvem"
+    pyvem_dir.mkdir()
+    registry = ProjectRegistry(pyvem_dir)
+    connection = sqlite3.connect(registry.path)
+    connection.execute(_MIGRATIONS[0])
+    connection.execute("PRAGMA user_version = 1")
+    connection.commit()
+    connection.close()
+
+    registry.save(record_of(project))
+    version = registry.connection.execute("PRAGMA user_version").fetchone()[0]
+    assert version == len(_MIGRATIONS)
+    registry.close()
+
+
+def test_file_stamp_changes_with_content(tmp_path):
+    path = tmp_path / "file"
+    assert file_stamp(path) is None
+
+    path.write_text("a")
+    stamp = file_stamp(path)
+    path.write_text("ab")
+    assert file_stamp(path) != stamp
@@ -0,0 +1,138 @@
+import stat
+import threading
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from pyvem.store import PackageStore, ResolvedDistribution, _make_read_only
+
+HASH = "a" * 64
+
+
+@pytest.fixture
+def env_path(tmp_path):
+    env = tmp_path / "env"
+    (env / "lib" / "python3.11" / "site-packages").mkdir(parents=True)
+    (env / "bin").mkdir()
+    return env
+
+
+def site_packages(env: Path) -> Path:
+    return env / "lib" / "python3.11" / "site-packages"
+
+
+def make_object(store: PackageStore, object_hash: str = HASH) -> Path:
+    """
+    Unpacked wheel of `demo 1.0` in the store, as `_fetch` leaves it.
+    """
+    obj = store.objects_dir / object_hash
+    (obj / "demo").mkdir(parents=True)
+    (obj / "demo" / "__init__.py").write_text("VALUE = 1\n")
+    dist_info = obj / "demo-1.0.dist-info"
+    dist_info.mkdir()
+    (dist_info / "METADATA").write_text("Name: demo\nVersion: 1.0\n")
+    (dist_info / "RECORD").write_text("")
+    (dist_info / "entry_points.txt").write_text(
+        "[console_scripts]\ndemo = demo.cli:main\n"
+    )
+    _make_read_only(obj)
+    with store.connection:
+        store.connection.execute(
+            "INSERT OR IGNORE INTO objects VALUES (?, ?, ?)",
+            (object_hash, "demo", "1.0"),
+        )
+
+    return obj
+
+
+def install(store: PackageStore, env: Path) -> int:
+    resolved = [ResolvedDistribution("demo", "1.0", HASH, "demo", "https://x/demo")]
+    with mock.patch.object(store, "resolve", return_value=resolved):
+        return store.install(env, ["pip"], ["demo"])
+
+
+def test_install_links_object_with_record_and_scripts(tmp_path, env_path):
+    store = PackageStore(tmp_path)
+    make_object(store)
+
+    assert install(store, env_path) == 0
+
+    installed = site_packages(env_path) / "demo" / "__init__.py"
+    assert installed.read_text() == "VALUE = 1\n"
+    record = (site_packages(env_path) / "demo-1.0.dist-info" / "RECORD").read_text()
+    assert "demo/__init__.py" in record
+    assert "../../../bin/demo" in record
+    assert "from demo.cli import main" in (env_path / "bin" / "demo").read_text()
+
+
+def test_environment_files_are_own_writable_copies(tmp_path, env_path):
+    store = PackageStore(tmp_path)
+    obj = make_object(store)
+    install(store, env_path)
+
+    installed = site_packages(env_path) / "demo" / "__init__.py"
+    installed.write_text("VALUE = 2\n")
+
+    assert (obj / "demo" / "__init__.py").read_text() == "VALUE = 1\n"
+
+
+def test_hardlinked_files_are_read_only(tmp_path, env_path):
+    store = PackageStore(tmp_path, hardlinks=True)
+    obj = make_object(store)
+    install(store, env_path)
+
+    installed = site_packages(env_path) / "demo" / "__init__.py"
+    stored = obj / "demo" / "__init__.py"
+    if installed.stat().st_ino != stored.stat().st_ino:
+        pytest.skip("filesystem supports reflinks, nothing was hardlinked")
+
+    assert not installed.stat().st_mode & stat.S_IWUSR
+
+
+def test_release_prunes_unused_objects(tmp_path, env_path):
+    store = PackageStore(tmp_path)
+    obj = make_object(store)
+    install(store, env_path)
+    other_env = tmp_path / "other"
+    (other_env / "lib" / "python3.11" / "site-packages").mkdir(parents=True)
+    (other_env / "bin").mkdir()
+    install(store, other_env)
+
+    store.release(env_path)
+    assert obj.exists()
+
+    store.release(other_env, ["Demo"])
+    assert not obj.exists()
+
+
+def test_prune_waits_for_installs(tmp_path):
+    store = PackageStore(tmp_path)
+    obj = make_object(store)
+    pruned = []
+
+    def prune_in_other_process():
+        other = PackageStore(tmp_path)
+        pruned.extend(other.prune())
+        other.close()
+
+    with store.lock():
+        thread = threading.Thread(target=prune_in_other_process)
+        thread.start()
+        thread.join(timeout=0.5)
+        # object fetched but not referenced yet
+        assert thread.is_alive()
+        assert obj.exists()
+
+    thread.join()
+    assert pruned == [HASH]
+    assert not obj.exists()
+
+
+def test_make_read_only(tmp_path):
+    (tmp_path / "dir").mkdir()
+    file = tmp_path / "dir" / "file"
+    file.write_text("x")
+    _make_read_only(tmp_path)
+
+    assert not file.stat().st_mode & (stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH)
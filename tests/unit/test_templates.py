@@ -0,0 +1,17 @@
+from pyvem.templates import VenvTemplates
+
+
+def test_clone_does_not_share_files_with_template(tmp_path):
+    templates = VenvTemplates(tmp_path / "pyvem", with_pip=False)
+    target = tmp_path / "env"
+    templates.clone(target)
+
+    template = templates.get()
+    assert str(target).encode() in (target / "pyvenv.cfg").read_bytes()
+    assert str(target).encode() not in (template / "pyvenv.cfg").read_bytes()
+
+    # written in place, as by tools installing into the environment
+    with open(target / "bin" / "Activate.ps1", "r+b") as script:
+        script.write(b"changed")
+
+    assert not (template / "bin" / "Activate.ps1").read_bytes().startswith(b"changed")
@@ -0,0 +1,50 @@
+import sys
+
+import pytest
+
+from pyvem.config import Config
+from pyvem.constants import COMMAND_NOT_FOUND
+from pyvem.exceptions import PyVemException
+from pyvem.ve_tools.venv import Venv
+
+
+@pytest.fixture
+def venv(tmp_path):
+    project = tmp_path / "app"
+    project.mkdir()
+    config = Config.model_construct(path_to_pyvem_dir=tmp_path / "pyvem")
+    venv = Venv(config=config, project_path=project)
+    yield venv
+    venv.registry.close()
+
+
+def test_run_without_environment(venv):
+    with pytest.raises(PyVemException, match="not installed"):
+        venv.run(["ls"])
+
+    with pytest.raises(PyVemException, match="not installed"):
+        venv.exec_in_env(["ls"])
+
+
+def test_run_missing_command(venv, capsys):
+    bin_dir = venv.project_dir / "bin"
+    bin_dir.mkdir(parents=True)
+    (bin_dir / "python3").symlink_to(sys.executable)
+
+    assert venv.run(["no-such-command-of-pyvem"]) == COMMAND_NOT_FOUND
+    assert "command not found" in capsys.readouterr().err
+
+
+def test_update_upgrades_despite_reconciling(venv, monkeypatch):
+    venv.config = Config.model_construct(
+        path_to_pyvem_dir=venv.pyvem_dir, reconcile_venv_deps=True
+    )
+    (venv.cwd / "requirements.txt").write_text("click\n")
+    calls = []
+    monkeypatch.setattr(venv, "_reconcile_requirements", lambda: calls.append("r"))
+    monkeypatch.setattr(
+        venv, "_pip_install", lambda args, update: calls.append(("pip", update))
+    )
+
+    venv._update_deps(dev=False)
+    assert calls == [("pip", True)]